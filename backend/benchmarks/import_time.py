@@ -0,0 +1,88 @@
+"""后端冷启动基准：导入耗时分析和首个请求的响应时间
+
+在 backend 目录下运行：
+    python benchmarks/import_time.py [--top 20] [--json]
+
+在独立的子进程中（不受当前进程已导入模块的影响）：
+1. 用 python -X importtime 导入 main，按累计耗时列出最慢的模块（顶层及其直接导入的模块）
+2. 测量导入 main、创建应用到第一个请求（不访问数据库和上游服务的 /metrics/upstream）返回的总时间
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FIRST_REQUEST_SCRIPT = """
+import json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+response = main.app.test_client().get('/metrics/upstream')
+finished = time.perf_counter()
+print(json.dumps({
+    "import_seconds": imported - started,
+    "first_request_seconds": finished - imported,
+    "status": response.status_code,
+}))
+"""
+
+
+def profile_imports(top: int):
+    """返回 (导入 main 的累计耗时（秒）, 最慢的模块列表)"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'],
+                            cwd=BACKEND_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    modules = []
+    for line in result.stderr.splitlines():
+        # 格式: "import time:  self [us] | cumulative | imported package"，包名前的缩进表示嵌套层级
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        # 只统计顶层和被顶层直接导入的模块（例如 main 导入的 flask、controller）
+        if depth > 1:
+            continue
+        modules.append({"module": name.strip(), "depth": depth,
+                        "self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000})
+
+    total = next((m["cumulative_ms"] for m in modules if m["module"] == 'main'), 0) / 1000
+    return total, sorted(modules, key=lambda m: m["cumulative_ms"], reverse=True)[:top]
+
+
+def measure_first_request():
+    result = subprocess.run([sys.executable, '-c', FIRST_REQUEST_SCRIPT],
+                            cwd=BACKEND_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='后端冷启动基准')
+    parser.add_argument('--top', type=int, default=20, help='列出最慢的模块数')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出')
+    args = parser.parse_args()
+
+    total, modules = profile_imports(args.top)
+    first_request = measure_first_request()
+
+    if args.json:
+        print(json.dumps({"import_main_seconds": total, "modules": modules, **first_request},
+                         ensure_ascii=False, indent=2))
+        return
+
+    print(f"导入 main: {total:.3f}s（-X importtime）")
+    print(f"{'累计(ms)':>10} {'自身(ms)':>10}  模块")
+    for module in modules:
+        print(f"{module['cumulative_ms']:>10.1f} {module['self_ms']:>10.1f}  {'  ' * module['depth']}{module['module']}")
+    print(f"\n导入 main: {first_request['import_seconds']:.3f}s，"
+          f"首个请求: {first_request['first_request_seconds']:.3f}s（HTTP {first_request['status']}）")
+
+
+if __name__ == '__main__':
+    main()
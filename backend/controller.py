@@ -1,159 +1,523 @@
 from service import generate_module
+from service import summary_module
+from service import emotion_module
+from service import progress_module
+from service import rate_limiter
+from service import resilience
+from service import prompt_registry
+from service import token_usage
+from service import model_router
+from service import prefetch
+from service import turn_stream
+from service import idempotency
+from service import turn_lock
+from service import shared_cache
+from service import session_view
+from service import event_bus
+import hashlib
 import sys
 import time
 from repository.service import chat_service
-from repository.models import ChatQADubious
+from repository import export
+from repository import draft_history
 from repository.dao_impl import ChatQADubiousDAO, ChatQADAO, ChatSessionDAO
+from types import SimpleNamespace
 from typing import Dict, Any
 
+# 共享缓存中的会话历史快照保留的问答字段（构建对话上下文所需）
+HISTORY_FIELDS = ('id', 'aim', 'question', 'answer', 'emotion', 'progress')
+
 class ConversationController:
 
-    def get_all_conversations(self) -> Dict[int, Any]:
+    def get_all_conversations(self, session_ids=None) -> Dict[int, Any]:
         """
         获取所有会话
+        :param session_ids: 只返回指定的会话（用于变更列表）
         :return: 包含所有会话的字典，键为会话ID，值为会话详情（包含qas和dubious列表）
         """
         sessions = chat_service.get_all_sessions()
         result = {}
         
         for session_id, session in sessions.items():
-            # 直接使用session对象，但需要手动序列化关联数据
-            qas_data = []
-            
-            # 获取该会话的所有QA记录
-            qa_list = chat_service.qa_dao.get_by_session_id(session_id)
-            
-            for qa in qa_list:
-                # 获取该QA的所有dubious记录
-                dubious_list = chat_service.dubious_dao.get_by_qa_id(qa.id)
-                dubious_data = [
-                    {
-                        "id": dubious.id,
-                        "snippet": dubious.snippet
-                    }
-                    for dubious in dubious_list
-                ]
-                
-                qa_item = {
-                    "id": qa.id,
-                    "question": qa.question,
-                    "answer": qa.answer,
-                    "aim": qa.aim,
-                    "emotion": qa.emotion,
-                    "progress": qa.progress,
-                    "created_at": qa.created_at.isoformat() if qa.created_at else None,
-                    "updated_at": qa.updated_at.isoformat() if qa.updated_at else None,
-                    "dubious": dubious_data
+            if session_ids is not None and session_id not in session_ids:
+                continue
+            result[session_id] = self._serialize_session(session)
+
+        return result
+
+
+    def get_conversation(self, session_id):
+        """获取单个会话详情，格式与 get_all_conversations 的值相同；会话不存在时返回None"""
+        session = chat_service.session_dao.get_by_id(session_id)
+        if not session:
+            return None
+        return self._serialize_session(session)
+
+
+    def get_all_conversations_json(self, versions):
+        """
+        versions 中各会话的 JSON（由各会话的物化视图拼接，格式与 get_all_conversations 相同）
+        :param versions: get_session_versions 的结果
+        :return: UTF-8 编码的 JSON 字节
+        """
+        return session_view.views.render_collection(
+            versions, lambda session_ids: self.get_all_conversations(session_ids=set(session_ids))
+        )
+
+
+    def get_conversation_json(self, session_id, version):
+        """单个会话的 JSON（物化视图）；会话不存在时返回None"""
+        return session_view.views.get(session_id, version, lambda: self.get_conversation(session_id))
+
+
+    def _refresh_session_view(self, session_id):
+        """重建会话视图，返回会话当前的版本信息（失败时返回None）"""
+        try:
+            versions = chat_service.get_session_versions(session_id=session_id)
+            view = self.get_conversation(session_id)
+            if versions and view is not None:
+                session_view.views.store(session_id, versions[session_id]['version'], view)
+            return versions.get(session_id)
+        except Exception as e:
+            print(f"重建会话视图失败（会话 {session_id}）: {e}")
+            return None
+
+
+    def _publish_session_change(self, event_type, session_id, is_finished=False):
+        """重建会话视图并向 /updates 的订阅者推送会话变更"""
+        item = self._refresh_session_view(session_id) or {}
+        updated_at = item.get('updated_at')
+        event_bus.publish(
+            event_type,
+            session_id=session_id,
+            version=item.get('version'),
+            updated_at=updated_at.isoformat() if hasattr(updated_at, 'isoformat') else updated_at,
+            is_finished=is_finished,
+        )
+
+
+    def subscribe_updates(self, last_event_id=None):
+        """
+        订阅会话变更事件，last_event_id 为客户端最后收到的事件 id（重连时补发之后的事件）
+        :raises event_bus.TooManySubscribers: 本进程的订阅者数已达上限
+        """
+        return event_bus.bus.subscribe(last_event_id)
+
+
+    def restore_session(self, session_id):
+        """将已归档的会话恢复到热表；会话不存在或未归档时返回False"""
+        if not chat_service.restore_session(session_id):
+            return False
+        self._publish_session_change(event_bus.SESSION_UPDATED, session_id, True)
+        return True
+
+
+    def get_archive_stats(self):
+        """归档的会话数和压缩前后的大小"""
+        return chat_service.get_archive_stats()
+
+
+    def save_draft(self, session_id, draft, source=draft_history.SOURCE_EDITED, token_summary=None):
+        """
+        保存编辑后的草稿为新版本
+        :param token_summary: 生成草稿的 token 用量，计入会话累计用量
+        :return: 版本号；会话不存在时返回None
+        """
+        with turn_lock.session_turn(session_id):
+            version = chat_service.save_draft(session_id, draft, source, token_summary)
+        if version is not None:
+            self._publish_session_change(event_bus.SESSION_UPDATED, session_id, True)
+        return version
+
+
+    def regenerate_draft(self, session_id):
+        """
+        根据完整的采访记录重新生成草稿并保存为新版本
+        :return: (版本号, 草稿)；会话不存在或没有已回答的问答时返回None
+        """
+        chat_session = chat_service.session_dao.get_by_id(session_id)
+        if not chat_session:
+            return None
+        qas, _ = chat_service.get_session_content(chat_session)
+        answered = [qa for qa in qas if qa.answer]
+        if not answered:
+            return None
+        # 与最后一轮生成草稿时的上下文相同：之前的问答 + 最后一个问题及其回答
+        context = self._format_history(answered[:-1], answered[-1]) + f"{answered[-1].answer}\n"
+        # 重新生成的用量计入会话累计用量和预算
+        budget_level = token_usage.budget_level(
+            (chat_session.prompt_tokens or 0) + (chat_session.completion_tokens or 0)
+        )
+        with rate_limiter.session_scope(session_id), token_usage.track(budget_level) as usage:
+            draft = summary_module.summary(context)
+        version = self.save_draft(session_id, draft, source=draft_history.SOURCE_REGENERATED,
+                                  token_summary=token_usage.summarize(usage))
+        return version, draft
+
+
+    def get_draft_versions(self, session_id):
+        """会话的草稿版本列表"""
+        return [
+            {**item, "created_at": item["created_at"].isoformat() if item["created_at"] else None}
+            for item in chat_service.get_draft_versions(session_id)
+        ]
+
+
+    def get_draft(self, session_id, version):
+        """指定版本的草稿，版本不存在时返回None"""
+        return chat_service.get_draft(session_id, version)
+
+
+    def diff_drafts(self, session_id, from_version, to_version, context=None):
+        """两个草稿版本的逐行对照，任一版本不存在时返回None"""
+        return chat_service.diff_drafts(session_id, from_version, to_version, context)
+
+
+    def get_session_versions(self, since=None, session_id=None):
+        """会话版本号（任一轮提交都会改变），用于 ETag 和变更列表"""
+        return chat_service.get_session_versions(since=since, session_id=session_id)
+
+
+    def make_etag(self, versions):
+        """由一组会话的版本号计算 ETag：会话集合和各会话版本都不变时 ETag 不变"""
+        if len(versions) == 1:
+            session_id, item = next(iter(versions.items()))
+            return f"{session_id}-{item['version']}"
+        signature = ';'.join(f"{session_id}:{item['version']}" for session_id, item in sorted(versions.items()))
+        return hashlib.md5(signature.encode('utf-8')).hexdigest()
+
+
+    def _serialize_session(self, session):
+        """会话及其问答、可疑语句序列化为字典"""
+        # 直接使用session对象，但需要手动序列化关联数据
+        qas_data = []
+        
+        # 获取该会话的所有QA记录及其dubious记录（已归档的会话从归档中读取）
+        qa_list, draft = chat_service.get_session_content(session)
+        
+        for qa in qa_list:
+            dubious_list = qa.dubious_records
+            dubious_data = [
+                {
+                    "id": dubious.id,
+                    "snippet": dubious.snippet
                 }
-                qas_data.append(qa_item)
+                for dubious in dubious_list
+            ]
             
-            result[session_id] = {
-                "id": session.id,
-                "created_at": session.created_at.isoformat() if session.created_at else None,
-                "updated_at": session.updated_at.isoformat() if session.updated_at else None,
-                "is_finished": session.is_finished,
-                "draft": session.draft,
-                "qas": qas_data
+            qa_item = {
+                "id": qa.id,
+                "question": qa.question,
+                "answer": qa.answer,
+                "aim": qa.aim,
+                "emotion": qa.emotion,
+                "progress": qa.progress,
+                "prompt_version": qa.prompt_version,
+                "created_at": qa.created_at.isoformat() if qa.created_at else None,
+                "updated_at": qa.updated_at.isoformat() if qa.updated_at else None,
+                "dubious": dubious_data
             }
+            qas_data.append(qa_item)
+        
+        return {
+            "id": session.id,
+            "created_at": session.created_at.isoformat() if session.created_at else None,
+            "updated_at": session.updated_at.isoformat() if session.updated_at else None,
+            "is_finished": session.is_finished,
+            "draft": draft,
+            "qas": qas_data
+        }
 
-        return result
 
+    def get_stuck_sessions(self, chapter, below, include_finished=False):
+        """获取指定章节完成度低于阈值的会话列表"""
+        records = chat_service.get_stuck_sessions(chapter, below, include_finished)
+        for record in records:
+            record['updated_at'] = record['updated_at'].isoformat() if record['updated_at'] else None
+        return records
 
-    def get_conversation_history(self, session_id):
-        """获取指定会话的完整对话历史"""
-        full_session_data = chat_service.get_session_with_qas(session_id)
-        if not full_session_data or 'chat_qas' not in full_session_data:
-            return "", None
+
+    def get_progress_overview(self, include_finished=False):
+        """按章节汇总完成度分布"""
+        return chat_service.get_progress_overview(include_finished)
+
+
+    def search(self, query, doc_types=None, limit=20):
+        """全文检索回答、草稿和可疑语句"""
+        return chat_service.search(query, doc_types, limit)
+
+
+    def find_events(self, query=None, limit=50):
+        """查询历史事件词典"""
+        return chat_service.find_events(query, limit)
+
+
+    def get_event_mentions(self, query, limit=200):
+        """获取提及指定历史事件的所有问答"""
+        return chat_service.get_event_mentions(query, limit)
+
+
+    def get_event_decade_stats(self):
+        """按年代统计历史事件提及次数"""
+        return chat_service.get_event_decade_stats()
+
+
+    def add_event_alias(self, event_id, alias):
+        """为历史事件添加别名"""
+        return chat_service.add_event_alias(event_id, alias)
+
+
+    def export_stream(self, table, export_format):
+        """流式导出指定表，table 为 all 时（仅 NDJSON）导出全部表"""
+        if export_format == 'parquet':
+            return export.stream_parquet(table)
+        tables = list(export.EXPORT_TABLES) if table == 'all' else [table]
+        return export.stream_ndjson(tables)
+
+
+    def get_upstream_stats(self):
+        """上游服务限流状态（速率、并发上限、排队深度等）"""
+        return rate_limiter.get_all_stats()
+
+
+    def get_prompts(self):
+        """所有提示词的变体、版本和 A/B 权重"""
+        return prompt_registry.registry.list()
+
+
+    def get_routing_stats(self):
+        """模型路由配置及各阶段实际使用的模型"""
+        return model_router.get_stats()
+
+
+    def get_stage_stats(self):
+        """各LLM阶段的重试、对冲和首字延迟统计"""
+        return resilience.get_stats()
+
+
+    def get_session_usage(self, session_id):
+        """会话的 token 用量、费用和预算状态"""
+        usage = chat_service.get_session_token_usage(session_id)
+        if not usage:
+            return None
+        limit = token_usage.SESSION_BUDGET['tokens']
+        usage["budget"] = {
+            "tokens": limit,
+            "remaining": max(0, limit - usage["total_tokens"]) if limit else None,
+            "level": token_usage.budget_level(usage["total_tokens"])
+        }
+        return usage
+
+
+    def get_token_totals(self):
+        """进程启动以来按模型和阶段统计的 token 用量"""
+        return token_usage.get_totals()
+
+
+    def prefetch(self, session_id, draft):
+        """
+        回答输入过程中的预取：提前读取历史，并对已写完的句子做史实校验和情绪识别
+        :return: 预取状态；会话不存在、已结束或未开启预取时返回None
+        """
+        if not prefetch.PREFETCH_ENABLED:
+            return None
+        chat_session = chat_service.session_dao.get_by_id(session_id)
+        if not chat_session or chat_session.is_finished or chat_session.last_qa_id is None:
+            return None
+        return prefetch.prefetcher.submit(
+            session_id, chat_session.last_qa_id, draft,
+            history_loader=lambda: self._load_history(session_id, use_prefetch=False),
+            budget_level=token_usage.budget_level(
+                (chat_session.prompt_tokens or 0) + (chat_session.completion_tokens or 0)
+            )
+        )
+
+
+    def _load_history(self, session_id, use_prefetch=True):
+        """读取会话及其已完成的问答和最后一个待回答的问答"""
+        chat_session = chat_service.session_dao.get_by_id(session_id)
+        # 会话不存在或没有问答记录时返回空历史
+        if not chat_session or chat_session.last_qa_id is None:
+            return chat_session, [], None
         
-        # 如果chat_qas列表为空，返回空历史
-        if not full_session_data['chat_qas']:
-            return "", None
+        # 输入过程中已预取过历史时直接使用（待回答的问答未变化）
+        if use_prefetch:
+            prefetched = prefetch.prefetcher.get_history(session_id, chat_session.last_qa_id)
+            if prefetched is not None:
+                _, answered, last_qa = prefetched
+                return chat_session, answered, last_qa
+        
+        # 各进程共享的历史快照：待回答的问答变化后键随之变化，无需主动失效
+        cache_key = f"{session_id}:{chat_session.last_qa_id}"
+        cached = shared_cache.get('history', cache_key)
+        if cached is not None:
+            answered = [SimpleNamespace(**qa) for qa in cached['answered']]
+            return chat_session, answered, SimpleNamespace(**cached['last_qa'])
+        
+        # 最新的问答记录直接由会话的 last_qa_id 定位，构建历史时无需查询可疑语句
+        answered, last_qa = [], None
+        for qa in chat_service.qa_dao.get_by_session_id(session_id):
+            # 不包括最后一个未完成的QA
+            if qa.id == chat_session.last_qa_id:
+                last_qa = qa
+            else:
+                answered.append(qa)
+        if last_qa is not None:
+            shared_cache.put('history', cache_key, {
+                'answered': [{field: getattr(qa, field) for field in HISTORY_FIELDS} for qa in answered],
+                'last_qa': {field: getattr(last_qa, field) for field in HISTORY_FIELDS},
+            })
+        return chat_session, answered, last_qa
 
+
+    def _format_history(self, answered, last_qa, compact=False):
+        """
+        构建对话历史
+        :param compact: 压缩较早的轮次：只保留问题和截断后的回答，最近几轮保持完整
+        """
         history = ""
-        for i in range(len(full_session_data['chat_qas'])-1):  
-            # 不包括最后一个未完成的QA
-            qa = full_session_data['chat_qas'][i]
-            aim = qa.get('aim', '')
-            question = qa.get('question', '')
-            answer = qa.get('answer', '')
-            emotion = qa.get('emotion', 'neutral')
-            progress = qa.get('progress', '')
+        keep_from = len(answered) - token_usage.COMPACT_KEEP_TURNS if compact else 0
+        for index, qa in enumerate(answered):
+            question = qa.question or ''
+            answer = qa.answer or ''
+            if index < keep_from:
+                if len(answer) > token_usage.COMPACT_ANSWER_CHARS:
+                    answer = answer[:token_usage.COMPACT_ANSWER_CHARS] + '……'
+                history += f"question: {question}\nanswer: {answer}\n\n"
+                continue
+            aim = qa.aim or ''
+            emotion = qa.emotion or 'neutral'
+            progress = qa.progress or ''
             history += f"aim: {aim}\nquestion: {question}\nanswer: {answer}\nemotion: {emotion}\nprogress: {progress}\n\n"
-        qa = full_session_data['chat_qas'][-1]
-        history += f"aim: {qa.get('aim', '')}\nquestion: {qa.get('question', '')}\nanswer: "
-        
-        return history, full_session_data['chat_qas'][-1]['id']
+        history += f"aim: {last_qa.aim or ''}\nquestion: {last_qa.question or ''}\nanswer: "
+        return history
+
+
+    def get_conversation_history(self, session_id):
+        """获取指定会话的完整对话历史"""
+        _, answered, last_qa = self._load_history(session_id)
+        if last_qa is None:
+            return "", None
+        return self._format_history(answered, last_qa), last_qa.id
+
+
+    def continue_conversation(self, session_id, user_input, qa_id=None):
+        """
+        继续对话：同一会话的轮次依次执行（读取历史到提交），不同会话之间并行
+        :param qa_id: 客户端回答的问答ID；取得会话锁后不再是待回答的问答时（例如同一会话的另一次提交
+                      已回答了它）返回 error 事件，不把回答记到新生成的问题下
+        """
+        try:
+            with turn_lock.session_turn(session_id):
+                yield from self._continue_turn(session_id, user_input, qa_id)
+        except turn_lock.TurnLockTimeout as e:
+            print(e)
+            yield {
+                'type': 'error',
+                'content': f'会话 {session_id} 的上一轮回答仍在处理中，请稍后重试',
+                'data': {}
+            }
 
 
-    def continue_conversation(self, session_id, user_input):
-        history, qa_id = self.get_conversation_history(session_id)
+    def _continue_turn(self, session_id, user_input, expected_qa_id=None):
+        chat_session, answered, last_qa = self._load_history(session_id)
         
-        # 如果qa_id为None，说明会话不存在或没有问答记录
-        if qa_id is None:
+        # 如果last_qa为None，说明会话不存在或没有问答记录
+        if last_qa is None:
             yield {
                 'type': 'error',
                 'content': f'会话 {session_id} 不存在或没有问答记录',
                 'data': {}
             }
             return
+        qa_id = last_qa.id
+        if chat_session.is_finished or last_qa.answer is not None or \
+                (expected_qa_id is not None and expected_qa_id != qa_id):
+            yield {
+                'type': 'error',
+                'content': f'会话 {session_id} 的问题已被回答或采访已结束，请刷新后重试',
+                'data': {'code': 'stale_qa', 'last_qa_id': None if chat_session.is_finished else qa_id}
+            }
+            return
+        
+        # 会话 token 用量接近预算时压缩较早的历史（总结草稿仍使用完整历史），必要时改用经济模型
+        budget_level = token_usage.budget_level(
+            (chat_session.prompt_tokens or 0) + (chat_session.completion_tokens or 0)
+        )
+        context = self._format_history(answered, last_qa) + f"{user_input}\n"
+        summary_context = None
+        if budget_level != token_usage.BUDGET_NORMAL:
+            print(f"会话 {session_id} token 预算等级: {budget_level}")
+            summary_context = context
+            context = self._format_history(answered, last_qa, compact=True) + f"{user_input}\n"
+        
+        prefetched = prefetch.prefetcher.take(session_id, qa_id, user_input)
         
-        context = history + f"{user_input}\n"
         response_data = {}
-        for chunk in generate_module.generate_response_stream(context, user_input):
-            if chunk['type'] == 'final':
-                response_data = chunk['data']
-            yield chunk
+        # 本轮的上游请求按会话公平排队，并记录使用的提示词版本和 token 用量（包括输入过程中预取的部分）
+        with rate_limiter.session_scope(session_id), prompt_registry.track_usage() as prompt_usage, \
+                token_usage.track(budget_level) as turn_usage:
+            if prefetched:
+                token_usage.add_to_turn(prefetched['token_usage'])
+                prompt_registry.add_to_turn(prefetched['prompt_usage'])
+            for chunk in generate_module.generate_response_stream(context, user_input,
+                                                                  summary_context=summary_context,
+                                                                  prefetched=prefetched):
+                if chunk['type'] == 'final':
+                    response_data = chunk['data']
+                yield chunk
 
-        # 更新最后一个问答记录
-        last_qa_record = chat_service.qa_dao.get_by_id(qa_id)
-        if last_qa_record:
-            last_qa_record.answer = user_input
-            last_qa_record.emotion = response_data.get('emotion', '')
-            last_qa_record.progress = response_data.get('process', '')
-            # 更新问答记录
-            update_success = chat_service.qa_dao.update(last_qa_record)
-            if update_success:
-                print(f"已更新问答记录 ID: {last_qa_record.id}")
-
-                dubious_list = response_data.get('dubious', [])
-                
-                # print(dubious_list)
-                
-                if dubious_list:
-                    dubious_records = [
-                        ChatQADubious(qa_id=last_qa_record.id, snippet=snippet)
-                        for snippet in dubious_list
-                    ]
-                    chat_service.dubious_dao.create_batch(dubious_records)
-                    print(f"已保存 {len(dubious_records)} 条可疑语句")
-            else:
-                print("更新问答记录失败")
-        
-        # 检查会话是否完成
+        # 更新最后一个问答记录、保存可疑语句并创建下一个问答记录（单事务）
         is_finished = response_data.get('is_finished', 0)
-        if is_finished == 1 or is_finished == True:
-            # 标记会话为完成
-            session = chat_service.session_dao.get_by_id(session_id)
-            if session:
-                session.is_finished = True
-                session.draft = response_data.get('draft', '')
-                chat_service.session_dao.update(session)
-                print(f"会话 ID: {session_id} 已标记为完成")
+        is_finished = is_finished == 1 or is_finished == True
+        dubious_list = response_data.get('dubious', [])
+        try:
+            next_qa_record = chat_service.commit_turn(
+                session_id=session_id,
+                qa_id=qa_id,
+                answer=user_input,
+                emotion=response_data.get('emotion', ''),
+                progress=response_data.get('process', ''),
+                dubious_snippets=dubious_list,
+                progress_items=progress_module.parse_progress(response_data.get('process', '')),
+                is_finished=is_finished,
+                draft=response_data.get('draft', ''),
+                next_question=response_data.get('question', ''),
+                next_aim=response_data.get('aim', ''),
+                prompt_version=prompt_registry.format_usage(prompt_usage),
+                token_summary=token_usage.summarize(turn_usage)
+            )
+        except Exception as e:
+            print(f"提交本轮对话失败: {e}")
+            yield {
+                'type': 'error',
+                'content': f'保存本轮回答失败: {e}',
+                'data': {}
+            }
             return
-
-        # 创建下一个问答记录
-        next_qa_record = chat_service.add_qa_to_session(
-            session_id=session_id,
-            question=response_data.get('question', ''),
-            answer=None,  # 等待用户回答
-            aim=response_data.get('aim', ''),
-            emotion=None,
-            progress=None
-        )
-        if next_qa_record:
+        
+        # 告知客户端下一个待回答的问答，下一次提交时带上它
+        yield {
+            'type': 'committed',
+            'content': '',
+            'session_id': session_id,
+            'data': {**response_data, 'next_qa_id': next_qa_record.id if next_qa_record else None}
+        }
+        print(f"已更新问答记录 ID: {qa_id}")
+        if dubious_list:
+            print(f"已保存 {len(dubious_list)} 条可疑语句")
+        
+        if is_finished:
+            print(f"会话 ID: {session_id} 已标记为完成")
+        elif next_qa_record:
             print(f"已创建新问答记录 ID: {next_qa_record.id}")
         else:
             print("创建新问答记录失败")
+        
+        # 提交后立即重建会话的物化视图（之后的读请求直接返回）并推送变更
+        self._publish_session_change(
+            event_bus.SESSION_FINISHED if is_finished else event_bus.SESSION_UPDATED, session_id, is_finished
+        )
 
 
     def start_new_conversation(self, initial_input):
@@ -170,6 +534,65 @@ class ConversationController:
             progress=None
         )
         print(f"已创建首个问答记录，ID: {first_qa.id}")
+        self._publish_session_change(event_bus.SESSION_CREATED, session.id)
         
         for chunk in self.continue_conversation(session.id, initial_input):
-            yield chunk
\ No newline at end of file
+            yield chunk
+
+
+    def start_turn(self, chunks, session_id=None, idempotency_key=None, request_input=None):
+        """
+        在后台执行一轮对话（客户端断开不影响执行）
+        :param idempotency_key: 幂等 key，同一会话内重复的 key 不再执行，直接返回已有的事件流
+        :return: (可续传的事件流, 是否为重复请求)；重复请求的轮次已被清理时事件流为 turn_stream.ExpiredTurn
+        :raises idempotency.IdempotencyConflict: 同一 key 对应的输入不同
+        """
+        meta = {'session_id': session_id} if session_id is not None else None
+        if not idempotency_key:
+            return turn_stream.registry.start(chunks, meta), False
+        turn_id, stream = idempotency.store.run(
+            session_id, idempotency_key, idempotency.fingerprint(session_id, request_input),
+            lambda turn_id: turn_stream.registry.start(chunks, meta, turn_id)
+        )
+        if stream is not None:
+            return stream, False
+        return turn_stream.registry.get(turn_id) or turn_stream.ExpiredTurn(turn_id), True
+
+
+    def get_turn_stream(self, turn_id):
+        """获取进行中或最近结束的轮次；已过期或不存在时返回None"""
+        return turn_stream.registry.get(turn_id)
+
+
+    def warmup(self):
+        """启动时预热：建立数据库连接、加载 SDK 并创建模型实例、加载提示词变体、打开共享缓存"""
+        from sqlalchemy import text
+        from repository.database import db_manager
+
+        def ping_database():
+            with db_manager.engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+
+        steps = [
+            ('database', ping_database),
+            ('models', model_router.warmup),
+            ('emotion_sdk', emotion_module.warmup),
+            ('prompts', prompt_registry.registry.list),
+            ('shared_cache', shared_cache.get_backend),
+        ]
+        started = time.time()
+        for name, step in steps:
+            try:
+                step()
+            except Exception as e:
+                print(f"预热 {name} 失败: {e}")
+        print(f"预热完成，耗时 {time.time() - started:.2f}s")
+
+
+    def get_cache_stats(self):
+        """当前 worker 的共享缓存和会话视图缓存命中统计"""
+        return {
+            **shared_cache.get_stats(),
+            "session_views": session_view.views.get_stats(),
+            "event_bus": event_bus.bus.get_stats(),
+        }
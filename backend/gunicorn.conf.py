@@ -0,0 +1,48 @@
+"""生产环境多进程部署配置
+
+启动方式（在 backend 目录下）：
+    gunicorn -c gunicorn.conf.py main:app
+
+- 每个 CPU 核心一个 worker 进程，每个 worker 使用多个线程处理请求（SSE 连接会长时间占用一个线程）
+- /updates 的订阅连接在整个页面打开期间都占用线程，每个 worker 最多 EVENT_BUS_MAX_SUBSCRIBERS 个
+  （默认 16，超出时返回 503），其余线程留给普通请求和对话轮次的流式响应；调大 WORKER_THREADS 时可相应调大
+- worker 之间通过共享缓存（默认本机 SQLite 文件）复用会话历史、史实校验和情绪识别结果，
+  同一会话的轮次通过 MySQL 命名锁串行执行（命名锁使用独立的非连接池连接，每个进行中的轮次一个，
+  MySQL 的 max_connections 需要容纳 workers × (MAX_CONCURRENT_TURNS + 连接池大小)）
+- 每个 worker 启动后先预热（数据库连接、模型实例、提示词），再开始接收请求
+- /updates 的会话变更推送需要 EVENT_BUS_BACKEND=redis 才能跨 worker 送达；多个 worker 时未设置会在启动时
+  打印警告，前端此时只能靠低频轮询（60 秒）发现其他 worker 上的变更
+
+幂等记录保存在共享缓存中；进行中轮次的事件缓冲区保存在处理该请求的 worker 内，/stream/<turn_id> 续传和
+重复提交的事件重放需要由同一个 worker 处理：多 worker 部署时在前端代理上按会话或客户端做会话保持。
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('WORKER_THREADS', 32))
+# gthread worker 的超时只检测 worker 是否卡死，不限制单个 SSE 响应的时长
+timeout = 120
+graceful_timeout = 60
+keepalive = 5
+# 不预加载应用：数据库连接池、线程池等在各 worker 内单独创建
+preload_app = False
+
+# 多进程部署时的默认配置，环境变量中已设置的以环境变量为准
+os.environ.setdefault('SHARED_CACHE_BACKEND', 'sqlite')
+os.environ.setdefault('TURN_LOCK_BACKEND', 'mysql')
+
+
+def when_ready(server):
+    """master 启动后检查多 worker 部署的配置"""
+    if workers > 1 and os.environ.get('EVENT_BUS_BACKEND', 'local') != 'redis':
+        print(f"警告: {workers} 个 worker 但 EVENT_BUS_BACKEND 不是 redis，会话变更只推送给同一 worker 上的 "
+              f"/updates 订阅者，其他页面最多延迟 60 秒才能看到；请设置 EVENT_BUS_BACKEND=redis 和 REDIS_URL")
+
+
+def post_worker_init(worker):
+    """worker 加载应用后、接收请求前预热"""
+    from main import controller
+    controller.warmup()
@@ -1,7 +1,14 @@
 from flask import Flask, jsonify, request
+from datetime import datetime
 from typing import Dict, Any
 from repository.service import chat_service
 from controller import ConversationController
+from service import progress_module
+from service import turn_stream
+from service import idempotency
+from service import sse_compression
+from service import event_bus
+from repository import export
 import json
 
 # 创建Flask应用实例
@@ -13,9 +20,355 @@ controller = ConversationController()
 def get_all_dialogues() -> Dict[int, Any]:
     """
     获取所有会话
-    :return: 包含所有会话的字典，键为会话ID，值为会话详情（包含qas和dubious列表）
+    :query since: 只返回该时间（ISO 8601，含）之后更新的会话，取值为上一次响应的 X-Updated-Until
+    :return: 包含所有会话的字典，键为会话ID，值为会话详情（包含qas和dubious列表）；
+             请求带 If-None-Match 且没有变化时返回304
     """
-    return controller.get_all_conversations()
+    since = request.args.get("since")
+    if since:
+        try:
+            since = datetime.fromisoformat(since)
+        except ValueError:
+            return jsonify({"error": "since must be an ISO 8601 timestamp"}), 400
+    
+    versions = controller.get_session_versions(since=since or None)
+    etag = controller.make_etag(versions)
+    if request.if_none_match.contains(etag):
+        response = _not_modified(etag)
+    else:
+        response = _json_bytes(controller.get_all_conversations_json(versions))
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+    
+    # 变更游标：下次请求以此作为 since（含边界，同一秒内的更新不会遗漏）
+    updated_until = max((item['updated_at'] for item in versions.values() if item['updated_at']), default=since or None)
+    if updated_until:
+        response.headers['X-Updated-Until'] = updated_until.isoformat()
+    return response
+
+
+@app.route('/dialogues/<int:session_id>', methods=['GET'])
+def get_dialogue(session_id):
+    """
+    获取单个会话
+    :return: 会话详情，格式与 /dialogues 的值相同；请求带 If-None-Match 且没有变化时返回304
+    """
+    versions = controller.get_session_versions(session_id=session_id)
+    if not versions:
+        return jsonify({"error": "Session not found"}), 404
+    
+    etag = controller.make_etag(versions)
+    if request.if_none_match.contains(etag):
+        return _not_modified(etag)
+    
+    body = controller.get_conversation_json(session_id, versions[session_id]['version'])
+    if body is None:
+        return jsonify({"error": "Session not found"}), 404
+    response = _json_bytes(body)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@app.route('/dialogues/<int:session_id>/restore', methods=['POST'])
+def restore_dialogue(session_id):
+    """
+    将已归档的会话恢复到热表（归档的会话可以直接读取，恢复后才参与检索、事件统计和导出）
+    :return: 会话不存在或未归档时返回404
+    """
+    if not controller.restore_session(session_id):
+        return jsonify({"error": "Session not found or not archived"}), 404
+    return jsonify({"success": True})
+
+
+@app.route('/dialogues/<int:session_id>/drafts', methods=['GET'])
+def get_draft_versions(session_id):
+    """
+    草稿版本列表
+    :return: 各版本的版本号、来源、字数和创建时间（不含内容）
+    """
+    return jsonify(controller.get_draft_versions(session_id))
+
+
+@app.route('/dialogues/<int:session_id>/drafts/<int:version>', methods=['GET'])
+def get_draft(session_id, version):
+    """
+    指定版本的草稿
+    :return: 版本不存在时返回404
+    """
+    draft = controller.get_draft(session_id, version)
+    if draft is None:
+        return jsonify({"error": "Draft version not found"}), 404
+    return jsonify({"session_id": session_id, "version": version, "draft": draft})
+
+
+@app.route('/dialogues/<int:session_id>/drafts/diff', methods=['GET'])
+def diff_drafts(session_id):
+    """
+    两个草稿版本的逐行对照
+    :query from: 旧版本号，默认为 to 的上一版本；为 0 时与空草稿对照
+    :query to: 新版本号，默认为最新版本
+    :query context: 相同的行只保留变化处前后的行数，默认保留全部
+    """
+    try:
+        to_version = int(request.args['to']) if 'to' in request.args else None
+        from_version = int(request.args['from']) if 'from' in request.args else None
+        context = int(request.args['context']) if 'context' in request.args else None
+    except ValueError:
+        return jsonify({"error": "from, to and context must be integers"}), 400
+    if to_version is None:
+        versions = controller.get_draft_versions(session_id)
+        to_version = versions[-1]['version'] if versions else 0
+    if from_version is None:
+        from_version = max(to_version - 1, 0)
+    if from_version < 0:
+        return jsonify({"error": "from must not be negative"}), 400
+    
+    diff = controller.diff_drafts(session_id, from_version, to_version, context)
+    if diff is None:
+        return jsonify({"error": "Draft version not found"}), 404
+    return jsonify({"session_id": session_id, "from": from_version, "to": to_version, **diff})
+
+
+@app.route('/dialogues/<int:session_id>/draft', methods=['PUT'])
+def save_draft(session_id):
+    """
+    保存编辑后的草稿为新版本
+    :return: 新版本号（内容与最新版本相同时返回最新版本号）
+    """
+    draft = request.json.get("draft", "")
+    if not draft or not draft.strip():
+        return jsonify({"error": "Draft is required"}), 400
+    
+    version = controller.save_draft(session_id, draft)
+    if version is None:
+        return jsonify({"error": "Session not found"}), 404
+    return jsonify({"session_id": session_id, "version": version})
+
+
+@app.route('/dialogues/<int:session_id>/draft/regenerate', methods=['POST'])
+def regenerate_draft(session_id):
+    """
+    根据完整的采访记录重新生成草稿并保存为新版本
+    :return: 新版本号和草稿；会话不存在或没有已回答的问答时返回404
+    """
+    try:
+        result = controller.regenerate_draft(session_id)
+    except Exception as e:
+        return jsonify({"error": f"Failed to regenerate draft: {e}"}), 502
+    if result is None:
+        return jsonify({"error": "Session not found or has no answers"}), 404
+    version, draft = result
+    return jsonify({"session_id": session_id, "version": version, "draft": draft})
+
+
+def _json_bytes(body):
+    """已序列化的 JSON（会话物化视图）直接作为响应体"""
+    from flask import Response
+    return Response(body, mimetype='application/json')
+
+
+def _not_modified(etag):
+    from flask import Response
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@app.route('/progress/stuck', methods=['GET'])
+def get_stuck_sessions():
+    """
+    获取指定章节完成度低于阈值的会话
+    :return: 章节完成度记录列表，按完成度升序
+    """
+    chapter = request.args.get("chapter", "")
+    below = request.args.get("below", 100, type=int)
+    include_finished = request.args.get("include_finished", "false").lower() == "true"
+    
+    if chapter not in progress_module.CHAPTERS:
+        return jsonify({"error": f"chapter must be one of {', '.join(progress_module.CHAPTERS)}"}), 400
+    
+    return jsonify(controller.get_stuck_sessions(chapter, below, include_finished))
+
+
+@app.route('/progress/overview', methods=['GET'])
+def get_progress_overview():
+    """
+    按章节汇总完成度分布
+    :return: {章节: {完成度: 会话数}}
+    """
+    include_finished = request.args.get("include_finished", "false").lower() == "true"
+    return jsonify(controller.get_progress_overview(include_finished))
+
+
+@app.route('/search', methods=['GET'])
+def search():
+    """
+    全文检索回答、草稿和可疑语句
+    :return: 按相关度排序的命中列表（含文本片段）
+    """
+    query = request.args.get("q", "").strip()
+    try:
+        limit = int(request.args.get("limit", 20))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    limit = max(1, min(limit, 100))
+    doc_types = [t for t in request.args.get("type", "").split(",") if t] or None
+    
+    if not query:
+        return jsonify({"error": "Query is required"}), 400
+    
+    return jsonify(controller.search(query, doc_types, limit))
+
+
+@app.route('/events', methods=['GET'])
+def get_events():
+    """
+    查询历史事件词典
+    :return: 事件列表（含别名、提及次数和涉及的会话数），按提及次数降序
+    """
+    query = request.args.get("q", "").strip() or None
+    limit = min(request.args.get("limit", 50, type=int), 500)
+    return jsonify(controller.find_events(query, limit))
+
+
+@app.route('/events/mentions', methods=['GET'])
+def get_event_mentions():
+    """
+    获取提及指定历史事件的所有问答
+    :return: 问答列表（含会话ID、问题和回答）
+    """
+    query = request.args.get("q", "").strip()
+    limit = min(request.args.get("limit", 200, type=int), 1000)
+    
+    if not query:
+        return jsonify({"error": "Query is required"}), 400
+    
+    return jsonify(controller.get_event_mentions(query, limit))
+
+
+@app.route('/events/decades', methods=['GET'])
+def get_event_decade_stats():
+    """
+    按年代统计历史事件提及次数
+    """
+    return jsonify(controller.get_event_decade_stats())
+
+
+@app.route('/events/<int:event_id>/aliases', methods=['POST'])
+def add_event_alias(event_id):
+    """
+    为历史事件添加别名，别名已属于其他事件时合并两个事件
+    """
+    body = request.get_json(silent=True)
+    alias = body.get("alias", "") if isinstance(body, dict) else ""
+    if not alias or not isinstance(alias, str):
+        return jsonify({"error": "Alias is required"}), 400
+    
+    if not controller.add_event_alias(event_id, alias):
+        return jsonify({"error": "Event not found"}), 404
+    
+    return jsonify({"success": True})
+
+
+@app.route('/export/<table>', methods=['GET'])
+def export_table(table):
+    """
+    流式导出会话（sessions）、问答（qas）、可疑语句（dubious）
+    format=ndjson 时 table 可为 all；format=parquet 时每次导出一张表
+    """
+    export_format = request.args.get("format", "ndjson")
+    
+    if export_format not in export.EXPORT_FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(export.EXPORT_FORMATS)}"}), 400
+    if table not in export.EXPORT_TABLES and not (table == 'all' and export_format == 'ndjson'):
+        return jsonify({"error": f"Unknown table: {table}"}), 400
+    if export_format == 'parquet' and not export.parquet_available():
+        return jsonify({"error": "Parquet export requires pyarrow"}), 501
+    
+    mimetype = 'application/x-ndjson' if export_format == 'ndjson' else 'application/vnd.apache.parquet'
+    from flask import Response
+    return Response(
+        controller.export_stream(table, export_format),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={table}.{export_format}"}
+    )
+
+
+@app.route('/metrics/upstream', methods=['GET'])
+def get_upstream_stats():
+    """
+    上游服务（DeepSeek、百度）限流状态
+    :return: 各服务当前速率、并发上限、进行中请求数、排队深度和限流次数
+    """
+    return jsonify(controller.get_upstream_stats())
+
+
+@app.route('/metrics/stages', methods=['GET'])
+def get_stage_stats():
+    """
+    各LLM阶段（talk / check / summary / emotion）的调用统计
+    :return: 调用次数、重试次数、对冲请求次数、超时次数和 p95 首字延迟
+    """
+    return jsonify(controller.get_stage_stats())
+
+
+@app.route('/metrics/routing', methods=['GET'])
+def get_routing_stats():
+    """
+    模型路由
+    :return: 各阶段的路由规则、规则对应模型是否可用，以及实际路由到各模型的次数
+    """
+    return jsonify(controller.get_routing_stats())
+
+
+@app.route('/prompts', methods=['GET'])
+def get_prompts():
+    """
+    提示词注册表
+    :return: 各提示词的变体、内容哈希版本和 A/B 流量权重
+    """
+    return jsonify(controller.get_prompts())
+
+
+@app.route('/usage/<int:session_id>', methods=['GET'])
+def get_session_usage(session_id):
+    """
+    会话的 token 用量和费用
+    :return: 会话累计用量、每个问答的分阶段明细和预算状态
+    """
+    usage = controller.get_session_usage(session_id)
+    if usage is None:
+        return jsonify({"error": "Session not found"}), 404
+    return jsonify(usage)
+
+
+@app.route('/metrics/tokens', methods=['GET'])
+def get_token_totals():
+    """
+    全局 token 用量
+    :return: 进程启动以来按模型和阶段统计的 token 用量和费用
+    """
+    return jsonify(controller.get_token_totals())
+
+
+@app.route('/metrics/archive', methods=['GET'])
+def get_archive_stats():
+    """
+    归档统计
+    :return: 已归档的会话数、问答数和压缩前后的字节数
+    """
+    return jsonify(controller.get_archive_stats())
+
+
+@app.route('/metrics/cache', methods=['GET'])
+def get_cache_stats():
+    """
+    共享缓存命中统计
+    :return: 处理本次请求的 worker 的缓存后端和各命名空间的命中次数
+    """
+    return jsonify(controller.get_cache_stats())
 
 
 @app.route('/start', methods=['POST'])
@@ -27,12 +380,34 @@ def start_conversation():
     if not initial_input:
         return jsonify({"error": "Initial input is required"}), 400
     
-    def generate():
-        for chunk in controller.start_new_conversation(initial_input):
-            yield f"data: {json.dumps(chunk)}\n\n"
+    try:
+        stream, replayed = controller.start_turn(
+            controller.start_new_conversation(initial_input),
+            idempotency_key=_idempotency_key(), request_input=initial_input
+        )
+    except idempotency.IdempotencyConflict as e:
+        return jsonify({"error": str(e)}), 422
+    except turn_stream.TooManyTurns as e:
+        return _busy_response(e)
+    return _stream_response(stream, replayed=replayed)
+
+
+@app.route('/prefetch', methods=['POST'])
+def prefetch_answer():
+    """
+    回答输入过程中的预取（前端防抖后发送当前草稿）
+    :return: 202，预取在后台进行
+    """
+    session_id = request.json.get("session_id")
+    draft = request.json.get("input", "")
+    
+    if not session_id:
+        return jsonify({"error": "Session ID is required"}), 400
     
-    from flask import Response
-    return Response(generate(), mimetype='text/event-stream')
+    status = controller.prefetch(session_id, draft)
+    if status is None:
+        return jsonify({"accepted": False}), 202
+    return jsonify(status), 202
 
 
 @app.route('/continue', methods=['POST'])
@@ -42,19 +417,104 @@ def continue_conversation():
     """
     session_id = request.json.get("session_id")
     user_input = request.json.get("input", "")
+    qa_id = request.json.get("qa_id")
     
     if not session_id or not user_input:
         return jsonify({"error": "Session ID and user input are required"}), 400
+    if qa_id is not None and (isinstance(qa_id, bool) or not isinstance(qa_id, int)):
+        return jsonify({"error": "qa_id must be an integer"}), 400
     
-    def generate():
-        for chunk in controller.continue_conversation(session_id, user_input):
-            yield f"data: {json.dumps(chunk)}\n\n"
+    try:
+        stream, replayed = controller.start_turn(
+            controller.continue_conversation(session_id, user_input, qa_id), session_id=session_id,
+            idempotency_key=_idempotency_key(), request_input=user_input
+        )
+    except idempotency.IdempotencyConflict as e:
+        return jsonify({"error": str(e)}), 422
+    except turn_stream.TooManyTurns as e:
+        return _busy_response(e)
+    return _stream_response(stream, replayed=replayed)
+
+
+@app.route('/stream/<turn_id>', methods=['GET'])
+def resume_stream(turn_id):
+    """
+    续传某一轮对话的事件流
+    :param turn_id: 轮次ID（事件 id 中冒号之前的部分）
+    :query last_event_id: 最后收到的事件 id，也可以通过 Last-Event-ID 请求头传递
+    :return: 该事件之后的事件流；轮次不存在或已过期时返回404
+    """
+    stream = controller.get_turn_stream(turn_id)
+    if stream is None:
+        return jsonify({"error": f"Turn {turn_id} not found or expired"}), 404
     
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    _, after_seq = turn_stream.parse_event_id(last_event_id)
+    return _stream_response(stream, after_seq)
+
+
+@app.route('/updates', methods=['GET'])
+def stream_updates():
+    """
+    会话变更推送（SSE），替代轮询 /dialogues
+    事件类型：session_created、session_updated（提交了一轮）、session_finished
+    :query last_event_id: 最后收到的事件 id，也可以通过 Last-Event-ID 请求头传递，重连时补发之后的事件
+    :return: 订阅者数已达上限时返回503
+    """
+    from flask import Response
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        subscription = controller.subscribe_updates(last_event_id)
+    except event_bus.TooManySubscribers as e:
+        response = jsonify({"error": str(e)})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+    response = Response(subscription.stream(), mimetype='text/event-stream')
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def _idempotency_key():
+    """请求携带的幂等 key（Idempotency-Key 请求头或 idempotency_key 字段）"""
+    return request.headers.get('Idempotency-Key') or request.json.get("idempotency_key")
+
+
+def _busy_response(error):
+    """同时执行的轮次已满：返回503，客户端稍后用同一幂等 key 重试"""
+    response = jsonify({"error": str(error)})
+    response.headers['Retry-After'] = '5'
+    return response, 503
+
+
+def _stream_response(stream, after_seq=0, replayed=False):
+    """
+    将一轮对话的事件缓冲区输出为 SSE 响应（断开后可通过 /stream/<turn_id> 续传）
+    :query encoding: delta 时使用增量编码，每个事件只包含变化的字段
+    客户端支持时按 Accept-Encoding 压缩（brotli 或 gzip）
+    """
     from flask import Response
-    return Response(generate(), mimetype='text/event-stream')
+    events = stream.follow(after_seq, delta=request.args.get('encoding') == 'delta')
+    content_encoding = sse_compression.negotiate(request.headers.get('Accept-Encoding'))
+    if content_encoding:
+        events = sse_compression.compress(events, content_encoding)
+    response = Response(events, mimetype='text/event-stream')
+    if content_encoding:
+        response.headers['Content-Encoding'] = content_encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    # 禁止反向代理缓冲，保证事件及时送达
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.headers['X-Turn-Id'] = stream.turn_id
+    if replayed:
+        response.headers['Idempotent-Replayed'] = 'true'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 
 # 启动应用
 if __name__ == '__main__':
+    # 较慢的 SDK 和数据库连接在后台预热，不阻塞启动
+    import threading
+    threading.Thread(target=controller.warmup, name='warmup', daemon=True).start()
     app.run(debug=True, port=5000)
     
\ No newline at end of file
@@ -0,0 +1,250 @@
+"""已结束会话的归档
+
+已结束且超过 ARCHIVE_AFTER_DAYS 天没有更新的会话，其问答、可疑语句和草稿序列化后压缩为
+chat_session_archive 中的一行，并从 chat_qa / chat_qa_dubious 等热表中删除；会话表的行保留
+（统计字段、token 用量不变，archived_at 记录归档时间）。
+
+- 读取：ChatService.get_session_content 等方法对已归档的会话透明地从归档中解压读取
+- 恢复：restore_session 将问答写回热表（保留原ID），并重建全文索引和历史事件关联
+- 归档的会话不参与全文检索、历史事件统计和批量导出，恢复后重新参与
+
+压缩使用 zstd（需要安装 zstandard 包），未安装时使用 zlib；每行记录自己的压缩方式，两种可以混用。
+
+在 backend 目录下执行：
+    python -m repository.archive                 # 归档符合条件的会话
+    python -m repository.archive --days 90 --limit 1000
+    python -m repository.archive --restore 42    # 恢复会话 42
+"""
+import json
+import zlib
+from datetime import datetime, timedelta
+from typing import List, Optional, Dict, Any
+from sqlalchemy import func, DateTime
+from sqlalchemy.orm import Session
+from .models import ChatSession, ChatQA, ChatQADubious, ChatQAEvent, ChatSessionArchive
+from .database import db_manager
+from . import search_index, event_index
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 会话结束后多少天归档，以及每次任务最多归档的会话数
+ARCHIVE_AFTER_DAYS = 30
+ARCHIVE_BATCH = 500
+ZSTD_LEVEL = 10
+ZLIB_LEVEL = 9
+
+# 归档数据格式版本
+PAYLOAD_VERSION = 1
+
+_QA_COLUMNS = ChatQA.__table__.columns
+_DATETIME_COLUMNS = {column.name for column in _QA_COLUMNS if isinstance(column.type, DateTime)}
+
+
+def compress(raw: bytes) -> tuple:
+    """返回 (压缩方式, 压缩后的数据)"""
+    if zstandard is not None:
+        return 'zstd', zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    return 'zlib', zlib.compress(raw, ZLIB_LEVEL)
+
+
+def decompress(codec: str, data: bytes) -> bytes:
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("读取 zstd 压缩的归档需要安装 zstandard 包")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == 'zlib':
+        return zlib.decompress(data)
+    raise ValueError(f"未知的归档压缩方式: {codec}")
+
+
+def _qa_to_dict(qa: ChatQA, dubious: List[ChatQADubious]) -> Dict[str, Any]:
+    item = {}
+    for column in _QA_COLUMNS:
+        value = getattr(qa, column.name)
+        item[column.name] = value.isoformat() if isinstance(value, datetime) else value
+    item['dubious'] = [{"id": record.id, "snippet": record.snippet} for record in dubious]
+    return item
+
+
+def _dict_to_qa(item: Dict[str, Any]) -> ChatQA:
+    """归档中的问答还原为 ChatQA 对象（未加入任何数据库会话），dubious_records 为其可疑语句"""
+    fields = {}
+    for column in _QA_COLUMNS:
+        value = item.get(column.name)
+        if value is not None and column.name in _DATETIME_COLUMNS:
+            value = datetime.fromisoformat(value)
+        fields[column.name] = value
+    qa = ChatQA(**fields)
+    qa.dubious_records = [
+        ChatQADubious(id=record['id'], qa_id=qa.id, snippet=record['snippet'])
+        for record in item.get('dubious', [])
+    ]
+    return qa
+
+
+def _update_session(db_session: Session, session_id: int, draft: Optional[str], archived_at: Optional[datetime]):
+    """更新会话的草稿和归档时间，保留原来的 updated_at（不触发 onupdate）"""
+    db_session.query(ChatSession).filter(ChatSession.id == session_id).update({
+        ChatSession.draft: draft,
+        ChatSession.archived_at: archived_at,
+        ChatSession.updated_at: ChatSession.updated_at,
+    }, synchronize_session=False)
+
+
+def archive_session(session_id: int) -> bool:
+    """
+    归档一个已结束的会话（单事务）
+    :return: 是否归档；会话不存在、未结束或已归档时返回 False
+    """
+    with db_manager.get_session() as db_session:
+        chat_session = db_session.query(ChatSession).filter(ChatSession.id == session_id).first()
+        if not chat_session or not chat_session.is_finished or chat_session.archived_at is not None:
+            return False
+
+        qas = db_session.query(ChatQA).filter(ChatQA.session_id == session_id).order_by(ChatQA.created_at).all()
+        qa_ids = [qa.id for qa in qas]
+        dubious = {}
+        if qa_ids:
+            for record in db_session.query(ChatQADubious).filter(
+                    ChatQADubious.qa_id.in_(qa_ids)).order_by(ChatQADubious.id):
+                dubious.setdefault(record.qa_id, []).append(record)
+
+        payload = {
+            "version": PAYLOAD_VERSION,
+            "draft": chat_session.draft,
+            "qas": [_qa_to_dict(qa, dubious.get(qa.id, [])) for qa in qas],
+        }
+        raw = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        codec, data = compress(raw)
+        db_session.add(ChatSessionArchive(session_id=session_id, codec=codec, payload=data,
+                                          raw_size=len(raw), qa_count=len(qas)))
+
+        # 先删除引用问答的索引和关联，再删除问答
+        search_index.remove_session(db_session, session_id)
+        db_session.query(ChatQAEvent).filter(ChatQAEvent.session_id == session_id).delete(synchronize_session=False)
+        if qa_ids:
+            db_session.query(ChatQADubious).filter(
+                ChatQADubious.qa_id.in_(qa_ids)
+            ).delete(synchronize_session=False)
+            db_session.query(ChatQA).filter(ChatQA.session_id == session_id).delete(synchronize_session=False)
+
+        # 显式保留 updated_at：归档不改变会话内容，不应出现在 /dialogues?since= 中或改变 ETag
+        _update_session(db_session, session_id, draft=None, archived_at=datetime.now())
+    return True
+
+
+def archive_finished_sessions(days: int = ARCHIVE_AFTER_DAYS, limit: int = ARCHIVE_BATCH) -> int:
+    """
+    归档已结束且 days 天内没有更新的会话，每个会话一个事务
+    :return: 归档的会话数量
+    """
+    cutoff = datetime.now() - timedelta(days=days)
+    with db_manager.get_session() as db_session:
+        session_ids = [
+            session_id for (session_id,) in db_session.query(ChatSession.id).filter(
+                ChatSession.is_finished == True,
+                ChatSession.archived_at.is_(None),
+                ChatSession.updated_at < cutoff
+            ).order_by(ChatSession.id).limit(limit)
+        ]
+
+    archived = 0
+    for session_id in session_ids:
+        try:
+            if archive_session(session_id):
+                archived += 1
+        except Exception as e:
+            print(f"归档会话 {session_id} 失败: {e}")
+    print(f"已归档 {archived} 个会话")
+    return archived
+
+
+def load_session(session_id: int, db_session: Optional[Session] = None) -> Optional[Dict[str, Any]]:
+    """读取并解压会话的归档数据 {"draft": ..., "qas": [...]}，未归档时返回 None"""
+    if db_session is None:
+        with db_manager.get_session() as db_session:
+            return load_session(session_id, db_session)
+    row = db_session.query(ChatSessionArchive.codec, ChatSessionArchive.payload).filter(
+        ChatSessionArchive.session_id == session_id
+    ).first()
+    if row is None:
+        return None
+    return json.loads(decompress(row.codec, row.payload))
+
+
+def to_qas(payload: Dict[str, Any]) -> List[ChatQA]:
+    """归档数据中的问答（按原顺序，含 dubious_records）"""
+    return [_dict_to_qa(item) for item in payload.get('qas', [])]
+
+
+def restore_session(session_id: int) -> bool:
+    """
+    将已归档的会话恢复到热表（单事务），问答和可疑语句保留原ID
+    :return: 是否恢复；会话不存在或未归档时返回 False
+    """
+    with db_manager.get_session() as db_session:
+        chat_session = db_session.query(ChatSession).filter(ChatSession.id == session_id).first()
+        if not chat_session:
+            return False
+        payload = load_session(session_id, db_session)
+        if payload is None:
+            return False
+
+        qas = to_qas(payload)
+        db_session.add_all(qas)  # 可疑语句随问答级联写入
+        db_session.flush()
+
+        for qa in qas:
+            search_index.index_document(db_session, 'answer', qa.id, session_id, qa.answer)
+            for record in qa.dubious_records:
+                search_index.index_document(db_session, 'dubious', record.id, session_id, record.snippet)
+            # 事件关联由可疑语句重新解析，期间合并过的事件会指向合并后的事件
+            if qa.dubious_records:
+                event_index.link_events(db_session, session_id, qa.id,
+                                        [record.snippet for record in qa.dubious_records], qa.answer)
+        draft = payload.get('draft')
+        if chat_session.is_finished:
+            search_index.index_document(db_session, 'draft', session_id, session_id, draft)
+
+        _update_session(db_session, session_id, draft=draft, archived_at=None)
+        db_session.query(ChatSessionArchive).filter(
+            ChatSessionArchive.session_id == session_id
+        ).delete(synchronize_session=False)
+    return True
+
+
+def get_stats() -> Dict[str, Any]:
+    """归档的会话数、问答数以及压缩前后的总字节数"""
+    with db_manager.get_session() as db_session:
+        sessions, qas, raw_size, stored_size = db_session.query(
+            func.count(ChatSessionArchive.session_id),
+            func.sum(ChatSessionArchive.qa_count),
+            func.sum(ChatSessionArchive.raw_size),
+            func.sum(func.length(ChatSessionArchive.payload))
+        ).one()
+    return {
+        "sessions": sessions or 0,
+        "qas": int(qas or 0),
+        "raw_bytes": int(raw_size or 0),
+        "stored_bytes": int(stored_size or 0),
+        "codec": 'zstd' if zstandard is not None else 'zlib',
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='归档已结束的会话')
+    parser.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS, help='会话结束后多少天归档')
+    parser.add_argument('--limit', type=int, default=ARCHIVE_BATCH, help='本次最多归档的会话数')
+    parser.add_argument('--restore', type=int, metavar='SESSION_ID', help='恢复指定的会话')
+    args = parser.parse_args()
+
+    db_manager.create_tables()
+    if args.restore is not None:
+        print(f"会话 {args.restore} 已恢复" if restore_session(args.restore) else f"会话 {args.restore} 未归档")
+    else:
+        archive_finished_sessions(args.days, args.limit)
@@ -0,0 +1,294 @@
+"""存量数据回填任务
+
+在 backend 目录下执行：
+    python -m repository.backfill
+"""
+from sqlalchemy import inspect, text, func
+from .models import ChatSession, ChatQA, ChatQADubious, ChatSessionProgress, ChatQAEvent
+from .database import db_manager
+from . import search_index, event_index, draft_history
+
+
+# chat_session 新增的冗余统计字段及其建表语句
+SESSION_COUNTER_COLUMNS = {
+    'qa_count': 'INT NOT NULL DEFAULT 0',
+    'dubious_count': 'INT NOT NULL DEFAULT 0',
+    'last_qa_id': 'BIGINT NULL',
+    'progress': 'TEXT NULL',
+    'prompt_tokens': 'BIGINT NOT NULL DEFAULT 0',
+    'completion_tokens': 'BIGINT NOT NULL DEFAULT 0',
+    'token_cost': 'DOUBLE NOT NULL DEFAULT 0',
+    'draft_version': 'INT NOT NULL DEFAULT 0',
+    'archived_at': 'DATETIME NULL',
+}
+
+
+# chat_qa 新增字段及其建表语句
+QA_COLUMNS = {
+    'prompt_version': 'VARCHAR(255) NULL',
+    'prompt_tokens': 'INT NULL',
+    'completion_tokens': 'INT NULL',
+    'token_cost': 'DOUBLE NULL',
+    'token_detail': 'TEXT NULL',
+}
+
+
+def _ensure_columns(table: str, columns: dict):
+    """为已存在的表补齐字段（create_all 不会修改已有表）"""
+    existing = {column['name'] for column in inspect(db_manager.engine).get_columns(table)}
+    with db_manager.engine.begin() as conn:
+        for name, ddl in columns.items():
+            if name not in existing:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+                print(f"已添加字段 {table}.{name}")
+
+
+def ensure_session_counter_columns():
+    """为已存在的 chat_session 表补齐统计字段"""
+    _ensure_columns('chat_session', SESSION_COUNTER_COLUMNS)
+
+
+def ensure_qa_columns():
+    """为已存在的 chat_qa 表补齐新增字段"""
+    _ensure_columns('chat_qa', QA_COLUMNS)
+
+
+def backfill_session_counters(batch_size: int = 500) -> int:
+    """按批次重新计算每个会话的 qa_count / dubious_count / last_qa_id / progress
+
+    Returns:
+        int: 回填的会话数量
+    """
+    total = 0
+    last_id = 0
+    while True:
+        with db_manager.get_session() as db_session:
+            session_ids = [
+                session_id for (session_id,) in db_session.query(ChatSession.id)
+                .filter(ChatSession.id > last_id)
+                .order_by(ChatSession.id)
+                .limit(batch_size)
+            ]
+            if not session_ids:
+                break
+
+            qa_counts = dict(
+                db_session.query(ChatQA.session_id, func.count(ChatQA.id))
+                .filter(ChatQA.session_id.in_(session_ids))
+                .group_by(ChatQA.session_id)
+            )
+            dubious_counts = dict(
+                db_session.query(ChatQA.session_id, func.count(ChatQADubious.id))
+                .join(ChatQADubious, ChatQADubious.qa_id == ChatQA.id)
+                .filter(ChatQA.session_id.in_(session_ids))
+                .group_by(ChatQA.session_id)
+            )
+            last_qa_ids = dict(
+                db_session.query(ChatQA.session_id, func.max(ChatQA.id))
+                .filter(ChatQA.session_id.in_(session_ids))
+                .group_by(ChatQA.session_id)
+            )
+            # 最近一条带进度描述的问答记录
+            progress_qa_ids = (
+                db_session.query(func.max(ChatQA.id).label('qa_id'))
+                .filter(ChatQA.session_id.in_(session_ids), ChatQA.progress.isnot(None), ChatQA.progress != '')
+                .group_by(ChatQA.session_id)
+                .subquery()
+            )
+            progresses = dict(
+                db_session.query(ChatQA.session_id, ChatQA.progress)
+                .join(progress_qa_ids, progress_qa_ids.c.qa_id == ChatQA.id)
+            )
+
+            for session_id in session_ids:
+                db_session.query(ChatSession).filter(ChatSession.id == session_id).update({
+                    ChatSession.qa_count: qa_counts.get(session_id, 0),
+                    ChatSession.dubious_count: dubious_counts.get(session_id, 0),
+                    ChatSession.last_qa_id: last_qa_ids.get(session_id),
+                    ChatSession.progress: progresses.get(session_id),
+                    # 回填不应改变会话的更新时间
+                    ChatSession.updated_at: ChatSession.updated_at,
+                }, synchronize_session=False)
+
+        total += len(session_ids)
+        last_id = session_ids[-1]
+        print(f"已回填 {total} 个会话的统计字段")
+
+    return total
+
+
+def backfill_session_progress(batch_size: int = 500) -> int:
+    """解析存量问答记录的 progress 文本，重建 chat_session_progress 表
+
+    Returns:
+        int: 处理的会话数量
+    """
+    from service.progress_module import parse_progress
+
+    total = 0
+    last_id = 0
+    while True:
+        with db_manager.get_session() as db_session:
+            session_ids = [
+                session_id for (session_id,) in db_session.query(ChatSession.id)
+                .filter(ChatSession.id > last_id)
+                .order_by(ChatSession.id)
+                .limit(batch_size)
+            ]
+            if not session_ids:
+                break
+
+            # 按问答顺序解析，后出现的章节进度覆盖先出现的
+            latest = {}
+            rows = (
+                db_session.query(ChatQA.session_id, ChatQA.id, ChatQA.progress)
+                .filter(ChatQA.session_id.in_(session_ids), ChatQA.progress.isnot(None), ChatQA.progress != '')
+                .order_by(ChatQA.id)
+            )
+            for session_id, qa_id, progress in rows:
+                for item in parse_progress(progress):
+                    latest[(session_id, item['chapter'])] = (qa_id, item)
+
+            db_session.query(ChatSessionProgress).filter(
+                ChatSessionProgress.session_id.in_(session_ids)
+            ).delete(synchronize_session=False)
+            db_session.add_all([
+                ChatSessionProgress(
+                    session_id=session_id,
+                    chapter=chapter,
+                    percentage=item['percentage'],
+                    missing=item['missing'][:255] if item['missing'] else None,
+                    detail=item['detail'],
+                    qa_id=qa_id
+                )
+                for (session_id, chapter), (qa_id, item) in latest.items()
+            ])
+
+        total += len(session_ids)
+        last_id = session_ids[-1]
+        print(f"已回填 {total} 个会话的章节完成度")
+
+    return total
+
+
+def rebuild_search_index(batch_size: int = 500) -> int:
+    """为存量回答、草稿和可疑语句重建全文索引
+
+    Returns:
+        int: 处理的会话数量
+    """
+    total = 0
+    last_id = 0
+    while True:
+        with db_manager.get_session() as db_session:
+            sessions = (
+                db_session.query(ChatSession.id, ChatSession.draft)
+                .filter(ChatSession.id > last_id)
+                .order_by(ChatSession.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not sessions:
+                break
+            session_ids = [session_id for session_id, _ in sessions]
+
+            for session_id, draft in sessions:
+                search_index.index_document(db_session, 'draft', session_id, session_id, draft)
+            for qa_id, session_id, answer in (
+                    db_session.query(ChatQA.id, ChatQA.session_id, ChatQA.answer)
+                    .filter(ChatQA.session_id.in_(session_ids))):
+                search_index.index_document(db_session, 'answer', qa_id, session_id, answer)
+            for dubious_id, session_id, snippet in (
+                    db_session.query(ChatQADubious.id, ChatQA.session_id, ChatQADubious.snippet)
+                    .join(ChatQA, ChatQA.id == ChatQADubious.qa_id)
+                    .filter(ChatQA.session_id.in_(session_ids))):
+                search_index.index_document(db_session, 'dubious', dubious_id, session_id, snippet)
+
+        total += len(sessions)
+        last_id = session_ids[-1]
+        print(f"已为 {total} 个会话重建全文索引")
+
+    return total
+
+
+def rebuild_event_index(batch_size: int = 500) -> int:
+    """根据存量可疑语句重建问答-历史事件关联（词典和人工添加的别名保留）
+
+    Returns:
+        int: 处理的问答数量
+    """
+    total = 0
+    last_id = 0
+    while True:
+        with db_manager.get_session() as db_session:
+            qa_ids = [
+                qa_id for (qa_id,) in db_session.query(ChatQADubious.qa_id)
+                .filter(ChatQADubious.qa_id > last_id)
+                .group_by(ChatQADubious.qa_id)
+                .order_by(ChatQADubious.qa_id)
+                .limit(batch_size)
+            ]
+            if not qa_ids:
+                break
+
+            qas = {
+                qa_id: (session_id, answer) for qa_id, session_id, answer in
+                db_session.query(ChatQA.id, ChatQA.session_id, ChatQA.answer).filter(ChatQA.id.in_(qa_ids))
+            }
+            snippets = {}
+            for qa_id, snippet in db_session.query(ChatQADubious.qa_id, ChatQADubious.snippet).filter(
+                    ChatQADubious.qa_id.in_(qa_ids)).order_by(ChatQADubious.id):
+                snippets.setdefault(qa_id, []).append(snippet)
+
+            db_session.query(ChatQAEvent).filter(ChatQAEvent.qa_id.in_(qa_ids)).delete(synchronize_session=False)
+            for qa_id in qa_ids:
+                if qa_id in qas:
+                    session_id, answer = qas[qa_id]
+                    event_index.link_events(db_session, session_id, qa_id, snippets.get(qa_id, []), answer)
+
+        total += len(qa_ids)
+        last_id = qa_ids[-1]
+        print(f"已为 {total} 条问答重建历史事件关联")
+
+    return total
+
+
+def backfill_draft_versions(batch_size: int = 500) -> int:
+    """将存量草稿记录为各会话的第 1 个草稿版本
+
+    Returns:
+        int: 记录的会话数量
+    """
+    total = 0
+    last_id = 0
+    while True:
+        with db_manager.get_session() as db_session:
+            sessions = (
+                db_session.query(ChatSession.id, ChatSession.draft)
+                .filter(ChatSession.id > last_id, ChatSession.draft.isnot(None), ChatSession.draft_version == 0)
+                .order_by(ChatSession.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not sessions:
+                break
+
+            for session_id, draft in sessions:
+                draft_history.record_version(db_session, session_id, draft, draft_history.SOURCE_GENERATED)
+
+        total += len(sessions)
+        last_id = sessions[-1][0]
+        print(f"已为 {total} 个会话记录草稿版本")
+
+    return total
+
+
+if __name__ == '__main__':
+    db_manager.create_tables()
+    ensure_session_counter_columns()
+    ensure_qa_columns()
+    backfill_session_counters()
+    backfill_session_progress()
+    rebuild_search_index()
+    rebuild_event_index()
+    backfill_draft_versions()
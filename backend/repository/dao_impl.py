@@ -2,7 +2,7 @@ from typing import List, Optional, Any
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 from .BaseDAO import BaseDAO
-from .models import ChatSession, ChatQA, ChatQADubious
+from .models import ChatSession, ChatQA, ChatQADubious, ChatSessionProgress
 from .database import db_manager
 
 
@@ -351,4 +351,117 @@ class ChatQADubiousDAO(BaseDAO):
             raise e
         finally:
             if managed_session:
-                session.close()
\ No newline at end of file
+                session.close()
+
+
+class ChatSessionProgressDAO(BaseDAO):
+    """ChatSessionProgress数据访问对象"""
+    
+    def __init__(self, session: Optional[Session] = None):
+        self.session = session
+    
+    def _get_session(self) -> Session:
+        """获取数据库会话"""
+        if self.session:
+            return self.session
+        return db_manager.get_session_instance()
+    
+    def create(self, entity: ChatSessionProgress) -> ChatSessionProgress:
+        """创建新的章节完成度记录"""
+        session = self._get_session()
+        managed_session = not self.session  # 标记是否需要管理session
+        try:
+            session.add(entity)
+            session.commit()
+            session.refresh(entity)
+            
+            # 如果是自管理的session，需要在关闭前获取必要的属性
+            if managed_session:
+                # 触发属性加载，避免detached状态
+                _ = entity.id
+                _ = entity.updated_at
+                
+            return entity
+        except IntegrityError as e:
+            session.rollback()
+            raise e
+        finally:
+            if managed_session:
+                session.close()
+    
+    def get_by_id(self, entity_id: int) -> Optional[ChatSessionProgress]:
+        """根据ID获取章节完成度记录"""
+        session = self._get_session()
+        try:
+            return session.query(ChatSessionProgress).filter(ChatSessionProgress.id == entity_id).first()
+        finally:
+            if not self.session:
+                session.close()
+    
+    def get_all(self) -> List[ChatSessionProgress]:
+        """获取所有章节完成度记录"""
+        session = self._get_session()
+        try:
+            return session.query(ChatSessionProgress).all()
+        finally:
+            if not self.session:
+                session.close()
+    
+    def update(self, entity: ChatSessionProgress) -> bool:
+        """更新章节完成度记录"""
+        session = self._get_session()
+        try:
+            session.merge(entity)
+            session.commit()
+            return True
+        except Exception:
+            session.rollback()
+            return False
+        finally:
+            if not self.session:
+                session.close()
+    
+    def delete(self, entity_id: int) -> bool:
+        """删除章节完成度记录"""
+        session = self._get_session()
+        try:
+            entity = session.query(ChatSessionProgress).filter(ChatSessionProgress.id == entity_id).first()
+            if entity:
+                session.delete(entity)
+                session.commit()
+                return True
+            return False
+        except Exception:
+            session.rollback()
+            return False
+        finally:
+            if not self.session:
+                session.close()
+    
+    def get_by_session_id(self, session_id: int) -> List[ChatSessionProgress]:
+        """根据会话ID获取各章节完成度"""
+        session = self._get_session()
+        try:
+            return session.query(ChatSessionProgress).filter(
+                ChatSessionProgress.session_id == session_id
+            ).order_by(ChatSessionProgress.id).all()
+        finally:
+            if not self.session:
+                session.close()
+    
+    def get_below(self, chapter: str, percentage: int, include_finished: bool = False) -> List[ChatSessionProgress]:
+        """获取指定章节完成度低于阈值的记录（走 chapter+percentage 索引）"""
+        session = self._get_session()
+        try:
+            query = session.query(ChatSessionProgress).filter(
+                ChatSessionProgress.chapter == chapter,
+                ChatSessionProgress.percentage < percentage
+            )
+            if not include_finished:
+                query = query.join(ChatSession, ChatSession.id == ChatSessionProgress.session_id).filter(
+                    ChatSession.is_finished == False
+                )
+            return query.order_by(ChatSessionProgress.percentage, ChatSessionProgress.updated_at).all()
+        finally:
+            if not self.session:
+                session.close()
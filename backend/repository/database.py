@@ -1,5 +1,7 @@
 from sqlalchemy import create_engine, Index
+from sqlalchemy.pool import NullPool
 from sqlalchemy.orm import sessionmaker, scoped_session
+import threading
 from contextlib import contextmanager
 from .models import Base, ChatSession, ChatQA, ChatQADubious
 from .db_config import DB_CFG
@@ -15,21 +17,52 @@ class DatabaseManager:
             f"@{DB_CFG['host']}:{DB_CFG['port']}/{DB_CFG['database']}"
             f"?charset={DB_CFG['charset']}"
         )
-        
-        # 创建引擎
-        self.engine = create_engine(
-            self.connection_url,
-            echo=False,  # 设置为True可以看到SQL语句
-            pool_recycle=3600,  # 连接池回收时间
-            pool_pre_ping=True,  # 连接前测试
-        )
-        
-        # 创建会话工厂
-        self.SessionLocal = scoped_session(sessionmaker(
-            autocommit=False,
-            autoflush=False,
-            bind=self.engine
-        ))
+        # 引擎和会话工厂在首次使用时创建，导入本模块不加载数据库驱动
+        self._engine = None
+        self._session_factory = None
+        self._lock_engine = None
+        self._lock = threading.Lock()
+    
+    def _init_engine(self):
+        with self._lock:
+            if self._engine is not None:
+                return
+            # 创建引擎
+            engine = create_engine(
+                self.connection_url,
+                echo=False,  # 设置为True可以看到SQL语句
+                pool_recycle=3600,  # 连接池回收时间
+                pool_pre_ping=True,  # 连接前测试
+            )
+            
+            # 创建会话工厂
+            self._session_factory = scoped_session(sessionmaker(
+                autocommit=False,
+                autoflush=False,
+                bind=engine
+            ))
+            self._engine = engine
+    
+    @property
+    def engine(self):
+        if self._engine is None:
+            self._init_engine()
+        return self._engine
+    
+    @property
+    def lock_engine(self):
+        """不使用连接池的引擎，用于长时间持有的命名锁连接，不占用业务连接池"""
+        if self._lock_engine is None:
+            with self._lock:
+                if self._lock_engine is None:
+                    self._lock_engine = create_engine(self.connection_url, echo=False, poolclass=NullPool)
+        return self._lock_engine
+    
+    @property
+    def SessionLocal(self):
+        if self._engine is None:
+            self._init_engine()
+        return self._session_factory
     
     def create_tables(self):
         """创建所有表"""
@@ -0,0 +1,191 @@
+"""报告草稿的版本历史
+
+会话每次生成、重新生成或编辑草稿都记录一个版本（chat_session_draft），chat_session.draft 始终是最新版本。
+版本按行与上一版本做差异，只保存差异并压缩；每 SNAPSHOT_EVERY 个版本保存一次完整内容，
+还原任一版本最多依次应用 SNAPSHOT_EVERY - 1 个差异。
+
+差异格式为 JSON 数组，元素为 [start, end]（沿用上一版本的第 start 到 end 行）或字符串（新增的文本）。
+"""
+import difflib
+import hashlib
+import json
+import zlib
+from itertools import zip_longest
+from typing import List, Optional, Dict, Any
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from .models import ChatSession, ChatSessionDraft
+from .database import db_manager
+
+# 每隔多少个版本保存一次完整内容
+SNAPSHOT_EVERY = 10
+ZLIB_LEVEL = 9
+
+# 草稿来源
+SOURCE_GENERATED = 'generated'
+SOURCE_REGENERATED = 'regenerated'
+SOURCE_EDITED = 'edited'
+SOURCE_IMPORTED = 'imported'
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def encode_delta(base: str, text: str) -> list:
+    """计算 text 相对 base 的按行差异"""
+    base_lines = base.splitlines(keepends=True)
+    lines = text.splitlines(keepends=True)
+    ops = []
+    matcher = difflib.SequenceMatcher(None, base_lines, lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append(''.join(lines[j1:j2]))
+    return ops
+
+
+def apply_delta(base: str, ops: list) -> str:
+    base_lines = base.splitlines(keepends=True)
+    return ''.join(''.join(base_lines[op[0]:op[1]]) if isinstance(op, list) else op for op in ops)
+
+
+def _pack(value) -> bytes:
+    return zlib.compress(json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), ZLIB_LEVEL)
+
+
+def _unpack(data: bytes):
+    return json.loads(zlib.decompress(data))
+
+
+def _reconstruct(db_session: Session, session_id: int, version: int) -> Optional[str]:
+    """从不晚于 version 的最近一个完整版本开始依次应用差异"""
+    snapshot = db_session.query(func.max(ChatSessionDraft.version)).filter(
+        ChatSessionDraft.session_id == session_id,
+        ChatSessionDraft.version <= version,
+        ChatSessionDraft.is_snapshot == True
+    ).scalar()
+    if snapshot is None:
+        return None
+    rows = db_session.query(ChatSessionDraft.version, ChatSessionDraft.is_snapshot, ChatSessionDraft.data).filter(
+        ChatSessionDraft.session_id == session_id,
+        ChatSessionDraft.version >= snapshot,
+        ChatSessionDraft.version <= version
+    ).order_by(ChatSessionDraft.version).all()
+    if not rows or rows[-1].version != version:
+        return None
+
+    text = ''
+    for row in rows:
+        value = _unpack(row.data)
+        text = value if row.is_snapshot else apply_delta(text, value)
+    return text
+
+
+def record_version(db_session: Session, session_id: int, draft: Optional[str],
+                   source: str = SOURCE_GENERATED) -> Optional[int]:
+    """
+    在给定事务内记录一个草稿版本，并更新会话的 draft_version
+    :return: 版本号；草稿为空时返回None，与最新版本相同时不新增版本，返回最新版本号
+    """
+    if not draft:
+        return None
+    latest = db_session.query(ChatSessionDraft).filter(
+        ChatSessionDraft.session_id == session_id
+    ).order_by(ChatSessionDraft.version.desc()).first()
+    digest = _digest(draft)
+    if latest is not None and latest.digest == digest:
+        return latest.version
+
+    version = latest.version + 1 if latest else 1
+    is_snapshot = (version - 1) % SNAPSHOT_EVERY == 0
+    if is_snapshot:
+        data = _pack(draft)
+    else:
+        data = _pack(encode_delta(_reconstruct(db_session, session_id, latest.version) or '', draft))
+
+    db_session.add(ChatSessionDraft(
+        session_id=session_id, version=version, source=source, is_snapshot=is_snapshot,
+        data=data, length=len(draft), digest=digest
+    ))
+    db_session.query(ChatSession).filter(ChatSession.id == session_id).update(
+        {ChatSession.draft_version: version}, synchronize_session=False
+    )
+    return version
+
+
+def list_versions(session_id: int) -> List[Dict[str, Any]]:
+    """会话的全部草稿版本（不含内容），按版本号排序"""
+    with db_manager.get_session() as db_session:
+        rows = db_session.query(
+            ChatSessionDraft.version, ChatSessionDraft.source, ChatSessionDraft.length,
+            ChatSessionDraft.is_snapshot, func.length(ChatSessionDraft.data).label('stored_bytes'),
+            ChatSessionDraft.created_at
+        ).filter(ChatSessionDraft.session_id == session_id).order_by(ChatSessionDraft.version).all()
+    return [
+        {
+            "version": row.version,
+            "source": row.source,
+            "length": row.length,
+            "is_snapshot": bool(row.is_snapshot),
+            "stored_bytes": row.stored_bytes,
+            "created_at": row.created_at,
+        }
+        for row in rows
+    ]
+
+
+def get_version(session_id: int, version: int) -> Optional[str]:
+    """还原指定版本的草稿，版本不存在时返回None"""
+    with db_manager.get_session() as db_session:
+        return _reconstruct(db_session, session_id, version)
+
+
+def diff_versions(session_id: int, from_version: int, to_version: int,
+                  context: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """
+    两个版本的逐行对照
+    :param from_version: 为 0 时与空草稿对照（第一个版本的全部内容都是新增）
+    :param context: 相同的行只在变化处前后各保留 context 行，其余折叠为 skip；为空时保留全部
+    :return: {"rows": [...], "added": 新增行数, "removed": 删除行数}；任一版本不存在时返回None
+    """
+    with db_manager.get_session() as db_session:
+        old = _reconstruct(db_session, session_id, from_version) if from_version else ''
+        new = _reconstruct(db_session, session_id, to_version)
+    if old is None or new is None:
+        return None
+
+    old_lines = old.splitlines()
+    new_lines = new.splitlines()
+    rows = []
+    added = removed = 0
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    opcodes = matcher.get_opcodes()
+    for index, (tag, i1, i2, j1, j2) in enumerate(opcodes):
+        if tag == 'equal':
+            pairs = list(zip(range(i1, i2), range(j1, j2)))
+            if context is not None:
+                head = pairs[:context] if index > 0 else []
+                tail = pairs[-context:] if context and index < len(opcodes) - 1 else []
+                if len(head) + len(tail) < len(pairs):
+                    rows.extend(_row('equal', old_lines, new_lines, i, j) for i, j in head)
+                    rows.append({"tag": "skip", "count": len(pairs) - len(head) - len(tail)})
+                    rows.extend(_row('equal', old_lines, new_lines, i, j) for i, j in tail)
+                    continue
+            rows.extend(_row('equal', old_lines, new_lines, i, j) for i, j in pairs)
+            continue
+        removed += i2 - i1
+        added += j2 - j1
+        for i, j in zip_longest(range(i1, i2), range(j1, j2)):
+            rows.append(_row(tag, old_lines, new_lines, i, j))
+    return {"rows": rows, "added": added, "removed": removed}
+
+
+def _row(tag: str, old_lines: List[str], new_lines: List[str], i: Optional[int], j: Optional[int]) -> Dict[str, Any]:
+    """对照的一行，left / right 为 {"line": 行号（从1开始）, "text": 内容}，该侧没有对应行时为None"""
+    return {
+        "tag": tag,
+        "left": {"line": i + 1, "text": old_lines[i]} if i is not None else None,
+        "right": {"line": j + 1, "text": new_lines[j]} if j is not None else None,
+    }
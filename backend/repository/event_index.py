@@ -0,0 +1,259 @@
+"""跨会话历史事件索引
+
+史实校验模块输出的可疑语句（如"亚洲金融危机"）经归一化后映射到事件词典，
+每个问答与事件之间建立多对多关联，用于按事件、按年代的聚合查询。
+"""
+import re
+import unicodedata
+from typing import List, Optional, Dict, Any
+from sqlalchemy import func, distinct
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from .models import ChatQA, ChatSession, HistoricalEvent, HistoricalEventAlias, ChatQAEvent
+from .database import db_manager
+
+_YEAR_PATTERN = re.compile(r'(1[89]\d\d|20\d\d)\s*年?')
+_LEADING_YEAR_PATTERN = re.compile(r'^(1[89]\d\d|20\d\d)\s*年?\s*')
+_STRIP_CHARS = ' \t\r\n"\'“”‘’「」《》<>。，,.；;：:！!？?'
+
+
+def normalize_alias(text: Optional[str]) -> str:
+    """
+    别名归一化：全半角统一、去除首尾标点；开头的年份保留并统一为 "<年份>年" 的写法，
+    例如 "2008 北京奥运会" 与 "2008年北京奥运会" 相同，而与 "2022年北京奥运会" 是不同的事件
+    """
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKC', text).strip(_STRIP_CHARS).lower()
+    match = _LEADING_YEAR_PATTERN.match(text)
+    if match:
+        rest = text[match.end():].strip(_STRIP_CHARS)
+        if rest:
+            return f"{match.group(1)}年{rest}"[:255]
+    return text[:255]
+
+
+def extract_decade(text: Optional[str]) -> Optional[int]:
+    """提取文本中第一个年份所在的年代，例如 "1998年" -> 1990"""
+    if not text:
+        return None
+    match = _YEAR_PATTERN.search(unicodedata.normalize('NFKC', text))
+    return int(match.group(1)) // 10 * 10 if match else None
+
+
+def resolve_event(db_session: Session, snippet: str) -> Optional[int]:
+    """
+    在给定事务内将可疑语句解析为事件ID，词典中不存在时新建事件及其别名
+    :return: 事件ID；语句为空或别名无法读取时返回None，调用方应跳过该语句
+    """
+    alias = normalize_alias(snippet)
+    if not alias:
+        return None
+
+    event_id = db_session.query(HistoricalEventAlias.event_id).filter(
+        HistoricalEventAlias.alias == alias
+    ).scalar()
+    if event_id is not None:
+        return event_id
+
+    # 并发提交同一新事件时可能触发唯一约束，使用保存点回退后重新查询。
+    # MySQL 默认的 REPEATABLE READ 下普通查询读的是本事务的快照，看不到对方刚提交的别名，
+    # 重新查询使用加锁读（SELECT ... FOR UPDATE），读取最新提交的版本
+    try:
+        with db_session.begin_nested():
+            event = HistoricalEvent(
+                name=unicodedata.normalize('NFKC', snippet).strip(_STRIP_CHARS)[:255],
+                decade=extract_decade(snippet)
+            )
+            db_session.add(event)
+            db_session.flush()
+            db_session.add(HistoricalEventAlias(alias=alias, event_id=event.id))
+            db_session.flush()
+            return event.id
+    except IntegrityError:
+        event_id = db_session.query(HistoricalEventAlias.event_id).filter(
+            HistoricalEventAlias.alias == alias
+        ).with_for_update().scalar()
+        if event_id is None:
+            print(f"事件别名 {alias} 已存在但无法读取，跳过关联")
+        return event_id
+
+
+def link_events(db_session: Session, session_id: int, qa_id: int, snippets: List[str],
+                answer: Optional[str] = None):
+    """在给定事务内为问答建立事件关联"""
+    mention_decade = extract_decade(answer)
+    linked = {
+        event_id for (event_id,) in db_session.query(ChatQAEvent.event_id).filter(
+            ChatQAEvent.qa_id == qa_id
+        )
+    }
+    for snippet in snippets:
+        event_id = resolve_event(db_session, snippet)
+        if event_id is None or event_id in linked:
+            continue
+        db_session.add(ChatQAEvent(qa_id=qa_id, event_id=event_id, session_id=session_id,
+                                   decade=extract_decade(snippet) or mention_decade))
+        linked.add(event_id)
+
+
+def find_events(query: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+    """
+    查询事件词典及各事件的提及次数
+    :param query: 事件名称或别名（模糊匹配），为空时返回提及最多的事件
+    :param limit: 返回条数
+    """
+    with db_manager.get_session() as db_session:
+        mention_count = func.count(ChatQAEvent.id)
+        session_count = func.count(distinct(ChatQAEvent.session_id))
+        rows = (
+            db_session.query(HistoricalEvent.id, HistoricalEvent.name, HistoricalEvent.decade,
+                             mention_count.label('mentions'), session_count.label('sessions'))
+            .outerjoin(ChatQAEvent, ChatQAEvent.event_id == HistoricalEvent.id)
+        )
+        if query:
+            rows = rows.filter(HistoricalEvent.id.in_(_matching_event_ids(db_session, query)))
+        rows = (
+            rows.group_by(HistoricalEvent.id, HistoricalEvent.name, HistoricalEvent.decade)
+            .order_by(mention_count.desc(), HistoricalEvent.id)
+            .limit(limit)
+            .all()
+        )
+        aliases = {}
+        for event_id, alias in db_session.query(HistoricalEventAlias.event_id, HistoricalEventAlias.alias).filter(
+                HistoricalEventAlias.event_id.in_([row[0] for row in rows])):
+            aliases.setdefault(event_id, []).append(alias)
+
+    return [
+        {
+            "id": event_id,
+            "name": name,
+            "decade": decade,
+            "aliases": aliases.get(event_id, []),
+            "mention_count": mentions,
+            "session_count": sessions
+        }
+        for event_id, name, decade, mentions, sessions in rows
+    ]
+
+
+def get_mentions(query: str, limit: int = 200) -> List[Dict[str, Any]]:
+    """获取提及指定事件的所有问答，例如 "加入世贸" """
+    with db_manager.get_session() as db_session:
+        event_ids = _matching_event_ids(db_session, query)
+        rows = (
+            db_session.query(ChatQAEvent.session_id, ChatQAEvent.qa_id, ChatQAEvent.decade,
+                             HistoricalEvent.id, HistoricalEvent.name, ChatQA.question, ChatQA.answer,
+                             ChatSession.is_finished)
+            .join(HistoricalEvent, HistoricalEvent.id == ChatQAEvent.event_id)
+            .join(ChatQA, ChatQA.id == ChatQAEvent.qa_id)
+            .join(ChatSession, ChatSession.id == ChatQAEvent.session_id)
+            .filter(ChatQAEvent.event_id.in_(event_ids))
+            .order_by(ChatQAEvent.session_id, ChatQAEvent.qa_id)
+            .limit(limit)
+            .all()
+        )
+
+    return [
+        {
+            "session_id": session_id,
+            "qa_id": qa_id,
+            "event_id": event_id,
+            "event_name": event_name,
+            "decade": decade,
+            "question": question,
+            "answer": answer,
+            "is_finished": is_finished
+        }
+        for session_id, qa_id, decade, event_id, event_name, question, answer, is_finished in rows
+    ]
+
+
+def get_decade_stats() -> List[Dict[str, Any]]:
+    """按年代统计事件提及次数（事件无年代时使用回答中提到的年代）"""
+    with db_manager.get_session() as db_session:
+        decade = func.coalesce(HistoricalEvent.decade, ChatQAEvent.decade)
+        rows = (
+            db_session.query(decade.label('decade'), func.count(ChatQAEvent.id),
+                             func.count(distinct(ChatQAEvent.event_id)),
+                             func.count(distinct(ChatQAEvent.session_id)))
+            .join(HistoricalEvent, HistoricalEvent.id == ChatQAEvent.event_id)
+            .group_by(decade)
+            .order_by(decade)
+            .all()
+        )
+
+    return [
+        {
+            "decade": decade_value,
+            "mention_count": mentions,
+            "event_count": events,
+            "session_count": sessions
+        }
+        for decade_value, mentions, events, sessions in rows
+    ]
+
+
+def add_alias(event_id: int, alias: str) -> bool:
+    """
+    为事件添加别名；若该别名已属于其他事件，则将那个事件合并到当前事件
+    :return: 事件不存在或别名为空时返回False
+    """
+    normalized = normalize_alias(alias)
+    if not normalized:
+        return False
+
+    with db_manager.get_session() as db_session:
+        if not db_session.query(HistoricalEvent.id).filter(HistoricalEvent.id == event_id).scalar():
+            return False
+
+        existing = db_session.query(HistoricalEventAlias).filter(
+            HistoricalEventAlias.alias == normalized
+        ).first()
+        if existing is None:
+            db_session.add(HistoricalEventAlias(alias=normalized, event_id=event_id))
+            return True
+        if existing.event_id != event_id:
+            _merge_event(db_session, existing.event_id, event_id)
+        return True
+
+
+def _merge_event(db_session: Session, source_id: int, target_id: int):
+    """将 source 事件的别名和关联全部转移到 target 事件并删除 source"""
+    db_session.query(HistoricalEventAlias).filter(
+        HistoricalEventAlias.event_id == source_id
+    ).update({HistoricalEventAlias.event_id: target_id}, synchronize_session=False)
+
+    # 同一问答已关联 target 的，删除重复关联
+    target_qa_ids = [
+        qa_id for (qa_id,) in db_session.query(ChatQAEvent.qa_id).filter(ChatQAEvent.event_id == target_id)
+    ]
+    if target_qa_ids:
+        db_session.query(ChatQAEvent).filter(
+            ChatQAEvent.event_id == source_id, ChatQAEvent.qa_id.in_(target_qa_ids)
+        ).delete(synchronize_session=False)
+    db_session.query(ChatQAEvent).filter(
+        ChatQAEvent.event_id == source_id
+    ).update({ChatQAEvent.event_id: target_id}, synchronize_session=False)
+
+    db_session.query(HistoricalEvent).filter(HistoricalEvent.id == source_id).delete(synchronize_session=False)
+
+
+def _matching_event_ids(db_session: Session, query: str) -> List[int]:
+    """按别名匹配事件：优先精确匹配，否则模糊匹配"""
+    normalized = normalize_alias(query)
+    if not normalized:
+        return []
+    event_ids = [
+        event_id for (event_id,) in db_session.query(HistoricalEventAlias.event_id).filter(
+            HistoricalEventAlias.alias == normalized
+        )
+    ]
+    if event_ids:
+        return event_ids
+    escaped = normalized.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return list({
+        event_id for (event_id,) in db_session.query(HistoricalEventAlias.event_id).filter(
+            HistoricalEventAlias.alias.like(f'%{escaped}%', escape='\\')
+        )
+    })
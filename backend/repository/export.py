@@ -0,0 +1,174 @@
+"""会话数据批量导出（NDJSON / Parquet）
+
+通过服务端游标分批读取，按块写出，内存占用与数据总量无关。
+
+命令行用法（在 backend 目录下执行）：
+    python -m repository.export --format ndjson --output ./export
+    python -m repository.export --format parquet --output ./export --tables qas dubious
+"""
+import argparse
+import json
+import os
+from datetime import datetime
+from typing import Dict, Any, Generator, Iterable, List, Optional
+from .models import ChatSession, ChatQA, ChatQADubious
+from .database import db_manager
+
+# 每批从数据库读取的行数，也是 Parquet 每个行组的大小
+DEFAULT_BATCH_SIZE = 1000
+
+# 导出表定义：名称 -> (模型, 导出字段)
+EXPORT_TABLES = {
+    'sessions': (ChatSession, ['id', 'created_at', 'updated_at', 'is_finished', 'qa_count',
+                               'dubious_count', 'last_qa_id', 'progress', 'prompt_tokens',
+                               'completion_tokens', 'token_cost', 'draft']),
+    'qas': (ChatQA, ['id', 'session_id', 'question', 'answer', 'aim', 'emotion', 'progress',
+                     'prompt_version', 'prompt_tokens', 'completion_tokens', 'token_cost',
+                     'created_at', 'updated_at']),
+    'dubious': (ChatQADubious, ['id', 'qa_id', 'snippet']),
+}
+
+EXPORT_FORMATS = ('ndjson', 'parquet')
+
+
+def iter_rows(table: str, batch_size: int = DEFAULT_BATCH_SIZE) -> Generator[List[Dict[str, Any]], None, None]:
+    """使用服务端游标按批次读取指定表，每次产出一批字典"""
+    model, fields = EXPORT_TABLES[table]
+    columns = [getattr(model, field) for field in fields]
+    with db_manager.get_session() as db_session:
+        result = (
+            db_session.query(*columns)
+            .order_by(model.id)
+            .yield_per(batch_size)  # 启用服务端游标（stream_results），不一次性载入结果集
+        )
+        batch = []
+        for row in result:
+            batch.append(dict(zip(fields, row)))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+def stream_ndjson(tables: Iterable[str], batch_size: int = DEFAULT_BATCH_SIZE) -> Generator[bytes, None, None]:
+    """以 NDJSON 格式流式导出，每行带 table 字段标识来源表"""
+    for table in tables:
+        for batch in iter_rows(table, batch_size):
+            lines = [
+                json.dumps({"table": table, **row}, ensure_ascii=False, default=_json_default)
+                for row in batch
+            ]
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def parquet_available() -> bool:
+    """是否安装了 Parquet 导出所需的 pyarrow"""
+    try:
+        import pyarrow.parquet  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def stream_parquet(table: str, batch_size: int = DEFAULT_BATCH_SIZE) -> Generator[bytes, None, None]:
+    """以 Parquet 格式流式导出单张表，每批数据写为一个行组后立即产出"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet 导出需要安装 pyarrow")
+
+    schema = _arrow_schema(pa, table)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+    try:
+        for batch in iter_rows(table, batch_size):
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    finally:
+        writer.close()
+    chunk = sink.drain()
+    if chunk:
+        yield chunk
+
+
+def export_to_directory(output_dir: str, export_format: str = 'ndjson',
+                        tables: Optional[List[str]] = None,
+                        batch_size: int = DEFAULT_BATCH_SIZE) -> List[str]:
+    """
+    导出到目录，每张表一个文件
+    :return: 写出的文件路径列表
+    """
+    tables = tables or list(EXPORT_TABLES)
+    os.makedirs(output_dir, exist_ok=True)
+
+    paths = []
+    for table in tables:
+        path = os.path.join(output_dir, f"{table}.{export_format}")
+        chunks = stream_ndjson([table], batch_size) if export_format == 'ndjson' else stream_parquet(table, batch_size)
+        with open(path, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        print(f"已导出 {table} -> {path}")
+        paths.append(path)
+    return paths
+
+
+class _ChunkSink:
+    """只追加的内存写出目标，ParquetWriter 写入后由调用方取走已写出的字节"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def _arrow_schema(pa, table: str):
+    """导出表对应的 Arrow 模式"""
+    types = {
+        'id': pa.int64(), 'session_id': pa.int64(), 'qa_id': pa.int64(), 'last_qa_id': pa.int64(),
+        'qa_count': pa.int32(), 'dubious_count': pa.int32(),
+        'prompt_tokens': pa.int64(), 'completion_tokens': pa.int64(), 'token_cost': pa.float64(),
+        'is_finished': pa.bool_(),
+        'created_at': pa.timestamp('s'), 'updated_at': pa.timestamp('s'),
+    }
+    _, fields = EXPORT_TABLES[table]
+    return pa.schema([(field, types.get(field, pa.string())) for field in fields])
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"无法序列化的类型: {type(value)}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="批量导出会话、问答和可疑语句")
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='ndjson')
+    parser.add_argument('--output', default='export')
+    parser.add_argument('--tables', nargs='*', choices=list(EXPORT_TABLES))
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+    export_to_directory(args.output, args.format, args.tables, args.batch_size)
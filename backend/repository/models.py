@@ -1,4 +1,4 @@
-from sqlalchemy import Column, BigInteger, DateTime, Text, VARCHAR, Boolean, ForeignKey, create_engine
+from sqlalchemy import Column, BigInteger, Integer, DateTime, Text, VARCHAR, Boolean, Float, ForeignKey, Enum, Index, UniqueConstraint, LargeBinary, create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
 from sqlalchemy.sql import func
@@ -7,6 +7,9 @@ from typing import List
 
 Base = declarative_base()
 
+# 采访章节（与 service/progress_module.CHAPTERS 保持一致）
+PROGRESS_CHAPTERS = ('序章', '时代篇', '精神篇', '终章')
+
 
 class ChatSession(Base):
     """对话窗口主表"""
@@ -19,8 +22,20 @@ class ChatSession(Base):
     is_finished = Column(Boolean, nullable=False, default=False)
     draft = Column(Text, nullable=True)
     
+    # 冗余统计字段，随每轮对话提交在同一事务内更新，存量数据见 repository/backfill.py
+    qa_count = Column(Integer, nullable=False, default=0)
+    dubious_count = Column(Integer, nullable=False, default=0)
+    last_qa_id = Column(BigInteger, nullable=True)  # 最新问答记录ID（不设外键，避免与chat_qa循环依赖）
+    progress = Column(Text, nullable=True)  # 最近一次的进度描述
+    prompt_tokens = Column(BigInteger, nullable=False, default=0)  # 累计输入 token
+    completion_tokens = Column(BigInteger, nullable=False, default=0)  # 累计输出 token
+    token_cost = Column(Float, nullable=False, default=0)  # 累计费用（元）
+    draft_version = Column(Integer, nullable=False, default=0)  # 最新草稿版本号，历史版本见 chat_session_draft
+    archived_at = Column(DateTime, nullable=True)  # 归档时间，问答和草稿已移入 chat_session_archive（见 repository/archive.py）
+    
     # 关联关系
     chat_qas = relationship("ChatQA", back_populates="session", cascade="all, delete-orphan")
+    progress_records = relationship("ChatSessionProgress", back_populates="session", cascade="all, delete-orphan")
     
     def __repr__(self):
         return f"<ChatSession(id={self.id}, created_at={self.created_at}, is_finished={self.is_finished})>"
@@ -37,6 +52,13 @@ class ChatQA(Base):
     aim = Column(VARCHAR(255), nullable=True)
     emotion = Column(VARCHAR(50), nullable=True)
     progress = Column(Text, nullable=True)
+    # 处理该问答回答时使用的提示词版本，例如 "check:control:1a2b3c4d5e6f;talk:control:3f2a9c1b7d4e"
+    prompt_version = Column(VARCHAR(255), nullable=True)
+    # 处理该问答回答时的 token 用量和费用，token_detail 为按阶段（check / talk / summary）的明细 JSON
+    prompt_tokens = Column(Integer, nullable=True)
+    completion_tokens = Column(Integer, nullable=True)
+    token_cost = Column(Float, nullable=True)
+    token_detail = Column(Text, nullable=True)
     created_at = Column(DateTime, nullable=False, default=func.current_timestamp())
     updated_at = Column(DateTime, nullable=False, default=func.current_timestamp(), 
                        onupdate=func.current_timestamp())
@@ -61,4 +83,162 @@ class ChatQADubious(Base):
     qa = relationship("ChatQA", back_populates="dubious_records")
     
     def __repr__(self):
-        return f"<ChatQADubious(id={self.id}, qa_id={self.qa_id}, snippet={self.snippet[:50]}...)>"
\ No newline at end of file
+        return f"<ChatQADubious(id={self.id}, qa_id={self.qa_id}, snippet={self.snippet[:50]}...)>"
+
+
+class ChatSessionProgress(Base):
+    """会话分章节完成度表（由进度描述解析而来，每个会话每个章节一行）"""
+    __tablename__ = 'chat_session_progress'
+    __table_args__ = (
+        UniqueConstraint('session_id', 'chapter', name='uq_progress_session_chapter'),
+        Index('idx_progress_chapter_percentage', 'chapter', 'percentage'),
+    )
+    
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    session_id = Column(BigInteger, ForeignKey('chat_session.id', ondelete='CASCADE'), nullable=False)
+    chapter = Column(Enum(*PROGRESS_CHAPTERS, name='progress_chapter'), nullable=False)
+    percentage = Column(Integer, nullable=False, default=0)
+    missing = Column(VARCHAR(255), nullable=True)  # 缺失的判定条件
+    detail = Column(Text, nullable=True)  # 模型给出的完整说明
+    qa_id = Column(BigInteger, nullable=True)  # 最近一次更新该章节的问答记录ID
+    updated_at = Column(DateTime, nullable=False, default=func.current_timestamp(), 
+                       onupdate=func.current_timestamp())
+    
+    # 关联关系
+    session = relationship("ChatSession", back_populates="progress_records")
+    
+    def __repr__(self):
+        return f"<ChatSessionProgress(session_id={self.session_id}, chapter={self.chapter}, percentage={self.percentage})>"
+
+
+
+class ChatSessionDraft(Base):
+    """报告草稿版本表（完整内容或相对上一版本的差异，压缩存储，见 repository/draft_history.py）"""
+    __tablename__ = 'chat_session_draft'
+    __table_args__ = (
+        UniqueConstraint('session_id', 'version', name='uq_draft_session_version'),
+    )
+    
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    session_id = Column(BigInteger, ForeignKey('chat_session.id', ondelete='CASCADE'), nullable=False)
+    version = Column(Integer, nullable=False)  # 从 1 开始
+    source = Column(VARCHAR(16), nullable=False)  # generated / regenerated / edited / imported
+    is_snapshot = Column(Boolean, nullable=False, default=False)  # 完整内容（否则为差异）
+    data = Column(LargeBinary(length=2 ** 24 - 1), nullable=False)  # MySQL 中为 MEDIUMBLOB
+    length = Column(Integer, nullable=False, default=0)  # 草稿字符数
+    digest = Column(VARCHAR(64), nullable=False)  # 草稿内容的 SHA-256，内容未变化时不新增版本
+    created_at = Column(DateTime, nullable=False, default=func.current_timestamp())
+    
+    def __repr__(self):
+        return f"<ChatSessionDraft(session_id={self.session_id}, version={self.version}, source={self.source})>"
+
+
+class ChatSessionArchive(Base):
+    """已归档会话的压缩数据（问答、可疑语句、问答-事件关联和草稿），每个会话一行"""
+    __tablename__ = 'chat_session_archive'
+    
+    session_id = Column(BigInteger, ForeignKey('chat_session.id', ondelete='CASCADE'), primary_key=True)
+    codec = Column(VARCHAR(16), nullable=False)  # zstd / zlib
+    payload = Column(LargeBinary(length=2 ** 32 - 1), nullable=False)  # MySQL 中为 LONGBLOB
+    raw_size = Column(Integer, nullable=False)  # 压缩前的字节数
+    qa_count = Column(Integer, nullable=False, default=0)
+    archived_at = Column(DateTime, nullable=False, default=func.current_timestamp())
+    
+    def __repr__(self):
+        return f"<ChatSessionArchive(session_id={self.session_id}, codec={self.codec}, raw_size={self.raw_size})>"
+
+
+class SearchDocument(Base):
+    """全文检索文档表（回答、草稿、可疑语句各自作为一个文档）"""
+    __tablename__ = 'search_document'
+    __table_args__ = (
+        UniqueConstraint('doc_type', 'doc_id', name='uq_search_document'),
+        Index('idx_search_document_session', 'session_id'),
+    )
+    
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    doc_type = Column(VARCHAR(16), nullable=False)  # answer / draft / dubious
+    doc_id = Column(BigInteger, nullable=False)  # 对应 chat_qa / chat_session / chat_qa_dubious 的ID
+    session_id = Column(BigInteger, nullable=False)
+    length = Column(Integer, nullable=False, default=0)  # 词元数量，用于BM25长度归一化
+    
+    # 关联关系
+    postings = relationship("SearchPosting", back_populates="document", cascade="all, delete-orphan")
+    
+    def __repr__(self):
+        return f"<SearchDocument(doc_type={self.doc_type}, doc_id={self.doc_id}, session_id={self.session_id})>"
+
+
+class SearchPosting(Base):
+    """倒排索引表（词元 -> 文档）"""
+    __tablename__ = 'search_posting'
+    __table_args__ = (
+        Index('idx_posting_token', 'token'),
+        Index('idx_posting_document', 'document_id'),
+    )
+    
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    token = Column(VARCHAR(32), nullable=False)
+    document_id = Column(BigInteger, ForeignKey('search_document.id', ondelete='CASCADE'), nullable=False)
+    tf = Column(Integer, nullable=False, default=1)  # 词元在文档中的出现次数
+    
+    # 关联关系
+    document = relationship("SearchDocument", back_populates="postings")
+    
+    def __repr__(self):
+        return f"<SearchPosting(token={self.token}, document_id={self.document_id}, tf={self.tf})>"
+
+
+
+class HistoricalEvent(Base):
+    """历史事件词典表（由可疑语句归一化而来）"""
+    __tablename__ = 'historical_event'
+    
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    name = Column(VARCHAR(255), nullable=False, unique=True)  # 规范名称
+    decade = Column(Integer, nullable=True)  # 事件所属年代，例如 1990；名称中无年份时为空
+    created_at = Column(DateTime, nullable=False, default=func.current_timestamp())
+    
+    # 关联关系
+    aliases = relationship("HistoricalEventAlias", back_populates="event", cascade="all, delete-orphan")
+    qa_links = relationship("ChatQAEvent", back_populates="event", cascade="all, delete-orphan")
+    
+    def __repr__(self):
+        return f"<HistoricalEvent(id={self.id}, name={self.name}, decade={self.decade})>"
+
+
+class HistoricalEventAlias(Base):
+    """历史事件别名表（归一化后的别名 -> 事件）"""
+    __tablename__ = 'historical_event_alias'
+    
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    alias = Column(VARCHAR(255), nullable=False, unique=True)
+    event_id = Column(BigInteger, ForeignKey('historical_event.id', ondelete='CASCADE'), nullable=False)
+    
+    # 关联关系
+    event = relationship("HistoricalEvent", back_populates="aliases")
+    
+    def __repr__(self):
+        return f"<HistoricalEventAlias(alias={self.alias}, event_id={self.event_id})>"
+
+
+class ChatQAEvent(Base):
+    """问答-历史事件关联表"""
+    __tablename__ = 'chat_qa_event'
+    __table_args__ = (
+        UniqueConstraint('qa_id', 'event_id', name='uq_qa_event'),
+        Index('idx_qa_event_event', 'event_id'),
+        Index('idx_qa_event_session', 'session_id'),
+    )
+    
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    qa_id = Column(BigInteger, ForeignKey('chat_qa.id', ondelete='CASCADE'), nullable=False)
+    event_id = Column(BigInteger, ForeignKey('historical_event.id', ondelete='CASCADE'), nullable=False)
+    session_id = Column(BigInteger, nullable=False)
+    decade = Column(Integer, nullable=True)  # 受访者回答中提到的年代，事件本身无年代时用于统计
+    
+    # 关联关系
+    event = relationship("HistoricalEvent", back_populates="qa_links")
+    
+    def __repr__(self):
+        return f"<ChatQAEvent(qa_id={self.qa_id}, event_id={self.event_id})>"
@@ -0,0 +1,226 @@
+"""全文检索：基于二元分词（bigram）的倒排索引
+
+中文文本按连续汉字切分为二元词元，英文和数字按整词切分，
+索引随每轮对话提交增量更新，检索时按 BM25 打分。
+"""
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import List, Optional, Dict, Any, Iterable
+from sqlalchemy import func, case, distinct
+from sqlalchemy.orm import Session
+from .models import ChatSession, ChatQA, ChatQADubious, SearchDocument, SearchPosting
+from .database import db_manager
+
+DOC_TYPES = ('answer', 'draft', 'dubious')
+
+# BM25 参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+MAX_TOKEN_LENGTH = 32
+SNIPPET_RADIUS = 40
+
+_CJK_RUN = r'[㐀-䶿一-鿿豈-﫿]+'
+_TOKEN_PATTERN = re.compile(_CJK_RUN + r'|[a-z0-9]+')
+_CJK_PATTERN = re.compile(_CJK_RUN)
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """将文本切分为词元：汉字按二元切分（单字保留单字），英文数字按整词"""
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKC', text).lower()
+    tokens = []
+    for run in _TOKEN_PATTERN.findall(text):
+        if _CJK_PATTERN.fullmatch(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run[:MAX_TOKEN_LENGTH])
+    return tokens
+
+
+def index_document(db_session: Session, doc_type: str, doc_id: int, session_id: int,
+                   text: Optional[str]):
+    """在给定事务内写入（或覆盖）一个文档的索引"""
+    remove_document(db_session, doc_type, doc_id)
+    tokens = tokenize(text)
+    if not tokens:
+        return
+
+    document = SearchDocument(doc_type=doc_type, doc_id=doc_id, session_id=session_id,
+                              length=len(tokens))
+    db_session.add(document)
+    db_session.flush()
+    db_session.add_all([
+        SearchPosting(token=token, document_id=document.id, tf=tf)
+        for token, tf in Counter(tokens).items()
+    ])
+
+
+def remove_document(db_session: Session, doc_type: str, doc_id: int):
+    """在给定事务内删除一个文档的索引"""
+    document_ids = [
+        document_id for (document_id,) in db_session.query(SearchDocument.id).filter(
+            SearchDocument.doc_type == doc_type, SearchDocument.doc_id == doc_id
+        )
+    ]
+    if not document_ids:
+        return
+    db_session.query(SearchPosting).filter(
+        SearchPosting.document_id.in_(document_ids)
+    ).delete(synchronize_session=False)
+    db_session.query(SearchDocument).filter(
+        SearchDocument.id.in_(document_ids)
+    ).delete(synchronize_session=False)
+
+
+def remove_session(db_session: Session, session_id: int):
+    """在给定事务内删除一个会话的全部文档索引（回答、草稿、可疑语句）"""
+    document_ids = [
+        document_id for (document_id,) in db_session.query(SearchDocument.id).filter(
+            SearchDocument.session_id == session_id
+        )
+    ]
+    if not document_ids:
+        return
+    db_session.query(SearchPosting).filter(
+        SearchPosting.document_id.in_(document_ids)
+    ).delete(synchronize_session=False)
+    db_session.query(SearchDocument).filter(
+        SearchDocument.id.in_(document_ids)
+    ).delete(synchronize_session=False)
+
+
+def search(query: str, doc_types: Optional[Iterable[str]] = None, limit: int = 20) -> List[Dict[str, Any]]:
+    """
+    检索回答、草稿和可疑语句
+    :param query: 检索词
+    :param doc_types: 限定文档类型，默认全部
+    :param limit: 返回条数（不少于 1）
+    :return: 按相关度排序的命中列表，包含 doc_type / doc_id / session_id / qa_id / score / snippet
+    """
+    query_tokens = list(dict.fromkeys(tokenize(query)))
+    if not query_tokens or limit < 1:
+        return []
+    doc_types = [doc_type for doc_type in (doc_types or DOC_TYPES) if doc_type in DOC_TYPES]
+
+    with db_manager.get_session() as db_session:
+        document_count, average_length = db_session.query(
+            func.count(SearchDocument.id), func.avg(SearchDocument.length)
+        ).one()
+        if not document_count:
+            return []
+        average_length = float(average_length or 1)
+
+        # 各词元的文档频率 -> IDF
+        document_frequency = dict(
+            db_session.query(SearchPosting.token, func.count(SearchPosting.id))
+            .filter(SearchPosting.token.in_(query_tokens))
+            .group_by(SearchPosting.token)
+        )
+        if not document_frequency:
+            return []
+        idf = {
+            token: math.log(1 + (document_count - df + 0.5) / (df + 0.5))
+            for token, df in document_frequency.items()
+        }
+
+        # BM25: idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len / avg_len))
+        term_score = case(idf, value=SearchPosting.token, else_=0.0) * SearchPosting.tf * (BM25_K1 + 1) / (
+            SearchPosting.tf + BM25_K1 * (1 - BM25_B + BM25_B * SearchDocument.length / average_length)
+        )
+        matched = func.count(distinct(SearchPosting.token))
+        score = func.sum(term_score)
+        rows = (
+            db_session.query(SearchDocument.doc_type, SearchDocument.doc_id, SearchDocument.session_id,
+                             matched.label('matched'), score.label('score'))
+            .join(SearchPosting, SearchPosting.document_id == SearchDocument.id)
+            .filter(SearchPosting.token.in_(list(idf)), SearchDocument.doc_type.in_(doc_types))
+            .group_by(SearchDocument.id, SearchDocument.doc_type, SearchDocument.doc_id, SearchDocument.session_id)
+            # 命中词元越多越靠前，其次按BM25得分
+            .order_by(matched.desc(), score.desc())
+            .limit(limit)
+            .all()
+        )
+
+        texts = _load_texts(db_session, rows)
+
+    hits = []
+    for doc_type, doc_id, session_id, matched_count, hit_score in rows:
+        text, qa_id = texts.get((doc_type, doc_id), (None, None))
+        if text is None:
+            continue
+        hits.append({
+            "doc_type": doc_type,
+            "doc_id": doc_id,
+            "session_id": session_id,
+            "qa_id": qa_id,
+            "score": round(float(hit_score or 0), 4),
+            "matched": matched_count,
+            "snippet": make_snippet(text, query, query_tokens)
+        })
+    return hits
+
+
+def _load_texts(db_session: Session, rows) -> Dict[tuple, tuple]:
+    """批量读取命中文档的原文，返回 {(doc_type, doc_id): (text, qa_id)}"""
+    ids = {doc_type: [] for doc_type in DOC_TYPES}
+    for doc_type, doc_id, *_ in rows:
+        ids[doc_type].append(doc_id)
+
+    texts = {}
+    if ids['answer']:
+        for qa_id, answer in db_session.query(ChatQA.id, ChatQA.answer).filter(ChatQA.id.in_(ids['answer'])):
+            texts[('answer', qa_id)] = (answer, qa_id)
+    if ids['draft']:
+        for session_id, draft in db_session.query(ChatSession.id, ChatSession.draft).filter(
+                ChatSession.id.in_(ids['draft'])):
+            texts[('draft', session_id)] = (draft, None)
+    if ids['dubious']:
+        for dubious_id, qa_id, snippet in db_session.query(
+                ChatQADubious.id, ChatQADubious.qa_id, ChatQADubious.snippet).filter(
+                ChatQADubious.id.in_(ids['dubious'])):
+            texts[('dubious', dubious_id)] = (snippet, qa_id)
+    return texts
+
+
+def _clusters(text: str) -> Iterable[tuple]:
+    """将文本切分为 (起始位置, 组合字符簇)：基字符连同其后规范化为组合符号的字符"""
+    start = 0
+    for index in range(1, len(text) + 1):
+        if index < len(text) and unicodedata.combining(unicodedata.normalize('NFKC', text[index])[:1] or ' '):
+            continue
+        yield start, text[start:index]
+        start = index
+
+
+def make_snippet(text: str, query: str, query_tokens: List[str], radius: int = SNIPPET_RADIUS) -> str:
+    """截取命中位置附近的文本片段，优先定位完整检索词，其次定位第一个命中的词元"""
+    # 按组合字符簇规范化并记录每个规范化字符对应的原文位置（NFKC 可能改变长度，例如 ㍿），在原文上截取；
+    # 基字符和其后的组合符号（含半角浊音符 ﾞ、ﾟ，规范化后为组合用浊点）作为一簇一起规范化，ｶﾞ 才能合成 ガ
+    normalized_chars, offsets = [], []
+    for start_index, cluster in _clusters(text):
+        folded = unicodedata.normalize('NFKC', cluster).lower()
+        normalized_chars.append(folded)
+        offsets.extend([start_index] * len(folded))
+    normalized = ''.join(normalized_chars)
+    position = normalized.find(unicodedata.normalize('NFKC', query).lower().strip())
+    if position < 0:
+        positions = [normalized.find(token) for token in query_tokens]
+        positions = [p for p in positions if p >= 0]
+        position = min(positions) if positions else 0
+    position = offsets[position] if position < len(offsets) else 0
+
+    start = max(0, position - radius)
+    end = min(len(text), position + radius)
+    snippet = text[start:end].replace('\n', ' ')
+    if start > 0:
+        snippet = '…' + snippet
+    if end < len(text):
+        snippet = snippet + '…'
+    return snippet
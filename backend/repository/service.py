@@ -1,8 +1,12 @@
-from typing import List, Optional, Dict
-from sqlalchemy.orm import Session
-from .models import ChatSession, ChatQA, ChatQADubious
-from .dao_impl import ChatSessionDAO, ChatQADAO, ChatQADubiousDAO
+import json
+from datetime import datetime
+from typing import List, Optional, Dict, Any, Tuple
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import func
+from .models import ChatSession, ChatQA, ChatQADubious, ChatSessionProgress
+from .dao_impl import ChatSessionDAO, ChatQADAO, ChatQADubiousDAO, ChatSessionProgressDAO
 from .database import db_manager
+from . import search_index, event_index, archive, draft_history
 
 
 class ChatService:
@@ -12,6 +16,7 @@ class ChatService:
         self.session_dao = ChatSessionDAO()
         self.qa_dao = ChatQADAO()
         self.dubious_dao = ChatQADubiousDAO()
+        self.progress_dao = ChatSessionProgressDAO()
     
     def create_new_session(self, draft: Optional[str] = None) -> ChatSession:
         """创建新的对话会话"""
@@ -24,36 +29,49 @@ class ChatService:
     def add_qa_to_session(self, session_id: int, question: Optional[str] = None, 
                          answer: Optional[str] = None, aim: Optional[str] = None, 
                          emotion: Optional[str] = None, progress: Optional[str] = None) -> ChatQA:
-        """向会话添加问答记录"""
-        qa = ChatQA(
-            session_id=session_id,
-            question=question,
-            answer=answer,
-            aim=aim,
-            emotion=emotion,
-            progress=progress
-        )
-        return self.qa_dao.create(qa)
+        """向会话添加问答记录（同步更新会话统计字段）"""
+        with db_manager.get_session() as db_session:
+            qa = ChatQA(
+                session_id=session_id,
+                question=question,
+                answer=answer,
+                aim=aim,
+                emotion=emotion,
+                progress=progress
+            )
+            db_session.add(qa)
+            db_session.flush()
+            qa_id = qa.id
+            
+            self._apply_session_counters(db_session, session_id, qa_delta=1,
+                                         last_qa_id=qa_id, progress=progress)
+        
+        return self.qa_dao.get_by_id(qa_id)
     
     def add_dubious_snippets(self, qa_id: int, snippets: List[str]) -> List[ChatQADubious]:
-        """批量添加可疑语句"""
-        dubious_records = [
-            ChatQADubious(qa_id=qa_id, snippet=snippet)
-            for snippet in snippets
-        ]
-        return self.dubious_dao.create_batch(dubious_records)
+        """批量添加可疑语句（同一事务内更新会话统计字段、全文索引和历史事件索引）
+        
+        Raises:
+            ValueError: 问答不存在
+        """
+        with db_manager.get_session() as db_session:
+            qa = db_session.query(ChatQA).filter(ChatQA.id == qa_id).first()
+            if not qa:
+                raise ValueError(f"问答 {qa_id} 不存在")
+            records = self._add_dubious(db_session, qa.session_id, qa_id, snippets, qa.answer)
+            self._apply_session_counters(db_session, qa.session_id, dubious_delta=len(records))
+            record_ids = [record.id for record in records]
+        
+        return [self.dubious_dao.get_by_id(record_id) for record_id in record_ids]
     
     def complete_qa_interaction(self, session_id: int, question: str, answer: str,
                                aim: Optional[str] = None, emotion: Optional[str] = None,
                                dubious_snippets: Optional[List[str]] = None,
-                               progress: Optional[str] = None) -> ChatQA:
+                               progress: Optional[str] = None,
+                               progress_items: Optional[List[Dict[str, Any]]] = None) -> ChatQA:
         """完成一次完整的问答交互（包含可疑语句）"""
         # 使用事务确保数据一致性
         with db_manager.get_session() as db_session:
-            # 使用同一个session的DAO实例
-            qa_dao = ChatQADAO(db_session)
-            dubious_dao = ChatQADubiousDAO(db_session)
-            
             # 创建问答记录
             qa = ChatQA(
                 session_id=session_id,
@@ -63,35 +81,294 @@ class ChatService:
                 emotion=emotion,
                 progress=progress
             )
-            qa = qa_dao.create(qa)
+            db_session.add(qa)
+            db_session.flush()
             
             # 记录qa的id，用于后续返回
             qa_id = qa.id
             
             # 如果有可疑语句，批量创建
             if dubious_snippets:
-                dubious_records = [
-                    ChatQADubious(qa_id=qa_id, snippet=snippet)
-                    for snippet in dubious_snippets
-                ]
-                dubious_dao.create_batch(dubious_records)
+                self._add_dubious(db_session, session_id, qa_id, dubious_snippets, answer)
+            
+            search_index.index_document(db_session, 'answer', qa_id, session_id, answer)
+            
+            if progress_items:
+                self._upsert_progress(db_session, session_id, qa_id, progress_items)
+            
+            self._apply_session_counters(db_session, session_id, qa_delta=1,
+                                         dubious_delta=len(dubious_snippets or []),
+                                         last_qa_id=qa_id, progress=progress)
         
         # 在事务外重新获取对象，避免detached状态
         return self.qa_dao.get_by_id(qa_id)
     
+    def commit_turn(self, session_id: int, qa_id: int, answer: str,
+                    emotion: Optional[str] = None, progress: Optional[str] = None,
+                    dubious_snippets: Optional[List[str]] = None,
+                    progress_items: Optional[List[Dict[str, Any]]] = None,
+                    is_finished: bool = False, draft: Optional[str] = None,
+                    next_question: Optional[str] = None,
+                    next_aim: Optional[str] = None,
+                    prompt_version: Optional[str] = None,
+                    token_summary: Optional[Dict[str, Any]] = None) -> Optional[ChatQA]:
+        """提交一轮对话
+        
+        在同一事务内完成：回填当前问答的回答/情绪/进度、保存可疑语句、
+        更新分章节完成度、结束会话或创建下一个待回答的问答记录，并同步会话统计字段。
+        
+        Returns:
+            Optional[ChatQA]: 新创建的下一个问答记录；会话结束时返回None
+            
+        Raises:
+            ValueError: 问答不存在或已有回答（不覆盖已提交的回答）
+        """
+        with db_manager.get_session() as db_session:
+            qa = db_session.query(ChatQA).filter(
+                ChatQA.id == qa_id, ChatQA.session_id == session_id
+            ).with_for_update().first()
+            if not qa or qa.answer is not None:
+                raise ValueError(f"问答 {qa_id} 不存在或已有回答")
+            
+            qa.answer = answer
+            qa.emotion = emotion
+            qa.progress = progress
+            qa.prompt_version = prompt_version
+            token_summary = token_summary or {}
+            self._set_qa_tokens(qa, token_summary)
+            
+            if dubious_snippets:
+                self._add_dubious(db_session, session_id, qa_id, dubious_snippets, answer)
+            
+            # 增量更新全文索引
+            search_index.index_document(db_session, 'answer', qa_id, session_id, answer)
+            if is_finished:
+                search_index.index_document(db_session, 'draft', session_id, session_id, draft)
+                draft_history.record_version(db_session, session_id, draft, draft_history.SOURCE_GENERATED)
+            
+            if progress_items:
+                self._upsert_progress(db_session, session_id, qa_id, progress_items)
+            
+            next_qa_id = None
+            if not is_finished:
+                next_qa = ChatQA(
+                    session_id=session_id,
+                    question=next_question,
+                    answer=None,  # 等待用户回答
+                    aim=next_aim,
+                    emotion=None,
+                    progress=None
+                )
+                db_session.add(next_qa)
+                db_session.flush()
+                next_qa_id = next_qa.id
+            
+            self._apply_session_counters(
+                db_session, session_id,
+                qa_delta=0 if is_finished else 1,
+                dubious_delta=len(dubious_snippets or []),
+                last_qa_id=next_qa_id,
+                progress=progress,
+                is_finished=is_finished,
+                draft=draft,
+                prompt_tokens=token_summary.get('prompt_tokens', 0),
+                completion_tokens=token_summary.get('completion_tokens', 0),
+                token_cost=token_summary.get('cost', 0.0)
+            )
+        
+        if next_qa_id is None:
+            return None
+        return self.qa_dao.get_by_id(next_qa_id)
+    
+    def _add_dubious(self, db_session: Session, session_id: int, qa_id: int,
+                     snippets: List[str], answer: Optional[str] = None) -> List[ChatQADubious]:
+        """在给定事务内批量创建可疑语句，并写入全文索引和历史事件索引"""
+        records = [ChatQADubious(qa_id=qa_id, snippet=snippet) for snippet in snippets]
+        db_session.add_all(records)
+        db_session.flush()
+        for record in records:
+            search_index.index_document(db_session, 'dubious', record.id, session_id, record.snippet)
+        event_index.link_events(db_session, session_id, qa_id, snippets, answer)
+        return records
+    
+    def _apply_session_counters(self, db_session: Session, session_id: int,
+                                qa_delta: int = 0, dubious_delta: int = 0,
+                                last_qa_id: Optional[int] = None,
+                                progress: Optional[str] = None,
+                                is_finished: bool = False,
+                                draft: Optional[str] = None,
+                                prompt_tokens: int = 0, completion_tokens: int = 0,
+                                token_cost: float = 0.0):
+        """在给定事务内更新会话统计字段（使用UPDATE表达式，避免并发下的读改写丢失）"""
+        values = {
+            ChatSession.qa_count: ChatSession.qa_count + qa_delta,
+            ChatSession.dubious_count: ChatSession.dubious_count + dubious_delta,
+        }
+        if prompt_tokens or completion_tokens or token_cost:
+            values[ChatSession.prompt_tokens] = ChatSession.prompt_tokens + prompt_tokens
+            values[ChatSession.completion_tokens] = ChatSession.completion_tokens + completion_tokens
+            values[ChatSession.token_cost] = ChatSession.token_cost + token_cost
+        if last_qa_id is not None:
+            values[ChatSession.last_qa_id] = last_qa_id
+        if progress:
+            values[ChatSession.progress] = progress
+        if is_finished:
+            values[ChatSession.is_finished] = True
+            values[ChatSession.draft] = draft
+        db_session.query(ChatSession).filter(ChatSession.id == session_id).update(
+            values, synchronize_session=False
+        )
+    
+    def _set_qa_tokens(self, qa: ChatQA, token_summary: Dict[str, Any]):
+        """写入问答的 token 用量（token_summary 由 service.token_usage.summarize 生成）"""
+        if not token_summary:
+            return
+        qa.prompt_tokens = token_summary.get('prompt_tokens', 0)
+        qa.completion_tokens = token_summary.get('completion_tokens', 0)
+        qa.token_cost = token_summary.get('cost', 0.0)
+        qa.token_detail = json.dumps(token_summary.get('detail', {}), ensure_ascii=False)
+    
+    def import_session(self, turns: List[Dict[str, Any]], is_finished: bool = False,
+                       draft: Optional[str] = None) -> int:
+        """批量导入一个完整会话（单事务）
+        
+        Args:
+            turns: 按顺序排列的问答，每项包含 question / answer / aim / emotion /
+                progress / dubious / progress_items / prompt_version / token_summary
+            is_finished: 会话是否已完成；未完成时最后一个问答即为待回答的问答
+            draft: 报告草稿
+            
+        Returns:
+            int: 新会话ID
+            
+        Raises:
+            ValueError: 未完成的会话最后一个问答已有回答（之后的 /continue 会覆盖它）
+        """
+        if not is_finished and (not turns or turns[-1].get('answer') is not None):
+            raise ValueError("未完成的会话最后一个问答必须是待回答的问答")
+        with db_manager.get_session() as db_session:
+            chat_session = ChatSession(is_finished=is_finished, draft=draft)
+            db_session.add(chat_session)
+            db_session.flush()
+            session_id = chat_session.id
+            
+            qas = [
+                ChatQA(
+                    session_id=session_id,
+                    question=turn.get('question'),
+                    answer=turn.get('answer'),
+                    aim=turn.get('aim'),
+                    emotion=turn.get('emotion'),
+                    progress=turn.get('progress'),
+                    prompt_version=turn.get('prompt_version')
+                )
+                for turn in turns
+            ]
+            db_session.add_all(qas)
+            db_session.flush()
+            
+            dubious_count = 0
+            latest_progress = None
+            for qa, turn in zip(qas, turns):
+                self._set_qa_tokens(qa, turn.get('token_summary'))
+                dubious = turn.get('dubious') or []
+                if dubious:
+                    self._add_dubious(db_session, session_id, qa.id, dubious, qa.answer)
+                    dubious_count += len(dubious)
+                if turn.get('progress_items'):
+                    self._upsert_progress(db_session, session_id, qa.id, turn['progress_items'])
+                if qa.progress:
+                    latest_progress = qa.progress
+                search_index.index_document(db_session, 'answer', qa.id, session_id, qa.answer)
+            if is_finished:
+                search_index.index_document(db_session, 'draft', session_id, session_id, draft)
+            
+            chat_session.qa_count = len(qas)
+            chat_session.dubious_count = dubious_count
+            chat_session.last_qa_id = qas[-1].id if qas else None
+            chat_session.progress = latest_progress
+            chat_session.prompt_tokens = sum(qa.prompt_tokens or 0 for qa in qas)
+            chat_session.completion_tokens = sum(qa.completion_tokens or 0 for qa in qas)
+            chat_session.token_cost = sum(qa.token_cost or 0.0 for qa in qas)
+            draft_history.record_version(db_session, session_id, draft, draft_history.SOURCE_IMPORTED)
+        
+        return session_id
+    
+    def _upsert_progress(self, db_session: Session, session_id: int, qa_id: int,
+                         progress_items: List[Dict[str, Any]]):
+        """在给定事务内写入分章节完成度（每个会话每个章节保留最新一条）"""
+        existing = {
+            record.chapter: record
+            for record in db_session.query(ChatSessionProgress).filter(
+                ChatSessionProgress.session_id == session_id
+            )
+        }
+        for item in progress_items:
+            record = existing.get(item['chapter'])
+            if record is None:
+                record = ChatSessionProgress(session_id=session_id, chapter=item['chapter'])
+                db_session.add(record)
+                existing[item['chapter']] = record
+            missing = item.get('missing')
+            record.percentage = item['percentage']
+            record.missing = missing[:255] if missing else None
+            record.detail = item.get('detail')
+            record.qa_id = qa_id
+    
+    def get_session_content(self, chat_session: ChatSession) -> Tuple[List[ChatQA], Optional[str]]:
+        """获取会话的问答记录（已加载 dubious_records）和草稿，已归档的会话从归档中读取
+        
+        Returns:
+            Tuple[List[ChatQA], Optional[str]]: (按创建时间排序的问答, 草稿)
+        """
+        archived = self._get_archived_qas(chat_session)
+        if archived is not None:
+            return archived
+        
+        with db_manager.get_session() as db_session:
+            qas = db_session.query(ChatQA).options(
+                selectinload(ChatQA.dubious_records)
+            ).filter(ChatQA.session_id == chat_session.id).order_by(ChatQA.created_at).all()
+            # 脱离数据库会话，提交后已加载的属性仍可访问
+            db_session.expunge_all()
+        return qas, chat_session.draft
+    
+    def _get_archived_qas(self, chat_session: ChatSession) -> Optional[Tuple[List[ChatQA], Optional[str]]]:
+        """已归档会话的 (问答, 草稿)；未归档时返回None"""
+        if chat_session.archived_at is None:
+            return None
+        payload = archive.load_session(chat_session.id)
+        if payload is None:
+            # 读取期间会话已被恢复
+            return None
+        return archive.to_qas(payload), payload.get('draft')
+    
+    def archive_finished_sessions(self, days: int = archive.ARCHIVE_AFTER_DAYS,
+                                  limit: int = archive.ARCHIVE_BATCH) -> int:
+        """归档已结束且 days 天内没有更新的会话，返回归档数量"""
+        return archive.archive_finished_sessions(days, limit)
+    
+    def restore_session(self, session_id: int) -> bool:
+        """将已归档的会话恢复到热表，会话不存在或未归档时返回False"""
+        return archive.restore_session(session_id)
+    
+    def get_archive_stats(self) -> Dict[str, Any]:
+        """归档的会话数和压缩前后的大小"""
+        return archive.get_stats()
+    
     def get_session_with_qas(self, session_id: int) -> dict:
         """获取包含所有问答记录的会话（返回字典格式避免关联关系问题）"""
         chat_session = self.session_dao.get_by_id(session_id)
         if not chat_session:
             return {}
             
-        # 手动加载QA列表
-        qa_list = self.qa_dao.get_by_session_id(session_id)
+        # 问答及其可疑语句（已归档的会话从归档中读取）
+        qa_list, draft = self.get_session_content(chat_session)
         
         # 构建QA数据，包含可疑语句
         qa_data = []
         for qa in qa_list:
-            dubious_list = self.dubious_dao.get_by_qa_id(qa.id)
+            dubious_list = qa.dubious_records
             qa_data.append({
                 "id": qa.id,
                 "question": qa.question,
@@ -99,6 +376,7 @@ class ChatService:
                 "aim": qa.aim,
                 "emotion": qa.emotion,
                 "progress": qa.progress,
+                "prompt_version": qa.prompt_version,
                 "created_at": qa.created_at,
                 "updated_at": qa.updated_at,
                 "dubious_records": [
@@ -114,7 +392,11 @@ class ChatService:
             "created_at": chat_session.created_at,
             "updated_at": chat_session.updated_at,
             "is_finished": chat_session.is_finished,
-            "draft": chat_session.draft,
+            "draft": draft,
+            "qa_count": chat_session.qa_count,
+            "dubious_count": chat_session.dubious_count,
+            "last_qa_id": chat_session.last_qa_id,
+            "progress": chat_session.progress,
             "chat_qas": qa_data
         }
     
@@ -137,39 +419,207 @@ class ChatService:
             return qa
     
     def finish_session(self, session_id: int, final_draft: Optional[str] = None) -> bool:
-        """结束会话"""
-        return self.session_dao.mark_as_finished(session_id, final_draft)
+        """结束会话（单事务：更新会话状态和草稿、草稿的全文索引和版本历史）"""
+        chat_session = self.session_dao.get_by_id(session_id)
+        if not chat_session:
+            return False
+        if final_draft is not None and chat_session.archived_at is not None:
+            archive.restore_session(session_id)
+        
+        with db_manager.get_session() as db_session:
+            chat_session = db_session.query(ChatSession).filter(ChatSession.id == session_id).first()
+            draft = final_draft if final_draft is not None else chat_session.draft
+            self._apply_session_counters(db_session, session_id, is_finished=True, draft=draft)
+            if final_draft is not None:
+                search_index.index_document(db_session, 'draft', session_id, session_id, final_draft)
+                draft_history.record_version(db_session, session_id, final_draft, draft_history.SOURCE_GENERATED)
+        return True
+    
+    def save_draft(self, session_id: int, draft: str, source: str = draft_history.SOURCE_EDITED,
+                   token_summary: Optional[Dict[str, Any]] = None) -> Optional[int]:
+        """保存新的草稿版本（编辑或重新生成），同时更新会话草稿和全文索引
+        
+        已归档的会话先恢复到热表。重新生成时 token_summary 为生成草稿的用量，计入会话累计用量。
+        
+        Returns:
+            Optional[int]: 版本号；会话不存在时返回None
+        """
+        chat_session = self.session_dao.get_by_id(session_id)
+        if not chat_session:
+            return None
+        if chat_session.archived_at is not None:
+            archive.restore_session(session_id)
+        
+        with db_manager.get_session() as db_session:
+            chat_session = db_session.query(ChatSession).filter(ChatSession.id == session_id).first()
+            # 版本历史上线前生成的草稿先记录为第一个版本，编辑后仍可查看原稿
+            if chat_session.draft and not chat_session.draft_version:
+                draft_history.record_version(db_session, session_id, chat_session.draft,
+                                             draft_history.SOURCE_GENERATED)
+            version = draft_history.record_version(db_session, session_id, draft, source)
+            chat_session.draft = draft
+            search_index.index_document(db_session, 'draft', session_id, session_id, draft)
+            if token_summary:
+                self._apply_session_counters(
+                    db_session, session_id,
+                    prompt_tokens=token_summary.get('prompt_tokens', 0),
+                    completion_tokens=token_summary.get('completion_tokens', 0),
+                    token_cost=token_summary.get('cost', 0.0)
+                )
+        return version
+    
+    def get_draft_versions(self, session_id: int) -> List[dict]:
+        """会话的草稿版本列表（不含内容）"""
+        return draft_history.list_versions(session_id)
+    
+    def get_draft(self, session_id: int, version: int) -> Optional[str]:
+        """指定版本的草稿，版本不存在时返回None"""
+        return draft_history.get_version(session_id, version)
+    
+    def diff_drafts(self, session_id: int, from_version: int, to_version: int,
+                    context: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """两个草稿版本的逐行对照，任一版本不存在时返回None"""
+        return draft_history.diff_versions(session_id, from_version, to_version, context)
     
     def get_session_statistics(self, session_id: int) -> dict:
-        """获取会话统计信息"""
-        # 直接使用DAO查询，避免关联关系的复杂性
+        """获取会话统计信息（计数直接读取会话冗余字段）"""
         chat_session = self.session_dao.get_by_id(session_id)
         if not chat_session:
             return {}
         
-        # 单独查询QA记录
-        qa_list = self.qa_dao.get_by_session_id(session_id)
-        qa_count = len(qa_list)
-        
-        # 计算可疑语句数量和情绪
-        dubious_count = 0
-        emotions = []
-        for qa in qa_list:
-            dubious_list = self.dubious_dao.get_by_qa_id(qa.id)
-            dubious_count += len(dubious_list)
-            if qa.emotion:
-                emotions.append(qa.emotion)
+        # 情绪列表仍需逐条读取，但只查询emotion列
+        archived = self._get_archived_qas(chat_session)
+        if archived is not None:
+            emotions = [qa.emotion for qa in archived[0] if qa.emotion]
+        else:
+            with db_manager.get_session() as db_session:
+                emotions = [
+                    emotion for (emotion,) in db_session.query(ChatQA.emotion).filter(
+                        ChatQA.session_id == session_id, ChatQA.emotion.isnot(None)
+                    ).order_by(ChatQA.created_at)
+                    if emotion
+                ]
         
         return {
             "session_id": session_id,
             "is_finished": chat_session.is_finished,
-            "qa_count": qa_count,
-            "dubious_count": dubious_count,
+            "qa_count": chat_session.qa_count,
+            "dubious_count": chat_session.dubious_count,
+            "last_qa_id": chat_session.last_qa_id,
+            "progress": chat_session.progress,
             "emotions": emotions,
             "created_at": chat_session.created_at,
             "updated_at": chat_session.updated_at
         }
     
+    def get_session_token_usage(self, session_id: int) -> dict:
+        """获取会话累计 token 用量及每个问答的分阶段明细"""
+        chat_session = self.session_dao.get_by_id(session_id)
+        if not chat_session:
+            return {}
+        
+        archived = self._get_archived_qas(chat_session)
+        if archived is not None:
+            rows = sorted(
+                (qa.id, qa.prompt_tokens, qa.completion_tokens, qa.token_cost, qa.token_detail)
+                for qa in archived[0] if qa.prompt_tokens is not None
+            )
+        else:
+            with db_manager.get_session() as db_session:
+                rows = db_session.query(
+                    ChatQA.id, ChatQA.prompt_tokens, ChatQA.completion_tokens, ChatQA.token_cost, ChatQA.token_detail
+                ).filter(
+                    ChatQA.session_id == session_id, ChatQA.prompt_tokens.isnot(None)
+                ).order_by(ChatQA.id).all()
+        
+        return {
+            "session_id": session_id,
+            "prompt_tokens": chat_session.prompt_tokens or 0,
+            "completion_tokens": chat_session.completion_tokens or 0,
+            "total_tokens": (chat_session.prompt_tokens or 0) + (chat_session.completion_tokens or 0),
+            "cost": round(chat_session.token_cost or 0.0, 6),
+            "qas": [
+                {
+                    "qa_id": qa_id,
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "cost": token_cost,
+                    "stages": json.loads(token_detail) if token_detail else {}
+                }
+                for qa_id, prompt_tokens, completion_tokens, token_cost, token_detail in rows
+            ]
+        }
+    
+    def get_session_progress(self, session_id: int) -> List[dict]:
+        """获取会话的分章节完成度"""
+        return [
+            self._progress_to_dict(record)
+            for record in self.progress_dao.get_by_session_id(session_id)
+        ]
+    
+    def get_stuck_sessions(self, chapter: str, below: int = 100,
+                           include_finished: bool = False) -> List[dict]:
+        """获取指定章节完成度低于阈值的会话，例如 时代篇 低于 75%"""
+        return [
+            self._progress_to_dict(record)
+            for record in self.progress_dao.get_below(chapter, below, include_finished)
+        ]
+    
+    def get_progress_overview(self, include_finished: bool = False) -> Dict[str, Dict[int, int]]:
+        """按章节、完成度聚合会话数量
+        
+        Returns:
+            Dict[str, Dict[int, int]]: {chapter: {percentage: session_count}}
+        """
+        with db_manager.get_session() as db_session:
+            query = db_session.query(
+                ChatSessionProgress.chapter,
+                ChatSessionProgress.percentage,
+                func.count(ChatSessionProgress.id)
+            )
+            if not include_finished:
+                query = query.join(ChatSession, ChatSession.id == ChatSessionProgress.session_id).filter(
+                    ChatSession.is_finished == False
+                )
+            rows = query.group_by(ChatSessionProgress.chapter, ChatSessionProgress.percentage).all()
+        
+        result = {}
+        for chapter, percentage, count in rows:
+            result.setdefault(chapter, {})[percentage] = count
+        return result
+    
+    def _progress_to_dict(self, record: ChatSessionProgress) -> dict:
+        """章节完成度记录转字典"""
+        return {
+            "session_id": record.session_id,
+            "chapter": record.chapter,
+            "percentage": record.percentage,
+            "missing": record.missing,
+            "detail": record.detail,
+            "qa_id": record.qa_id,
+            "updated_at": record.updated_at
+        }
+    
+    def search(self, query: str, doc_types: Optional[List[str]] = None, limit: int = 20) -> List[dict]:
+        """全文检索回答、草稿和可疑语句"""
+        return search_index.search(query, doc_types, limit)
+    
+    def find_events(self, query: Optional[str] = None, limit: int = 50) -> List[dict]:
+        """查询历史事件词典及提及次数"""
+        return event_index.find_events(query, limit)
+    
+    def get_event_mentions(self, query: str, limit: int = 200) -> List[dict]:
+        """获取提及指定历史事件的所有问答"""
+        return event_index.get_mentions(query, limit)
+    
+    def get_event_decade_stats(self) -> List[dict]:
+        """按年代统计历史事件提及次数"""
+        return event_index.get_decade_stats()
+    
+    def add_event_alias(self, event_id: int, alias: str) -> bool:
+        """为历史事件添加别名（别名已属于其他事件时合并）"""
+        return event_index.add_alias(event_id, alias)
+    
     def search_by_emotion(self, emotion: str) -> List[ChatQA]:
         """根据情绪搜索问答记录"""
         return self.qa_dao.get_by_emotion(emotion)
@@ -189,6 +639,39 @@ class ChatService:
                 
             return sessions
     
+    def get_session_versions(self, since: Optional[datetime] = None,
+                             session_id: Optional[int] = None) -> Dict[int, Dict[str, Any]]:
+        """获取会话的版本号，只读取会话表的几个字段
+        
+        版本号由 updated_at 和统计字段组成：updated_at 只精确到秒，同一秒内的两次提交
+        也会改变 last_qa_id 或 is_finished，版本号因此不同；编辑草稿会改变 draft_version。
+        
+        Args:
+            since: 只返回 updated_at 不早于该时间的会话
+            session_id: 只返回指定会话
+        
+        Returns:
+            Dict[int, Dict[str, Any]]: {session_id: {"version": 版本号, "updated_at": 更新时间}}
+        """
+        with db_manager.get_session() as db_session:
+            query = db_session.query(
+                ChatSession.id, ChatSession.updated_at, ChatSession.last_qa_id, ChatSession.is_finished,
+                ChatSession.qa_count, ChatSession.dubious_count, ChatSession.draft_version
+            )
+            if since is not None:
+                query = query.filter(ChatSession.updated_at >= since)
+            if session_id is not None:
+                query = query.filter(ChatSession.id == session_id)
+            return {
+                row.id: {
+                    "version": (f"{row.updated_at.strftime('%Y%m%d%H%M%S') if row.updated_at else 0}"
+                                f".{row.last_qa_id or 0}.{row.qa_count or 0}.{row.dubious_count or 0}"
+                                f".{int(bool(row.is_finished))}.{row.draft_version or 0}"),
+                    "updated_at": row.updated_at,
+                }
+                for row in query
+            }
+    
     def get_all_sessions(self) -> Dict[int, ChatSession]:
         """获取所有对话会话
         
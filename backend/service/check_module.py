@@ -4,9 +4,13 @@ import os
 import json
 import time
 import sys
-from typing import Dict, Optional, Any, Generator
-from langchain.chat_models import init_chat_model
-from .system_prompt import check_system_prompt
+from typing import Dict, List, Optional, Any, Generator
+from . import prompt_registry
+from . import resilience
+from . import structured_output
+from . import token_usage
+from . import model_router
+from . import shared_cache
 # from system_prompt import check_system_prompt
 
 def validate_environment() -> bool:
@@ -31,39 +35,17 @@ def validate_environment() -> bool:
         return False
 
 def parse_response(response_content: str) -> Optional[Dict[str, Any]]:
-    """解析AI响应的JSON内容"""
-    try:
-        # 尝试直接解析JSON
-        parsed = json.loads(response_content.strip())
-        
-        # 验证必需字段（新增 is_finished 字段）
-        required_fields = ['dubious']
-        for field in required_fields:
-            if field not in parsed:
-                return None
-                
-        return parsed
-        
-    except json.JSONDecodeError as e:
-        # 尝试提取JSON部分（如果响应包含其他文本）
-        try:
-            start = response_content.find('{')
-            end = response_content.rfind('}') + 1
-            if start >= 0 and end > start:
-                json_part = response_content[start:end]
-                parsed = json.loads(json_part)
-                # 验证必需字段
-                required_fields = ['dubious']
-                for field in required_fields:
-                    if field not in parsed:
-                        return None
-                return parsed
-        except Exception as extract_error:
-            pass
-            
-        return None
-    except Exception as e:
-        return None
+    """解析AI响应的JSON内容（格式不合法时在本地修复，并按 schema 校验字段）"""
+    return structured_output.parse(response_content, structured_output.CHECK_SCHEMA)
+
+def merge_dubious(*groups: List[str]) -> List[str]:
+    """合并多组可疑内容，去重并保持顺序"""
+    merged = []
+    for group in groups:
+        for item in group or []:
+            if item not in merged:
+                merged.append(item)
+    return merged
 
 def check(context: str, debug: bool = False) -> Dict[str, Any]:
     """
@@ -82,20 +64,22 @@ def check(context: str, debug: bool = False) -> Dict[str, Any]:
         if not context or not context.strip():
             raise ValueError("上下文不能为空")
                     
-        # 初始化模型
-        model = init_chat_model(
-            model="deepseek-chat",
-            model_provider="deepseek",
-            temperature=0,
-            openai_api_key=os.environ.get('DEEPSEEK_API_KEY'),
-            base_url="https://api.deepseek.com/v1"
-        )
-                
         # 构造完整提示词
-        full_prompt = check_system_prompt + "\n\n" + context
+        full_prompt = prompt_registry.render('check', context)
+        
+        # 相同提示词（同一版本、同一内容）的校验结果在各进程间共享
+        cache_key = shared_cache.digest(full_prompt)
+        cached = shared_cache.get('check', cache_key)
+        if cached is not None:
+            return cached
+        
+        # 按阶段和输入长度选择模型
+        selected = model_router.route('check', full_prompt)
+        model = structured_output.bind_json_mode(model_router.get_model(selected))
         
         # 调用模型
-        response = model.invoke(full_prompt)
+        response = resilience.call(lambda: model.invoke(full_prompt), stage='check', provider=selected.limiter)
+        token_usage.record('check', selected.model_name, response)
         
         if not response or not hasattr(response, 'content'):
             raise ValueError("AI响应无效")
@@ -108,6 +92,7 @@ def check(context: str, debug: bool = False) -> Dict[str, Any]:
         if parsed_data is None:
             raise ValueError("无法解析AI响应，可能格式不正确")
         
+        shared_cache.put('check', cache_key, parsed_data['dubious'])
         return parsed_data['dubious']
                         
     except Exception as e:
@@ -1,10 +1,34 @@
-from aip import AipNlp
 import dotenv
 import getpass
 import os
+from .rate_limiter import RateLimitedError
+from . import resilience
+from . import shared_cache
+
+# 百度接口的限流错误码（4: 调用量超限，18: QPS超限）
+BAIDU_RATE_LIMIT_ERRORS = (4, 18)
+
+def _raise_for_rate_limit(result: dict) -> dict:
+    """百度接口以返回值中的 error_code 表示限流，转换为异常以便限流器感知并重试"""
+    if isinstance(result, dict) and result.get('error_code') in BAIDU_RATE_LIMIT_ERRORS:
+        raise RateLimitedError(result.get('error_msg', 'Baidu API rate limited'))
+    return result
+
+def warmup():
+    """预先加载百度 SDK（导入较慢，默认在首次识别情绪时才加载）"""
+    import aip  # noqa: F401
 
 def emotion(text: str, options: bool = False) -> str:
-    """调用百度AI开放平台的情绪识别接口，返回情绪标签"""
+    """调用百度AI开放平台的情绪识别接口，返回情绪标签（相同文本的结果在各进程间共享）"""
+    cache_key = f"{int(options)}:{shared_cache.digest(text)}"
+    cached = shared_cache.get('emotion', cache_key)
+    if cached is not None:
+        return cached
+    label = _emotion(text, options)
+    shared_cache.put('emotion', cache_key, label)
+    return label
+
+def _emotion(text: str, options: bool = False) -> str:
     # 获取当前文件所在目录，确保正确加载api_keys.env
     current_dir = os.path.dirname(os.path.abspath(__file__))
     env_file = os.path.join(current_dir, 'api_keys.env')
@@ -17,7 +41,12 @@ def emotion(text: str, options: bool = False) -> str:
 
     # print(BAIDU_APP_ID, BAIDU_API_KEY, BAIDU_SECRET_KEY)
 
+    from aip import AipNlp
     client = AipNlp(BAIDU_APP_ID, BAIDU_API_KEY, BAIDU_SECRET_KEY)
+    # 请求超时与单次尝试超时相同，超时的请求由 SDK 中止并归还限流名额
+    timeout_ms = int(resilience.attempt_timeout('emotion') * 1000)
+    client.setConnectionTimeoutInMillis(timeout_ms)
+    client.setSocketTimeoutInMillis(timeout_ms)
 
     if options:
         # 调用对话情绪识别接口
@@ -28,7 +57,8 @@ def emotion(text: str, options: bool = False) -> str:
         #     talk（闲聊对话-如度秘聊天等），
         #     task（任务型对话-如导航对话等），
         #     customer_service（客服对话-如电信/银行客服等）
-        result = client.emotion(text)
+        result = resilience.call(lambda: _raise_for_rate_limit(client.emotion(text)),
+                                 stage='emotion', provider='baidu')
 
         # print(result['items'][0])
 
@@ -42,6 +72,7 @@ def emotion(text: str, options: bool = False) -> str:
     #             0：负面情绪
     #             1：中性情绪
     #             2：正面情绪
-    result = client.sentimentClassify(text)
+    result = resilience.call(lambda: _raise_for_rate_limit(client.sentimentClassify(text)),
+                             stage='emotion', provider='baidu')
     sentiments = result['items'][0]['sentiment']
     return {0: 'negative', 1: 'neutral', 2: 'positive'}.get(sentiments, 'neutral')
\ No newline at end of file
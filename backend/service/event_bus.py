@@ -0,0 +1,208 @@
+"""会话变更事件总线
+
+对话提交一轮、会话结束或新建会话时发布事件，/updates 的订阅者（SSE）实时收到，不必轮询 /dialogues。
+
+后端由 EVENT_BUS_BACKEND 选择：
+- local: 进程内发布订阅（默认，单进程部署）
+- redis: 经 Redis 频道转发（REDIS_URL，需要安装 redis 包），多进程部署时任一 worker 发布的事件
+         所有 worker 的订阅者都能收到；未安装 redis 时回退到 local
+
+事件 id 为 "<来源>-<序号>"：local 时来源是进程启动时生成的随机标识，序号在进程内递增；redis 时序号由
+Redis INCR 统一分配，所有 worker 一致。每个进程保留最近的若干事件，客户端重连时带上 Last-Event-ID
+可以补收断开期间的事件；id 不在保留的事件中（来自其他进程、进程已重启或断开过久）时不补发，
+改为发送一个 resync 事件，客户端应重新请求 /dialogues。
+
+SSE 连接会一直占用一个 worker 线程，每个进程的订阅者数不超过 MAX_SUBSCRIBERS，超出时拒绝订阅。
+"""
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional
+
+EVENT_BUS_BACKEND = os.environ.get('EVENT_BUS_BACKEND', 'local')
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+REDIS_CHANNEL = 'reporter:session_events'
+REDIS_ID_KEY = 'reporter:session_events:id'
+
+# 每个进程最多的订阅者数（每个占用一个 worker 线程，应明显小于 gunicorn 的 WORKER_THREADS）
+MAX_SUBSCRIBERS = int(os.environ.get('EVENT_BUS_MAX_SUBSCRIBERS', 16))
+
+# 每个订阅者最多积压的事件数（超出后丢弃最早的），以及为重连补发保留的最近事件数
+SUBSCRIBER_QUEUE_SIZE = 100
+RECENT_EVENTS = 200
+# 没有事件时发送心跳注释的间隔（秒）
+HEARTBEAT_INTERVAL = 15
+
+SESSION_CREATED = 'session_created'
+SESSION_UPDATED = 'session_updated'
+SESSION_FINISHED = 'session_finished'
+RESYNC = 'resync'
+
+
+class TooManySubscribers(Exception):
+    """本进程的订阅者数已达上限"""
+
+
+class Subscription:
+    """一个订阅者的事件队列"""
+
+    def __init__(self, bus: 'LocalEventBus'):
+        self._bus = bus
+        self._queue: queue.Queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def put(self, event: Dict[str, Any]):
+        """投递事件；订阅者处理不过来时丢弃最早的事件"""
+        while True:
+            try:
+                self._queue.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self._bus.unsubscribe(self)
+
+    def stream(self) -> Iterator[str]:
+        """产出 SSE 文本，客户端断开时取消订阅"""
+        try:
+            while True:
+                event = self.get(HEARTBEAT_INTERVAL)
+                if event is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                data = json.dumps(event, ensure_ascii=False)
+                yield f"id: {event['id']}\ndata: {data}\n\n" if 'id' in event else f"data: {data}\n\n"
+        finally:
+            self.close()
+
+
+class LocalEventBus:
+    """进程内的发布订阅"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: List[Subscription] = []
+        self._recent: deque = deque(maxlen=RECENT_EVENTS)
+        self._source = uuid.uuid4().hex[:8]
+        self._ids = itertools.count(1)
+
+    def publish(self, event_type: str, **fields):
+        self._deliver({'type': event_type, 'time': time.time(), **fields})
+
+    def _deliver(self, event: Dict[str, Any]):
+        with self._lock:
+            if 'id' not in event:
+                event = {**event, 'id': f"{self._source}-{next(self._ids)}"}
+            self._recent.append(event)
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.put(event)
+
+    def subscribe(self, last_event_id: Optional[str] = None) -> Subscription:
+        """
+        订阅事件，last_event_id 之后的最近事件会先补发；无法补发时先发送一个 resync 事件
+        :raises TooManySubscribers: 订阅者数已达 MAX_SUBSCRIBERS
+        """
+        subscription = Subscription(self)
+        with self._lock:
+            if len(self._subscribers) >= MAX_SUBSCRIBERS:
+                raise TooManySubscribers(f"Too many subscribers ({MAX_SUBSCRIBERS}), retry later")
+            self._subscribers.append(subscription)
+            missed = self._missed(last_event_id) if last_event_id else []
+        for event in missed:
+            subscription.put(event)
+        return subscription
+
+    def _missed(self, last_event_id: str) -> List[Dict[str, Any]]:
+        """last_event_id 之后的事件（调用方持有锁）；id 不在保留的事件中时无法确定范围，返回 resync 事件"""
+        ids = [event['id'] for event in self._recent]
+        if last_event_id not in ids:
+            return [{'type': RESYNC, 'time': time.time()}]
+        return list(self._recent)[ids.index(last_event_id) + 1:]
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"backend": type(self).__name__, "subscribers": len(self._subscribers),
+                    "max_subscribers": MAX_SUBSCRIBERS}
+
+
+class RedisEventBus(LocalEventBus):
+    """事件经 Redis 频道广播到所有进程，各进程再投递给本地的订阅者"""
+
+    def __init__(self, url: str = REDIS_URL):
+        import redis
+        super().__init__()
+        self._client = redis.Redis.from_url(url)
+        self._listener = None
+        self._listener_lock = threading.Lock()
+
+    def publish(self, event_type: str, **fields):
+        event = {'type': event_type, 'time': time.time(), **fields}
+        try:
+            event['id'] = f"redis-{self._client.incr(REDIS_ID_KEY)}"
+            self._client.publish(REDIS_CHANNEL, json.dumps(event, ensure_ascii=False))
+        except Exception as e:
+            # Redis 不可用时至少通知本进程的订阅者
+            print(f"发布会话事件失败: {e}")
+            self._deliver(event)
+
+    def subscribe(self, last_event_id: Optional[str] = None) -> Subscription:
+        self._ensure_listener()
+        return super().subscribe(last_event_id)
+
+    def _ensure_listener(self):
+        """首个订阅者出现时启动监听线程"""
+        with self._listener_lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name='event-bus', daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(REDIS_CHANNEL)
+                for message in pubsub.listen():
+                    self._deliver(json.loads(message['data']))
+            except Exception as e:
+                print(f"会话事件监听中断，稍后重连: {e}")
+                time.sleep(1)
+
+
+def _create_bus() -> LocalEventBus:
+    if EVENT_BUS_BACKEND == 'redis':
+        try:
+            return RedisEventBus()
+        except ImportError:
+            print("事件总线使用 Redis 需要安装 redis 包，改用进程内事件总线")
+    return LocalEventBus()
+
+
+bus = _create_bus()
+
+
+def publish(event_type: str, **fields):
+    """发布会话事件（发布失败不影响调用方）"""
+    try:
+        bus.publish(event_type, **fields)
+    except Exception as e:
+        print(f"发布会话事件失败: {e}")
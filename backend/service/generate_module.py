@@ -2,14 +2,24 @@ from . import emotion_module
 from . import check_module  
 from . import talk_module
 from . import summary_module
-from typing import Generator, Dict, Any
+from typing import Generator, Dict, Any, Optional
 
-def generate_response_stream(context: str, user_input: str, debug: bool = False) -> Generator[Dict[str, Any], None, None]:
+# 合并调用模式：对话与史实校验在同一次模型调用中完成（每轮少一次请求和一份提示词输入，
+# 但校验只能基于对话模型对最新回答的理解，且对话失败时也拿不到校验结果）
+COMBINED_TALK_CHECK = False
+
+def generate_response_stream(context: str, user_input: str, debug: bool = False,
+                             combined: Optional[bool] = None,
+                             summary_context: Optional[str] = None,
+                             prefetched: Optional[Dict[str, Any]] = None) -> Generator[Dict[str, Any], None, None]:
     """
     流式生成响应内容
     :param context: 上下文信息
     :param user_input: 用户输入
     :param debug: 是否启用调试模式
+    :param combined: 是否使用对话+史实校验合并调用，默认取 COMBINED_TALK_CHECK
+    :param summary_context: 生成总结草稿使用的完整上下文（context 为压缩后的历史时传入），默认与 context 相同
+    :param prefetched: 输入过程中的预取结果（prefetch.Prefetcher.take），已识别的情绪和已校验的部分不再重复调用
     :return: 生成器，返回包含 type, content, data 字段的字典
     """
 
@@ -34,25 +44,37 @@ def generate_response_stream(context: str, user_input: str, debug: bool = False)
 
     # 调用emotion模块进行情绪识别
     try:
-        emotion = emotion_module.emotion(user_input)
+        emotion = prefetched.get('emotion') if prefetched else None
+        if emotion is None:
+            emotion = emotion_module.emotion(user_input)
         result["emotion"] = emotion
         yield {'type': 'emotion', 'content': f'{emotion}', 'data': result}
     except Exception as e:
         yield {'type': 'error', 'content': f'❌ 情绪识别失败: {e}', 'data': result}
         return
 
-    # 调用check模块进行史实校验
-    try:
-        dubious = check_module.check(user_input)
-        result["dubious"] = dubious
-        yield {'type': 'dubious', 'content': f'发现可疑内容: {len(dubious)}项', 'data': result}
-    except Exception as e:
-        yield {'type': 'error', 'content': f'❌ 史实校验失败: {e}', 'data': result}
-        return
+    if combined is None:
+        combined = COMBINED_TALK_CHECK
+
+    # 调用check模块进行史实校验（合并调用模式下由talk模块一并返回）
+    if not combined:
+        try:
+            if prefetched:
+                # 只校验预取之后新增的部分
+                remainder = prefetched.get('remainder', user_input)
+                found = check_module.check(remainder) if remainder.strip() else []
+                dubious = check_module.merge_dubious(prefetched.get('dubious'), found)
+            else:
+                dubious = check_module.check(user_input)
+            result["dubious"] = dubious
+            yield {'type': 'dubious', 'content': f'发现可疑内容: {len(dubious)}项', 'data': result}
+        except Exception as e:
+            yield {'type': 'error', 'content': f'❌ 史实校验失败: {e}', 'data': result}
+            return
 
     # 调用talk模块进行AI分析（流式）
     talk_result = None
-    for stream_chunk in talk_module.talk_stream(context, debug):
+    for stream_chunk in talk_module.talk_stream(context, debug, with_check=combined):
         if stream_chunk['type'] == 'final':
             talk_result = {'success': True, 'data': stream_chunk['data']}
             break
@@ -68,6 +90,11 @@ def generate_response_stream(context: str, user_input: str, debug: bool = False)
         return
         
     talk_data = talk_result.get("data", {})
+    if combined:
+        # 与分开调用时的事件顺序保持一致：dubious 在 process 之前
+        result["dubious"] = talk_data.get("dubious", [])
+        yield {'type': 'dubious', 'content': f'发现可疑内容: {len(result["dubious"])}项', 'data': result}
+
     result["process"] = talk_data.get("process", "")
     yield {'type': 'process', 'content': f'{result["process"]}', 'data': result}
     
@@ -77,7 +104,7 @@ def generate_response_stream(context: str, user_input: str, debug: bool = False)
     # 如果对话已完成，生成总结草稿
     if talk_data.get('is_finished', False):
         try:
-            draft = summary_module.summary(context)
+            draft = summary_module.summary(summary_context or context)
             result['draft'] = draft
             yield {'type': 'draft', 'content': f'{draft}', 'data': result}
         except Exception as e:
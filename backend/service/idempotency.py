@@ -0,0 +1,63 @@
+"""提交回答的幂等处理
+
+客户端在 /start、/continue 请求中携带 Idempotency-Key（请求头或 idempotency_key 字段）。
+同一 (session_id, key) 在有效期内只执行一次对话：
+- 首次请求启动本轮对话并记录其事件流
+- 本轮进行中重复请求时直接附加到同一事件流（不再调用模型），结束后重复请求重放全部事件
+- 只记录轮次ID，事件流从 turn_stream.registry 中查找；重放缓冲区已被清理（或轮次在另一个 worker 上执行）时
+  由调用方提示以 /dialogues 为准
+- 记录放在共享缓存（shared_cache 的 idempotency 命名空间）中，多进程部署时各 worker 共用；先写入记录再启动轮次，
+  写入是原子的，并发的重复请求（无论落在哪个 worker）只有一个会启动本轮
+- 同一 key 对应的输入不同时拒绝请求，避免客户端误用 key 导致回答丢失
+"""
+import hashlib
+from typing import Callable, Optional, Tuple
+from . import shared_cache
+from .turn_stream import TurnStream, new_turn_id
+
+# 幂等记录保留的时间（秒）
+IDEMPOTENCY_TTL = 600
+# key 的最大长度
+MAX_KEY_LENGTH = 255
+CACHE_NAMESPACE = 'idempotency'
+
+
+class IdempotencyConflict(Exception):
+    """同一幂等 key 被用于不同的输入"""
+
+
+def fingerprint(*values) -> str:
+    """请求输入的摘要，用于判断重复请求是否为同一次提交"""
+    return hashlib.sha256(repr(values).encode('utf-8')).hexdigest()
+
+
+class IdempotencyStore:
+    """按 (session_id, key) 在共享缓存中记录已启动的轮次"""
+
+    def run(self, session_id: Optional[int], key: str, request_fingerprint: str,
+            start: Callable[[str], TurnStream]) -> Tuple[str, Optional[TurnStream]]:
+        """
+        首次请求时调用 start(轮次ID) 启动本轮，重复请求返回已有轮次的ID
+        :return: (轮次ID, 首次请求时新启动的事件流；重复请求时为None)
+        :raises IdempotencyConflict: 同一 key 对应的输入不同
+        """
+        scope = f"{session_id}:{key[:MAX_KEY_LENGTH]}"
+        turn_id = new_turn_id()
+        record = {'fingerprint': request_fingerprint, 'turn_id': turn_id}
+        if not shared_cache.add(CACHE_NAMESPACE, scope, record, IDEMPOTENCY_TTL):
+            existing = shared_cache.get(CACHE_NAMESPACE, scope)
+            if existing is not None:
+                if existing['fingerprint'] != request_fingerprint:
+                    raise IdempotencyConflict(f"Idempotency key {key} was already used with a different input")
+                return existing['turn_id'], None
+            # 记录恰好过期，按首次请求处理
+            shared_cache.put(CACHE_NAMESPACE, scope, record, IDEMPOTENCY_TTL)
+        try:
+            return turn_id, start(turn_id)
+        except Exception:
+            # 未能启动（如轮次已满返回503）时删除记录，客户端用同一 key 重试时重新执行
+            shared_cache.delete(CACHE_NAMESPACE, scope)
+            raise
+
+
+store = IdempotencyStore()
@@ -0,0 +1,165 @@
+"""批量导入历史采访记录
+
+对每段问答依次执行情绪识别、史实校验和进度评估（与在线 /continue 流程相同），
+未完成的采访由对话模型根据全部问答生成下一个问题，作为待回答的问答写入，之后可通过 /continue 继续；
+无法生成下一个问题时拒绝导入该采访。多个采访并行处理（上游调用由各模块内的共享限流器控制），结果通过 repository 层单事务批量写入。
+
+输入为 JSON Lines 文件（或 JSON 数组），每条为一个采访：
+    {"base_info": "受访者基础信息", "qas": [{"question": "...", "answer": "...", "aim": "..."}], "draft": "可选"}
+
+在 backend 目录下执行：
+    python -m service.import_module interviews.jsonl --workers 4
+"""
+import argparse
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, List, Optional
+from . import emotion_module
+from . import check_module
+from . import talk_module
+from . import summary_module
+from . import progress_module
+from . import prompt_registry
+from . import token_usage
+from .rate_limiter import session_scope
+from repository.service import chat_service
+
+BASE_INFO_QUESTION = '请填写受访者基础信息'
+BASE_INFO_AIM = '获取基础信息'
+
+
+def load_interviews(path: str) -> List[Dict[str, Any]]:
+    """读取采访记录文件，支持 JSON Lines 和 JSON 数组"""
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read().strip()
+    if content.startswith('['):
+        return json.loads(content)
+    return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+
+def _format_turn(turn: Dict[str, Any]) -> str:
+    """与在线流程相同的历史格式"""
+    return (f"aim: {turn.get('aim') or ''}\nquestion: {turn.get('question') or ''}\n"
+            f"answer: {turn.get('answer') or ''}\nemotion: {turn.get('emotion') or 'neutral'}\n"
+            f"progress: {turn.get('progress') or ''}\n\n")
+
+
+def analyze_interview(interview: Dict[str, Any], with_progress: bool = True,
+                      summarize: bool = False) -> Dict[str, Any]:
+    """
+    对一个采访的每段问答执行情绪识别、史实校验和进度评估
+    :return: 包含 turns / is_finished / draft 的字典，可直接交给 chat_service.import_session
+    """
+    turns = [{
+        'question': BASE_INFO_QUESTION,
+        'aim': BASE_INFO_AIM,
+        'answer': interview['base_info'],
+    }]
+    for qa in interview.get('qas', []):
+        if qa.get('answer'):
+            turns.append({
+                'question': qa.get('question', ''),
+                'aim': qa.get('aim', ''),
+                'answer': qa['answer'],
+            })
+
+    history = ""
+    talk_data = None
+    for turn in turns:
+        with prompt_registry.track_usage() as prompt_usage, token_usage.track() as turn_usage:
+            turn['emotion'] = emotion_module.emotion(turn['answer'])
+            turn['dubious'] = check_module.check(turn['answer'])
+
+            turn['progress'] = None
+            talk_data = None
+            if with_progress:
+                context = history + f"aim: {turn['aim']}\nquestion: {turn['question']}\nanswer: {turn['answer']}\n"
+                result = talk_module.talk(context)
+                if result['success']:
+                    turn['progress'] = result['data'].get('process', '')
+                    talk_data = result['data']
+        turn['prompt_version'] = prompt_registry.format_usage(prompt_usage)
+        turn['token_summary'] = token_usage.summarize(turn_usage)
+        turn['progress_items'] = progress_module.parse_progress(turn['progress'])
+        history += _format_turn(turn)
+
+    draft = interview.get('draft')
+    if not draft and summarize:
+        draft = summary_module.summary(history)
+
+    is_finished = bool(interview.get('is_finished', draft is not None))
+    if not is_finished:
+        turns.append(_next_turn(history, talk_data))
+
+    return {
+        'turns': turns,
+        'is_finished': is_finished,
+        'draft': draft,
+    }
+
+
+def _next_turn(history: str, talk_data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    未完成采访的待回答问答，问题只取自对最后一段问答的对话结果（评估进度时已得到），
+    没有时按全部问答重新调用一次对话模型
+    :raises ValueError: 无法生成下一个问题
+    """
+    with prompt_registry.track_usage() as prompt_usage, token_usage.track() as turn_usage:
+        if talk_data is None:
+            result = talk_module.talk(history)
+            if not result['success']:
+                raise ValueError(f"未完成的采访无法生成下一个问题: {result['error']}")
+            talk_data = result['data']
+    if not talk_data.get('question'):
+        raise ValueError("未完成的采访无法生成下一个问题: 对话模型没有返回问题")
+    return {
+        'question': talk_data['question'],
+        'aim': talk_data.get('aim', ''),
+        'answer': None,
+        'prompt_version': prompt_registry.format_usage(prompt_usage),
+        'token_summary': token_usage.summarize(turn_usage),
+    }
+
+
+def import_interviews(interviews: List[Dict[str, Any]], workers: int = 4,
+                      with_progress: bool = True, summarize: bool = False) -> Dict[str, Any]:
+    """
+    并行分析并导入多个采访
+    :param workers: 并行处理的采访数（上游调用另受 rate_limiter 限流，各采访之间公平排队）
+    :return: 导入结果统计 {"imported": [会话ID], "failed": [(序号, 错误信息)]}
+    """
+    imported, failed = [], []
+
+    def process(index: int, interview: Dict[str, Any]) -> Optional[int]:
+        with session_scope(f"import-{index}"):
+            analyzed = analyze_interview(interview, with_progress, summarize)
+        return chat_service.import_session(**analyzed)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(process, index, interview): index
+            for index, interview in enumerate(interviews)
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                session_id = future.result()
+                imported.append(session_id)
+                print(f"已导入第 {index + 1} 个采访，会话ID: {session_id}")
+            except Exception as e:
+                failed.append((index, str(e)))
+                print(f"❌ 第 {index + 1} 个采访导入失败: {e}")
+
+    print(f"导入完成：成功 {len(imported)} 个，失败 {len(failed)} 个")
+    return {"imported": imported, "failed": failed}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="批量导入历史采访记录")
+    parser.add_argument('path', help="JSON Lines 或 JSON 数组文件")
+    parser.add_argument('--workers', type=int, default=4, help="并行处理的采访数")
+    parser.add_argument('--skip-progress', action='store_true', help="不调用对话模型评估进度")
+    parser.add_argument('--summarize', action='store_true', help="没有草稿的采访自动生成总结草稿")
+    args = parser.parse_args()
+    import_interviews(load_interviews(args.path), args.workers,
+                      with_progress=not args.skip_progress, summarize=args.summarize)
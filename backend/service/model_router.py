@@ -0,0 +1,154 @@
+"""模型路由：按调用阶段和输入长度选择模型
+
+路由规则在 MODEL_ROUTES 中声明，每个阶段按顺序匹配第一条满足条件的规则：
+- min_chars / max_chars: 完整提示词的字符数范围
+- 规则对应的模型未配置 API Key 时跳过该规则（例如未开通通义千问时回退到 DeepSeek）
+
+会话 token 预算进入经济等级时，优先使用 token_usage.ECONOMY_MODELS 中配置的模型。
+同一配置的模型实例只创建一次，在各请求之间复用。
+"""
+import os
+import threading
+from collections import Counter
+from typing import Dict, Any, List, Optional, Tuple
+from . import token_usage
+from . import resilience
+
+# 可用模型：名称 -> 调用配置
+#   provider: langchain 的 model_provider；base_url / api_key_env: 接口地址和 API Key 所在的环境变量
+#   limiter: 共享限流器名称（同一上游服务的模型共用一个限流器）
+MODELS = {
+    'deepseek-chat': dict(provider='deepseek', base_url='https://api.deepseek.com/v1',
+                          api_key_env='DEEPSEEK_API_KEY', limiter='deepseek'),
+    'qwen-turbo': dict(provider='openai', base_url='https://dashscope.aliyuncs.com/compatible-mode/v1',
+                       api_key_env='DASHSCOPE_API_KEY', limiter='dashscope'),
+    'qwen-long': dict(provider='openai', base_url='https://dashscope.aliyuncs.com/compatible-mode/v1',
+                      api_key_env='DASHSCOPE_API_KEY', limiter='dashscope'),
+}
+
+# 各阶段的路由规则，按顺序匹配
+MODEL_ROUTES = {
+    # 史实校验只需抽取事件名称，优先使用小而快的模型
+    'check': [dict(model='qwen-turbo'), dict(model='deepseek-chat')],
+    'talk': [dict(model='deepseek-chat')],
+    'talk_check': [dict(model='deepseek-chat')],
+    # 超长采访记录使用长上下文模型生成总结
+    'summary': [dict(model='qwen-long', min_chars=100_000), dict(model='deepseek-chat')],
+}
+
+DEFAULT_MODEL = 'deepseek-chat'
+# 流式调用的阶段（模型实例需要返回流式用量）
+STREAM_STAGES = ('talk', 'talk_check')
+
+_models: Dict[Tuple, Any] = {}
+_models_lock = threading.Lock()
+_route_counts: Dict[str, Counter] = {}
+_counts_lock = threading.Lock()
+
+
+class Route:
+    """一次路由的结果"""
+
+    def __init__(self, stage: str, model_name: str, reason: str):
+        self.stage = stage
+        self.model_name = model_name
+        self.reason = reason
+        self.config = MODELS.get(model_name, MODELS[DEFAULT_MODEL])
+
+    @property
+    def limiter(self) -> str:
+        return self.config['limiter']
+
+
+def _available(model_name: str) -> bool:
+    config = MODELS.get(model_name)
+    if config is None:
+        return False
+    api_key = os.environ.get(config['api_key_env'])
+    return bool(api_key and api_key.strip())
+
+
+def route(stage: str, prompt: str) -> Route:
+    """为指定阶段和提示词选择模型"""
+    if token_usage.current_budget_level() == token_usage.BUDGET_ECONOMY:
+        economy_model = token_usage.ECONOMY_MODELS.get(stage)
+        if economy_model and _available(economy_model):
+            return _count(Route(stage, economy_model, 'economy'))
+
+    length = len(prompt)
+    for index, rule in enumerate(MODEL_ROUTES.get(stage, [])):
+        if length < rule.get('min_chars', 0):
+            continue
+        if 'max_chars' in rule and length > rule['max_chars']:
+            continue
+        if not _available(rule['model']):
+            continue
+        return _count(Route(stage, rule['model'], f'rule {index}'))
+    return _count(Route(stage, DEFAULT_MODEL, 'default'))
+
+
+def _count(selected: Route) -> Route:
+    with _counts_lock:
+        _route_counts.setdefault(selected.stage, Counter())[selected.model_name] += 1
+    return selected
+
+
+def get_model(selected: Route, **kwargs):
+    """
+    获取路由结果对应的模型实例（按模型、阶段超时和参数缓存）
+    请求超时与该阶段的单次尝试超时相同，超时后由客户端中止请求；重试由 resilience 负责，客户端不再重试
+    """
+    kwargs.setdefault('timeout', resilience.attempt_timeout(selected.stage))
+    kwargs.setdefault('max_retries', 0)
+    key = (selected.model_name, tuple(sorted(kwargs.items())))
+    with _models_lock:
+        model = _models.get(key)
+        if model is None:
+            # langchain 导入较慢，首次创建模型时才加载（worker 预热时提前完成）
+            from langchain.chat_models import init_chat_model
+            config = selected.config
+            model = init_chat_model(
+                model=selected.model_name,
+                model_provider=config['provider'],
+                temperature=0,
+                openai_api_key=os.environ.get(config['api_key_env']),
+                base_url=config['base_url'],
+                **kwargs
+            )
+            _models[key] = model
+        return model
+
+
+def warmup() -> List[str]:
+    """预先加载 langchain 并创建已配置 API Key 的模型实例（worker 启动时调用），返回已创建的模型名称"""
+    import langchain.chat_models  # noqa: F401
+    warmed = []
+    for stage, rules in MODEL_ROUTES.items():
+        model_names = {rule['model'] for rule in rules} | {DEFAULT_MODEL}
+        if token_usage.ECONOMY_MODELS.get(stage):
+            model_names.add(token_usage.ECONOMY_MODELS[stage])
+        for model_name in sorted(model_names):
+            if not _available(model_name):
+                continue
+            # 与各模块调用时的参数一致：流式对话需要返回用量
+            kwargs = {'stream_usage': True} if stage in STREAM_STAGES else {}
+            get_model(Route(stage, model_name, 'warmup'), **kwargs)
+            if model_name not in warmed:
+                warmed.append(model_name)
+    return warmed
+
+
+def get_stats() -> Dict[str, Any]:
+    """路由配置和各阶段实际使用的模型次数"""
+    with _counts_lock:
+        counts = {stage: dict(counter) for stage, counter in _route_counts.items()}
+    return {
+        "routes": {
+            stage: [
+                {**rule, "available": _available(rule['model'])} for rule in rules
+            ]
+            for stage, rules in MODEL_ROUTES.items()
+        },
+        "economy_models": dict(token_usage.ECONOMY_MODELS),
+        "counts": counts,
+    }
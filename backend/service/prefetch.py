@@ -0,0 +1,203 @@
+"""输入过程中的预取
+
+受访者输入回答时，前端防抖后把当前草稿发送到 /prefetch。这里在后台：
+- 预先读取会话历史，提交时不必再查询全部问答
+- 对已经写完的句子（以句末标点或换行结尾的部分）提前做史实校验和情绪识别
+
+提交回答时，如果最终回答以已校验的前缀开头，只需对新增的部分做史实校验；
+回答与已识别情绪的文本一致时直接复用情绪结果。预取产生的 token 用量和提示词版本计入本轮对话。
+"""
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, List, Optional
+from . import emotion_module
+from . import check_module
+from . import prompt_registry
+from . import token_usage
+from . import generate_module
+from .rate_limiter import session_scope
+
+PREFETCH_ENABLED = True
+# 预取结果的有效期（秒）和最多保留的会话数
+PREFETCH_TTL = 600
+PREFETCH_MAX_SESSIONS = 1000
+# 后台预取线程数
+PREFETCH_WORKERS = 4
+# 已完成句子少于该字数时不预取
+MIN_STABLE_CHARS = 10
+# 提交时等待正在进行的预取完成的最长时间（秒）
+TAKE_WAIT = 5.0
+
+_SENTENCE_END = re.compile(r'[。！？!?；;…\n]+')
+
+
+def stable_prefix(text: str) -> str:
+    """草稿中已经写完的部分：截止到最后一个句末标点或换行"""
+    end = 0
+    for match in _SENTENCE_END.finditer(text):
+        end = match.end()
+    return text[:end]
+
+
+class _Entry:
+    """单个会话的预取状态"""
+
+    def __init__(self, qa_id: int):
+        self.qa_id = qa_id
+        self.cond = threading.Condition()
+        self.history = None
+        self.checked_prefix = ''
+        self.dubious: List[str] = []
+        self.emotion_text = None
+        self.emotion = None
+        self.token_usage: Dict[str, Dict[str, Any]] = {}
+        self.prompt_usage: Dict[str, str] = {}
+        self.running = False
+        self.pending = None
+        self.updated_at = time.monotonic()
+
+
+class Prefetcher:
+    """按会话缓存预取结果，同一会话的预取串行执行，只处理最新的草稿"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[int, _Entry] = {}
+        self._executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix='prefetch')
+
+    def _entry(self, session_id: int, qa_id: int) -> _Entry:
+        with self._lock:
+            self._evict()
+            entry = self._entries.get(session_id)
+            if entry is None or entry.qa_id != qa_id:
+                entry = _Entry(qa_id)
+                self._entries[session_id] = entry
+            entry.updated_at = time.monotonic()
+            return entry
+
+    def _evict(self):
+        """清理过期条目，超出数量上限时移除最久未更新的（调用方持有锁）"""
+        now = time.monotonic()
+        for session_id in [sid for sid, e in self._entries.items() if now - e.updated_at > PREFETCH_TTL]:
+            del self._entries[session_id]
+        while len(self._entries) >= PREFETCH_MAX_SESSIONS:
+            oldest = min(self._entries, key=lambda sid: self._entries[sid].updated_at)
+            del self._entries[oldest]
+
+    def submit(self, session_id: int, qa_id: int, draft: str,
+               history_loader: Optional[Callable[[], Any]] = None,
+               budget_level: str = token_usage.BUDGET_NORMAL) -> Dict[str, Any]:
+        """
+        提交一份草稿，后台预取
+        :param qa_id: 当前待回答的问答ID，回答提交前问答发生变化时预取结果作废
+        :param history_loader: 读取会话历史的函数，每个待回答的问答只调用一次
+        :param budget_level: 会话当前的预算等级，预取的模型调用与正式轮次一样按该等级选择模型
+        """
+        entry = self._entry(session_id, qa_id)
+        prefix = stable_prefix(draft or '')
+        with entry.cond:
+            need_history = entry.history is None and history_loader is not None
+            need_analysis = (len(prefix.strip()) >= MIN_STABLE_CHARS
+                             and (prefix != entry.checked_prefix or prefix != entry.emotion_text))
+            if need_history or need_analysis:
+                entry.pending = (prefix if need_analysis else None, history_loader if need_history else None,
+                                 budget_level)
+                if not entry.running:
+                    entry.running = True
+                    self._executor.submit(self._run, session_id, entry)
+            return {
+                "accepted": need_history or need_analysis,
+                "stable_chars": len(prefix),
+                "checked_chars": len(entry.checked_prefix),
+            }
+
+    def _run(self, session_id: int, entry: _Entry):
+        """处理该会话最新的草稿，直到没有新的草稿"""
+        while True:
+            with entry.cond:
+                if entry.pending is None:
+                    entry.running = False
+                    entry.cond.notify_all()
+                    return
+                prefix, history_loader, budget_level = entry.pending
+                entry.pending = None
+                checked_prefix, dubious = entry.checked_prefix, entry.dubious
+            try:
+                if history_loader is not None:
+                    history = history_loader()
+                    with entry.cond:
+                        entry.history = history
+                if prefix:
+                    self._analyze(session_id, entry, prefix, checked_prefix, dubious, budget_level)
+            except Exception as e:
+                print(f"预取失败（会话 {session_id}）: {e}")
+
+    def _analyze(self, session_id: int, entry: _Entry, prefix: str, checked_prefix: str, dubious: List[str],
+                 budget_level: str):
+        """对新写完的句子做史实校验，对整个已完成部分做情绪识别"""
+        if prefix.startswith(checked_prefix):
+            delta = prefix[len(checked_prefix):]
+        else:
+            # 前面的内容被修改过，重新校验整个前缀
+            delta, dubious = prefix, []
+
+        with session_scope(session_id), token_usage.track(budget_level) as turn_usage, \
+                prompt_registry.track_usage() as prompt_usage:
+            found = []
+            # 合并调用模式下史实校验由对话模型完成，不单独预取
+            if delta.strip() and not generate_module.COMBINED_TALK_CHECK:
+                found = check_module.check(delta)
+            emotion = emotion_module.emotion(prefix) if prefix != entry.emotion_text else entry.emotion
+
+        with entry.cond:
+            entry.checked_prefix = prefix
+            entry.dubious = check_module.merge_dubious(dubious, found)
+            entry.emotion_text, entry.emotion = prefix, emotion
+            token_usage.merge(entry.token_usage, turn_usage)
+            entry.prompt_usage.update(prompt_usage)
+
+    def get_history(self, session_id: int, qa_id: int):
+        """预先读取的会话历史，待回答的问答已变化时返回 None"""
+        with self._lock:
+            entry = self._entries.get(session_id)
+        if entry is None or entry.qa_id != qa_id:
+            return None
+        with entry.cond:
+            return entry.history
+
+    def take(self, session_id: int, qa_id: int, user_input: str) -> Optional[Dict[str, Any]]:
+        """
+        提交回答时取出预取结果（取出后即失效）
+        :return: emotion（可复用时）、dubious（已校验部分的结果）、remainder（仍需校验的部分）、
+                 token_usage 和 prompt_usage；没有可用结果时返回 None
+        """
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+        if entry is None or entry.qa_id != qa_id:
+            return None
+
+        with entry.cond:
+            # 正在进行的预取很可能就是针对最终回答的前缀，稍等其完成（不再处理排队中的草稿）
+            entry.pending = None
+            deadline = time.monotonic() + TAKE_WAIT
+            while entry.running and time.monotonic() < deadline:
+                entry.cond.wait(deadline - time.monotonic())
+
+            if entry.checked_prefix and user_input.startswith(entry.checked_prefix):
+                dubious, remainder = list(entry.dubious), user_input[len(entry.checked_prefix):]
+            else:
+                dubious, remainder = [], user_input
+            emotion = entry.emotion if entry.emotion_text is not None and \
+                entry.emotion_text.strip() == user_input.strip() else None
+            return {
+                "emotion": emotion,
+                "dubious": dubious,
+                "remainder": remainder,
+                "token_usage": dict(entry.token_usage),
+                "prompt_usage": dict(entry.prompt_usage),
+            }
+
+
+prefetcher = Prefetcher()
@@ -0,0 +1,43 @@
+import re
+from typing import Dict, Any, List, Optional
+
+# 采访章节，顺序与 talk_system_prompt 中的完成度评估表一致
+CHAPTERS = ('序章', '时代篇', '精神篇', '终章')
+
+# 匹配形如 "序章 50%（年代+环境，但缺少关键影响因素）" 的片段，一个进度描述中可能包含多个章节
+_PROGRESS_PATTERN = re.compile(
+    r'(' + '|'.join(CHAPTERS) + r')\s*[:：]?\s*(\d{1,3})\s*[%％]\s*(?:[（(]([^）)]*)[）)])?'
+)
+_MISSING_PATTERN = re.compile(r'(?:缺少|缺乏|缺失|缺)(.+)')
+
+
+def parse_progress(process: Optional[str]) -> List[Dict[str, Any]]:
+    """
+    将模型输出的 process 文本解析为结构化的章节完成度
+    :param process: 进度描述，例如 "时代篇 50%（有国家事件+个人经历，但缺少具体细节）"
+    :return: 列表，每项包含 chapter / percentage / missing / detail 字段；无法识别时返回空列表
+    """
+    if not process:
+        return []
+
+    result = {}
+    for match in _PROGRESS_PATTERN.finditer(process):
+        chapter, percentage, detail = match.group(1), int(match.group(2)), match.group(3)
+        percentage = max(0, min(percentage, 100))
+        detail = detail.strip() if detail else None
+
+        missing = None
+        if detail and percentage < 100:
+            missing_match = _MISSING_PATTERN.search(detail)
+            if missing_match:
+                missing = missing_match.group(1).strip(' ，,。；;、') or None
+
+        # 同一章节出现多次时以最后一次为准
+        result[chapter] = {
+            'chapter': chapter,
+            'percentage': percentage,
+            'missing': missing,
+            'detail': detail,
+        }
+
+    return list(result.values())
@@ -0,0 +1,226 @@
+"""提示词注册表
+
+内置提示词来自 system_prompt.py，启动时加载一次并预编译；每个提示词带有内容哈希作为版本号，
+缓存和评测可以用 "名称:变体:版本" 作为稳定标识。
+
+A/B 实验无需重新部署：在 PROMPT_DIR 目录下放置变体文件 <名称>.<变体>.md，
+并在 ab.json 中配置各变体的流量权重，例如：
+    {"talk": {"control": 80, "concise": 20}}
+会话按 session_id 稳定分桶，同一会话始终使用同一变体。文件修改后自动重新加载（每 RELOAD_CHECK_INTERVAL 秒
+最多检查一次目录，不在每次渲染时访问文件系统）。权重必须是非负数，格式不正确的条目记录日志后忽略。
+
+模板中可以使用 {{context}} 指定上下文插入位置；没有占位符时上下文追加在提示词之后（与原有拼接方式一致）。
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, List, Optional, Tuple
+from . import system_prompt
+from .rate_limiter import current_session_key
+
+CONTROL_VARIANT = 'control'
+
+# 内置提示词：名称 -> system_prompt 中的变量名
+BUILTIN_PROMPTS = {
+    'talk': 'talk_system_prompt',
+    'talk_check': 'talk_check_system_prompt',
+    'check': 'check_system_prompt',
+    'summary': 'summary_system_prompt',
+}
+
+PROMPT_DIR = os.environ.get('PROMPT_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'prompts')
+AB_CONFIG_FILE = 'ab.json'
+# 检查变体目录是否修改的最小间隔（秒）
+RELOAD_CHECK_INTERVAL = 5.0
+
+_PLACEHOLDER = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+
+# 当前轮次使用过的提示词版本（由 track_usage 开启记录）
+_usage: ContextVar[Optional[Dict[str, str]]] = ContextVar('prompt_usage', default=None)
+
+
+def _parse_weights(config: Any) -> Dict[str, Dict[str, float]]:
+    """校验 A/B 配置，跳过格式不正确的条目（权重必须是非负数）"""
+    if not isinstance(config, dict):
+        print(f"提示词A/B配置应为对象，已忽略: {config!r}")
+        return {}
+    weights = {}
+    for name, variants in config.items():
+        if not isinstance(variants, dict):
+            print(f"提示词A/B配置 {name} 应为 变体 -> 权重 的对象，已忽略")
+            continue
+        weights[name] = {}
+        for variant, weight in variants.items():
+            if isinstance(weight, bool) or not isinstance(weight, (int, float)) or weight < 0:
+                print(f"提示词A/B配置 {name}.{variant} 的权重无效，已忽略: {weight!r}")
+                continue
+            weights[name][variant] = weight
+    return weights
+
+
+class PromptTemplate:
+    """预编译的提示词模板"""
+
+    def __init__(self, name: str, variant: str, text: str):
+        self.name = name
+        self.variant = variant
+        self.text = text
+        self.version = hashlib.sha256(text.encode('utf-8')).hexdigest()[:12]
+        # 预先切分为字面量和占位符，渲染时只做一次拼接
+        self._segments: List[Tuple[bool, str]] = []
+        position = 0
+        for match in _PLACEHOLDER.finditer(text):
+            self._segments.append((False, text[position:match.start()]))
+            self._segments.append((True, match.group(1)))
+            position = match.end()
+        if self._segments:
+            self._segments.append((False, text[position:]))
+        else:
+            self._segments = [(False, text + "\n\n"), (True, 'context')]
+
+    @property
+    def identity(self) -> str:
+        """稳定标识，例如 talk:control:3f2a9c1b7d4e"""
+        return f"{self.name}:{self.variant}:{self.version}"
+
+    def render(self, context: str = '', **values: str) -> str:
+        values['context'] = context
+        return ''.join(values.get(part, '') if is_slot else part for is_slot, part in self._segments)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "variant": self.variant,
+            "version": self.version,
+            "identity": self.identity,
+            "length": len(self.text),
+        }
+
+
+class PromptRegistry:
+    """按名称和变体管理提示词模板，变体目录和 A/B 配置按修改时间自动重新加载"""
+
+    def __init__(self, prompt_dir: str = PROMPT_DIR):
+        self.prompt_dir = prompt_dir
+        self._lock = threading.Lock()
+        self._builtin: Dict[str, PromptTemplate] = {
+            name: PromptTemplate(name, CONTROL_VARIANT, getattr(system_prompt, attr))
+            for name, attr in BUILTIN_PROMPTS.items()
+        }
+        self._variants: Dict[Tuple[str, str], PromptTemplate] = {}
+        self._weights: Dict[str, Dict[str, float]] = {}
+        self._signature = None
+        self._checked_at = None
+
+    def _dir_signature(self):
+        """变体目录的文件名和修改时间，用于判断是否需要重新加载"""
+        try:
+            with os.scandir(self.prompt_dir) as entries:
+                return tuple(sorted((e.name, e.stat().st_mtime_ns) for e in entries if e.is_file()))
+        except FileNotFoundError:
+            return ()
+
+    def _reload_if_changed(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < RELOAD_CHECK_INTERVAL:
+            return
+        self._checked_at = now
+        signature = self._dir_signature()
+        if signature == self._signature:
+            return
+        with self._lock:
+            if signature == self._signature:
+                return
+            variants, weights = {}, {}
+            for file_name, _ in signature:
+                path = os.path.join(self.prompt_dir, file_name)
+                if file_name == AB_CONFIG_FILE:
+                    try:
+                        with open(path, 'r', encoding='utf-8') as f:
+                            weights = _parse_weights(json.load(f))
+                    except (OSError, ValueError) as e:
+                        print(f"读取提示词A/B配置失败: {e}")
+                    continue
+                parts = file_name.split('.')
+                if len(parts) != 3 or parts[2] != 'md' or parts[0] not in self._builtin:
+                    continue
+                with open(path, 'r', encoding='utf-8') as f:
+                    variants[(parts[0], parts[1])] = PromptTemplate(parts[0], parts[1], f.read())
+            self._variants, self._weights, self._signature = variants, weights, signature
+            if variants:
+                print(f"已加载提示词变体: {', '.join(t.identity for t in variants.values())}")
+
+    def get(self, name: str, variant: str = CONTROL_VARIANT) -> PromptTemplate:
+        """获取指定变体的模板，变体不存在时返回内置版本"""
+        self._reload_if_changed()
+        return self._variants.get((name, variant)) or self._builtin[name]
+
+    def select(self, name: str, session_key: Optional[str] = None) -> PromptTemplate:
+        """按 A/B 权重为会话选择变体（同一会话结果稳定）"""
+        self._reload_if_changed()
+        weights = {
+            variant: weight for variant, weight in self._weights.get(name, {}).items()
+            if weight > 0 and (variant == CONTROL_VARIANT or (name, variant) in self._variants)
+        }
+        if not weights or session_key is None:
+            return self.get(name)
+        bucket = int(hashlib.md5(f"{name}:{session_key}".encode('utf-8')).hexdigest()[:8], 16) % sum(weights.values())
+        for variant, weight in sorted(weights.items()):
+            if bucket < weight:
+                return self.get(name, variant)
+            bucket -= weight
+        return self.get(name)
+
+    def list(self) -> List[Dict[str, Any]]:
+        """所有提示词及其变体、版本和 A/B 权重"""
+        self._reload_if_changed()
+        templates = list(self._builtin.values()) + list(self._variants.values())
+        result = []
+        for template in sorted(templates, key=lambda t: (t.name, t.variant != CONTROL_VARIANT, t.variant)):
+            item = template.to_dict()
+            item["weight"] = self._weights.get(template.name, {}).get(template.variant)
+            result.append(item)
+        return result
+
+
+registry = PromptRegistry()
+
+
+def render(name: str, context: str) -> str:
+    """为当前会话选择提示词变体并渲染，同时记录本轮使用的版本"""
+    template = registry.select(name, current_session_key())
+    usage = _usage.get()
+    if usage is not None:
+        usage[name] = template.identity
+    return template.render(context)
+
+
+@contextmanager
+def track_usage():
+    """记录该作用域内渲染过的提示词版本，产出 {名称: 标识} 字典"""
+    usage: Dict[str, str] = {}
+    token = _usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _usage.reset(token)
+
+
+def add_to_turn(usage: Dict[str, str]):
+    """将在本轮之外使用的提示词版本（例如输入过程中的预取）计入当前轮次"""
+    current = _usage.get()
+    if current is not None:
+        for name, identity in usage.items():
+            current.setdefault(name, identity)
+
+
+def format_usage(usage: Dict[str, str]) -> Optional[str]:
+    """将本轮使用的提示词版本压缩为一个字符串，用于写入 ChatQA.prompt_version"""
+    if not usage:
+        return None
+    return ';'.join(usage[name] for name in sorted(usage))[:255]
@@ -0,0 +1,236 @@
+"""上游服务（DeepSeek、百度）共享限流器
+
+每个上游服务一个限流器：令牌桶控制请求速率，并发上限控制同时进行的请求数，
+二者都根据 429 / 延迟信号自适应调整（AIMD：成功时线性增加，限流时成倍减少）。
+等待中的请求按会话分队列，轮询放行，避免单个会话的突发请求占满上游额度。
+
+用法：
+    with get_limiter('deepseek').slot():
+        response = model.invoke(prompt)
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Any, Optional
+
+# 各上游服务的限流配置
+#   rate: 初始每秒请求数；min_rate / max_rate: 自适应调整范围；rate_step: 每次成功后的速率增量
+#   concurrency: 初始并发上限；max_concurrency: 并发上限的最大值
+#   latency_target: 单次请求耗时超过该值（秒）时降低并发上限
+UPSTREAM_LIMITS = {
+    'deepseek': dict(rate=5.0, min_rate=0.5, max_rate=20.0, rate_step=0.1,
+                     concurrency=8, max_concurrency=32, latency_target=30.0),
+    'dashscope': dict(rate=5.0, min_rate=0.5, max_rate=20.0, rate_step=0.1,
+                      concurrency=8, max_concurrency=32, latency_target=30.0),
+    'baidu': dict(rate=2.0, min_rate=0.5, max_rate=10.0, rate_step=0.05,
+                  concurrency=2, max_concurrency=8, latency_target=5.0),
+}
+
+DEFAULT_LIMIT = dict(rate=1.0, min_rate=0.2, max_rate=5.0, rate_step=0.05,
+                     concurrency=2, max_concurrency=8, latency_target=30.0)
+
+# 当前请求所属的会话，用于公平排队
+_session_key: ContextVar[Optional[str]] = ContextVar('upstream_session_key', default=None)
+
+
+class RateLimitedError(Exception):
+    """上游服务返回限流错误"""
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    """判断异常是否为上游限流（HTTP 429 或百度QPS超限）"""
+    if isinstance(error, RateLimitedError):
+        return True
+    status = getattr(error, 'status_code', None) or getattr(getattr(error, 'response', None), 'status_code', None)
+    if status == 429:
+        return True
+    message = str(error).lower()
+    return '429' in message or 'rate limit' in message
+
+
+def current_session_key() -> Optional[str]:
+    """当前上游请求所属的会话（未设置时为 None）"""
+    return _session_key.get()
+
+
+@contextmanager
+def session_scope(session_key):
+    """在该作用域内发起的上游请求归属于指定会话"""
+    token = _session_key.set(str(session_key) if session_key is not None else None)
+    try:
+        yield
+    finally:
+        _session_key.reset(token)
+
+
+class SlotCancelled(TimeoutError):
+    """取得名额时调用方已放弃本次请求（例如排队期间超时），名额已归还，请求未发出"""
+
+
+class _Ticket:
+    __slots__ = ('granted',)
+
+    def __init__(self):
+        self.granted = False
+
+
+class ProviderLimiter:
+    """单个上游服务的限流器（令牌桶 + 并发上限 + 按会话轮询排队）"""
+
+    def __init__(self, name: str, rate: float, min_rate: float, max_rate: float, rate_step: float,
+                 concurrency: int, max_concurrency: int, latency_target: float):
+        self.name = name
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate_step = rate_step
+        self.concurrency = concurrency
+        self.max_concurrency = max_concurrency
+        self.latency_target = latency_target
+
+        self._cond = threading.Condition()
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()
+        self._queued = 0
+        self._in_flight = 0
+        self._tokens = max(1.0, rate)
+        self._updated = time.monotonic()
+
+        self._completed = 0
+        self._rate_limited = 0
+        self._avg_latency = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(max(1.0, self.rate), self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _dispatch(self):
+        """按会话轮询放行等待中的请求（调用方持有锁）"""
+        self._refill()
+        granted = False
+        while self._queues and self._in_flight < self.concurrency and self._tokens >= 1:
+            key, queue = self._queues.popitem(last=False)
+            ticket = queue.popleft()
+            if queue:
+                self._queues[key] = queue  # 该会话排到队尾
+            ticket.granted = True
+            granted = True
+            self._queued -= 1
+            self._tokens -= 1
+            self._in_flight += 1
+        if granted:
+            self._cond.notify_all()
+
+    def _wait_timeout(self) -> float:
+        """距离下一个令牌产生的时间（调用方持有锁）"""
+        if self._tokens >= 1:
+            return 1.0
+        return max(0.01, (1 - self._tokens) / self.rate)
+
+    def acquire(self):
+        """阻塞直到取得一个请求名额，调用方必须在请求结束后调用 release"""
+        key = _session_key.get() or ''
+        ticket = _Ticket()
+        with self._cond:
+            self._queues.setdefault(key, deque()).append(ticket)
+            self._queued += 1
+            self._dispatch()
+            try:
+                while not ticket.granted:
+                    self._cond.wait(self._wait_timeout())
+                    if not ticket.granted:
+                        self._dispatch()
+            except BaseException:
+                if not ticket.granted:
+                    queue = self._queues.get(key)
+                    if queue is not None and ticket in queue:
+                        queue.remove(ticket)
+                        self._queued -= 1
+                        if not queue:
+                            del self._queues[key]
+                else:
+                    self._in_flight -= 1
+                raise
+
+    def release(self, latency: float, rate_limited: bool = False):
+        """归还请求名额，并根据本次结果调整速率和并发上限"""
+        with self._cond:
+            self._in_flight -= 1
+            self._completed += 1
+            self._avg_latency = latency if self._completed == 1 else 0.8 * self._avg_latency + 0.2 * latency
+            if rate_limited:
+                self._rate_limited += 1
+                self.rate = max(self.min_rate, self.rate / 2)
+                self.concurrency = max(1, self.concurrency // 2)
+                self._tokens = min(self._tokens, 0.0)
+            else:
+                self.rate = min(self.max_rate, self.rate + self.rate_step)
+                if latency > self.latency_target:
+                    self.concurrency = max(1, self.concurrency - 1)
+                elif self._queued and self.concurrency < self.max_concurrency:
+                    self.concurrency += 1
+            self._dispatch()
+            self._cond.notify_all()
+
+    def discard(self):
+        """归还取得后未使用的名额（不计入耗时统计和速率调整）"""
+        with self._cond:
+            self._in_flight -= 1
+            self._dispatch()
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, cancelled: Optional[Callable[[], bool]] = None):
+        """
+        获取请求名额的上下文管理器，自动统计耗时和限流错误
+        :param cancelled: 取得名额后检查调用方是否已放弃，已放弃时归还名额并抛出 SlotCancelled，不执行请求
+        """
+        self.acquire()
+        if cancelled is not None and cancelled():
+            self.discard()
+            raise SlotCancelled(f"{self.name} 请求在排队期间已被放弃")
+        started = time.monotonic()
+        try:
+            yield
+        except BaseException as e:
+            self.release(time.monotonic() - started, rate_limited=is_rate_limited(e))
+            raise
+        self.release(time.monotonic() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        """当前限流状态"""
+        with self._cond:
+            return {
+                "provider": self.name,
+                "rate": round(self.rate, 3),
+                "concurrency": self.concurrency,
+                "in_flight": self._in_flight,
+                "queue_depth": self._queued,
+                "queued_sessions": len(self._queues),
+                "completed": self._completed,
+                "rate_limited": self._rate_limited,
+                "avg_latency": round(self._avg_latency, 3),
+            }
+
+
+_limiters: Dict[str, ProviderLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(provider: str) -> ProviderLimiter:
+    """获取指定上游服务共享的限流器"""
+    with _limiters_lock:
+        if provider not in _limiters:
+            _limiters[provider] = ProviderLimiter(provider, **UPSTREAM_LIMITS.get(provider, DEFAULT_LIMIT))
+        return _limiters[provider]
+
+
+def get_all_stats() -> Dict[str, Dict[str, Any]]:
+    """所有上游服务的限流状态"""
+    for provider in UPSTREAM_LIMITS:
+        get_limiter(provider)
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.stats() for limiter in limiters}
@@ -0,0 +1,335 @@
+"""LLM / 上游调用的统一容错层
+
+所有上游调用经由这里执行：
+- 有限次数重试，退避时间带随机抖动（full jitter）
+- 单次调用超时与整体截止时间
+- 可选的对冲请求：流式调用在 p95 首字延迟内没有收到首个 token 时，再发一个相同请求，取先返回者
+
+每次尝试都会占用 rate_limiter 中对应上游服务的一个名额，直到调用线程真正结束才归还。
+上游客户端使用与单次尝试相同的超时（见 attempt_timeout），超时的请求由客户端中止，
+不会在放弃之后继续占用名额；放弃的流式请求会尽量立即关闭。
+"""
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, wait
+from typing import Callable, Dict, Any, Iterable, List, Optional
+from .rate_limiter import get_limiter, is_rate_limited
+
+# 各阶段的容错策略
+#   retries: 失败后的最大重试次数；attempt_timeout: 单次尝试超时（秒）；deadline: 整体截止时间（秒）
+#   hedge: 是否对流式调用启用对冲请求；hedge_delay: 样本不足时使用的对冲等待时间（秒）
+RETRY_POLICIES = {
+    'talk': dict(retries=2, attempt_timeout=60.0, deadline=120.0, hedge=True, hedge_delay=8.0),
+    # 合并调用（对话 + 史实校验）的输出更长，单独统计重试和首字延迟，策略与 talk 相同
+    'talk_check': dict(retries=2, attempt_timeout=60.0, deadline=120.0, hedge=True, hedge_delay=8.0),
+    'check': dict(retries=2, attempt_timeout=30.0, deadline=60.0, hedge=False, hedge_delay=None),
+    'summary': dict(retries=2, attempt_timeout=180.0, deadline=300.0, hedge=False, hedge_delay=None),
+    'emotion': dict(retries=2, attempt_timeout=10.0, deadline=20.0, hedge=False, hedge_delay=None),
+}
+
+# 单次尝试超时后，等待调用线程结束（上游客户端随即因超时中止）的最长时间（秒）；
+# 线程结束前不发起重试，避免放弃的请求仍占用名额时叠加新的请求
+ABANDON_GRACE = 5.0
+
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+
+# 计算 p95 首字延迟所需的最少样本数
+MIN_LATENCY_SAMPLES = 20
+
+
+class DeadlineExceeded(TimeoutError):
+    """上游调用超过截止时间"""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """限流、超时、连接错误和 5xx 可重试；参数或配置错误不重试"""
+    if is_rate_limited(error) or isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, 'status_code', None) or getattr(getattr(error, 'response', None), 'status_code', None)
+    if isinstance(status, int):
+        return status >= 500
+    name = type(error).__name__
+    return 'Timeout' in name or 'Connection' in name
+
+
+def attempt_timeout(stage: str) -> float:
+    """阶段的单次尝试超时（秒），同时作为上游客户端的请求超时"""
+    return RETRY_POLICIES.get(stage, RETRY_POLICIES['talk'])['attempt_timeout']
+
+
+def backoff_delay(attempt: int) -> float:
+    """第 attempt 次重试前的等待时间（full jitter）"""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+class _StageStats:
+    """单个阶段的调用统计"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.first_token_latencies = deque(maxlen=200)
+        self.calls = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.deadline_exceeded = 0
+        self.failures = 0
+        self.abandoned = 0  # 超时放弃后调用线程仍未结束（仍占用名额）的次数
+
+    def p95(self) -> Optional[float]:
+        with self.lock:
+            if len(self.first_token_latencies) < MIN_LATENCY_SAMPLES:
+                return None
+            samples = sorted(self.first_token_latencies)
+        return samples[int(len(samples) * 0.95) - 1]
+
+    def snapshot(self) -> Dict[str, Any]:
+        p95 = self.p95()
+        with self.lock:
+            return {
+                "calls": self.calls,
+                "retries": self.retries,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "deadline_exceeded": self.deadline_exceeded,
+                "failures": self.failures,
+                "abandoned": self.abandoned,
+                "p95_first_token": round(p95, 3) if p95 is not None else None,
+            }
+
+
+_stats: Dict[str, _StageStats] = {stage: _StageStats() for stage in RETRY_POLICIES}
+
+
+def _count(stage: str, field: str):
+    stats = _stats[stage]
+    with stats.lock:
+        setattr(stats, field, getattr(stats, field) + 1)
+
+
+def _run_in_thread(fn: Callable[[], Any]) -> Future:
+    """在独立线程中执行（继承当前 contextvars，例如限流器的会话归属）"""
+    future = Future()
+    context = contextvars.copy_context()
+
+    def runner():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(context.run(fn))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=runner, daemon=True).start()
+    return future
+
+
+def _retry_loop(stage: str, attempt_fn: Callable[[float], Any]) -> Any:
+    """按阶段策略重试 attempt_fn(剩余时间)，直到成功、不可重试或超过截止时间"""
+    policy = RETRY_POLICIES[stage]
+    deadline_at = time.monotonic() + policy['deadline']
+    _count(stage, 'calls')
+
+    error = None
+    for attempt in range(policy['retries'] + 1):
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            break
+        if attempt > 0:
+            _count(stage, 'retries')
+        try:
+            return attempt_fn(min(remaining, policy['attempt_timeout']))
+        except Exception as e:
+            error = e
+            if isinstance(e, DeadlineExceeded):
+                _count(stage, 'deadline_exceeded')
+            if not is_retryable(e):
+                break
+        delay = min(backoff_delay(attempt), max(0.0, deadline_at - time.monotonic()))
+        time.sleep(delay)
+
+    _count(stage, 'failures')
+    if error is None:
+        _count(stage, 'deadline_exceeded')
+        error = DeadlineExceeded(f"{stage} 调用超过截止时间 {policy['deadline']}s")
+    raise error
+
+
+def call(fn: Callable[[], Any], stage: str, provider: str = 'deepseek') -> Any:
+    """
+    带重试和超时的上游调用
+    :param fn: 实际发起请求的函数，例如 lambda: model.invoke(prompt)
+    :param stage: 调用阶段（talk / check / summary / emotion），决定容错策略
+    :param provider: 上游服务，用于限流
+    """
+    def attempt(timeout: float):
+        cancelled = threading.Event()
+
+        def limited():
+            with get_limiter(provider).slot(cancelled.is_set):
+                return fn()
+
+        future = _run_in_thread(limited)
+        # 上游客户端的超时与单次超时相同，超时后调用线程通常随即结束并归还名额，等待其结束后再重试
+        # （以 future 是否结束判断，客户端抛出的 TimeoutError 不会被误当作等待超时）。
+        # 超时时仍在排队的调用取得名额后直接归还，不再发出请求
+        wait([future], timeout=timeout)
+        if not future.done():
+            cancelled.set()
+            wait([future], timeout=ABANDON_GRACE)
+        if not future.done():
+            _count(stage, 'abandoned')
+            raise DeadlineExceeded(f"{stage} 单次调用超过 {timeout:.1f}s")
+        return future.result()
+
+    return _retry_loop(stage, attempt)
+
+
+class _StreamAttempt:
+    """一次流式请求，在后台线程中读取并累积内容"""
+
+    def __init__(self, make_stream: Callable[[], Iterable[Any]], provider: str, cond: threading.Condition):
+        self.make_stream = make_stream
+        self.provider = provider
+        self.cond = cond
+        self.chunks: List[Any] = []
+        self.started_at = None
+        self.first_token_at = None
+        self.done = False
+        self.error = None
+        self.cancelled = False
+        self.stream = None
+
+    def start(self):
+        _run_in_thread(self._run)
+
+    def cancel(self):
+        """放弃本次请求并尽量立即关闭流；流正在等待数据时无法从其他线程关闭，由上游客户端的超时中止"""
+        self.cancelled = True
+        stream = self.stream
+        if stream is not None and hasattr(stream, 'close'):
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+    def _run(self):
+        stream = None
+        try:
+            with get_limiter(self.provider).slot(lambda: self.cancelled):
+                self.started_at = time.monotonic()
+                stream = self.stream = self.make_stream()
+                if self.cancelled:
+                    return
+                for chunk in stream:
+                    if self.cancelled:
+                        break
+                    with self.cond:
+                        if self.first_token_at is None and getattr(chunk, 'content', None):
+                            self.first_token_at = time.monotonic()
+                        self.chunks.append(chunk)
+                        self.cond.notify_all()
+        except Exception as e:
+            self.error = e
+        finally:
+            if stream is not None and hasattr(stream, 'close'):
+                try:
+                    stream.close()
+                except Exception:
+                    pass
+            with self.cond:
+                self.done = True
+                self.cond.notify_all()
+
+
+def collect_stream(make_stream: Callable[[], Iterable[Any]], stage: str,
+                   provider: str = 'deepseek') -> List[Any]:
+    """
+    带重试、超时和对冲的流式调用，返回完整的 chunk 列表
+    :param make_stream: 发起流式请求的函数，例如 lambda: model.stream(prompt)
+    """
+    policy = RETRY_POLICIES[stage]
+    stats = _stats[stage]
+
+    def attempt(timeout: float):
+        attempt_deadline = time.monotonic() + timeout
+        cond = threading.Condition()
+        attempts = [_StreamAttempt(make_stream, provider, cond)]
+        attempts[0].start()
+
+        def remaining():
+            return attempt_deadline - time.monotonic()
+
+        def abandon(abandoned):
+            """放弃请求，并等待其线程结束（归还名额）后再返回，超过等待时间仍未结束的计入 abandoned"""
+            for a in abandoned:
+                a.cancel()
+            grace_until = time.monotonic() + ABANDON_GRACE
+            while any(not a.done for a in abandoned) and time.monotonic() < grace_until:
+                cond.wait(grace_until - time.monotonic())
+            for a in abandoned:
+                if not a.done:
+                    _count(stage, 'abandoned')
+
+        with cond:
+            # 等待首个 token，超过 p95 仍无返回时发起对冲请求
+            if policy['hedge']:
+                hedge_delay = stats.p95() or policy['hedge_delay']
+                hedge_at = time.monotonic() + hedge_delay
+                while (attempts[0].first_token_at is None and not attempts[0].done
+                       and time.monotonic() < hedge_at and remaining() > 0):
+                    cond.wait(min(hedge_at - time.monotonic(), remaining()))
+                if attempts[0].first_token_at is None and not attempts[0].done and remaining() > 0:
+                    _count(stage, 'hedges')
+                    attempts.append(_StreamAttempt(make_stream, provider, cond))
+                    attempts[1].start()
+
+            # 取最先返回首个 token 的请求
+            winner = None
+            while remaining() > 0:
+                started = [a for a in attempts if a.first_token_at is not None]
+                if started:
+                    winner = min(started, key=lambda a: a.first_token_at)
+                    break
+                finished = [a for a in attempts if a.done]
+                if len(finished) == len(attempts):
+                    # 全部结束且没有任何内容：有错误则抛出，否则视为空响应
+                    errors = [a.error for a in attempts if a.error is not None]
+                    if errors:
+                        raise errors[0]
+                    winner = attempts[0]
+                    break
+                cond.wait(remaining())
+
+            if winner is None:
+                abandon(attempts)
+                raise DeadlineExceeded(f"{stage} 在 {timeout:.1f}s 内未收到首个 token")
+
+            for a in attempts:
+                if a is not winner:
+                    a.cancel()
+            if winner is not attempts[0]:
+                _count(stage, 'hedge_wins')
+            if winner.first_token_at is not None and winner.started_at is not None:
+                with stats.lock:
+                    stats.first_token_latencies.append(winner.first_token_at - winner.started_at)
+
+            while not winner.done and remaining() > 0:
+                cond.wait(remaining())
+            if not winner.done:
+                abandon([winner])
+                raise DeadlineExceeded(f"{stage} 流式响应超过 {timeout:.1f}s 未结束")
+            if winner.error is not None:
+                raise winner.error
+            return list(winner.chunks)
+
+    return _retry_loop(stage, attempt)
+
+
+def get_stats() -> Dict[str, Dict[str, Any]]:
+    """各阶段的重试、对冲和首字延迟统计"""
+    return {stage: stats.snapshot() for stage, stats in _stats.items()}
@@ -0,0 +1,87 @@
+"""会话的物化 JSON 视图
+
+读取会话时需要查询问答和可疑语句并逐个序列化（包括每个时间字段的 isoformat），是读请求的主要开销。
+这里按会话缓存序列化后的 JSON 字节，并记录生成时的会话版本号（见 ChatService.get_session_versions）：
+- 每轮提交后立即重建该会话的视图（在对话的后台线程中，不占用读请求）
+- 读取时版本号一致直接返回缓存的字节，不一致（例如其他进程提交了新的一轮）时重建
+- /dialogues 由各会话的视图直接拼接，不再整体序列化
+"""
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+# 最多缓存的会话数，超出后移除最久未读取的
+SESSION_VIEW_MAX = 2000
+
+
+def serialize(view: Dict[str, Any]) -> bytes:
+    return json.dumps(view, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class SessionViewCache:
+    """session_id -> (版本号, JSON 字节)"""
+
+    def __init__(self, max_size: int = SESSION_VIEW_MAX):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._views: "OrderedDict[int, Tuple[str, bytes]]" = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def lookup(self, session_id: int, version: str) -> Optional[bytes]:
+        """版本号一致时返回缓存的视图"""
+        with self._lock:
+            cached = self._views.get(session_id)
+            if cached is None or cached[0] != version:
+                self._misses += 1
+                return None
+            self._views.move_to_end(session_id)
+            self._hits += 1
+            return cached[1]
+
+    def store(self, session_id: int, version: str, view: Dict[str, Any]) -> bytes:
+        data = serialize(view)
+        with self._lock:
+            self._views[session_id] = (version, data)
+            self._views.move_to_end(session_id)
+            while len(self._views) > self.max_size:
+                self._views.popitem(last=False)
+        return data
+
+    def get(self, session_id: int, version: str, build: Callable[[], Optional[Dict[str, Any]]]) -> Optional[bytes]:
+        """读取视图，缓存失效时调用 build 重建；会话不存在时返回 None"""
+        data = self.lookup(session_id, version)
+        if data is not None:
+            return data
+        view = build()
+        if view is None:
+            return None
+        return self.store(session_id, version, view)
+
+    def render_collection(self, versions: Dict[int, Dict[str, Any]],
+                          build: Callable[[Iterable[int]], Dict[int, Dict[str, Any]]]) -> bytes:
+        """
+        拼接多个会话的视图为 {session_id: 会话} 的 JSON
+        :param build: 批量重建缓存失效的会话，返回 {session_id: 会话字典}
+        """
+        parts: Dict[int, bytes] = {}
+        missing = []
+        for session_id, item in versions.items():
+            data = self.lookup(session_id, item['version'])
+            if data is None:
+                missing.append(session_id)
+            else:
+                parts[session_id] = data
+        if missing:
+            for session_id, view in build(missing).items():
+                parts[session_id] = self.store(session_id, versions[session_id]['version'], view)
+        body = b','.join(b'"%d":%s' % (session_id, parts[session_id]) for session_id in sorted(parts))
+        return b'{' + body + b'}'
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"sessions": len(self._views), "hits": self._hits, "misses": self._misses}
+
+
+views = SessionViewCache()
@@ -0,0 +1,238 @@
+"""跨进程共享的缓存
+
+多进程部署时各 worker 的内存互不可见，会话历史、史实校验和情绪识别结果放在共享缓存中，
+任一 worker 算过的结果其他 worker 都能直接使用。
+
+后端由 SHARED_CACHE_BACKEND 选择：
+- memory: 进程内字典（单进程开发时使用，默认）
+- sqlite: 本机共享的 SQLite 文件（SHARED_CACHE_PATH），同一台机器上的 worker 共用
+- redis: Redis（REDIS_URL），多台机器共用；需要安装 redis 包，未安装时回退到 sqlite
+
+值以 JSON 存储，键由 命名空间 + 键 组成，每条记录有过期时间。缓存读写失败只打印日志，不影响请求。
+add 只在键不存在（或已过期）时写入，各后端都是原子的，可用于跨进程的"首次请求"判断。
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+SHARED_CACHE_BACKEND = os.environ.get('SHARED_CACHE_BACKEND', 'memory')
+SHARED_CACHE_PATH = os.environ.get('SHARED_CACHE_PATH') or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'shared_cache.sqlite3')
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+KEY_PREFIX = 'reporter:'
+
+# 各命名空间的过期时间（秒）
+CACHE_TTL = {
+    'history': 3600,
+    'check': 7 * 24 * 3600,
+    'emotion': 7 * 24 * 3600,
+}
+DEFAULT_TTL = 3600
+
+# 内存后端最多保留的条目数；SQLite 后端每写入多少次清理一次过期记录
+MEMORY_MAX_ENTRIES = 10000
+SQLITE_PURGE_EVERY = 500
+
+
+def digest(text: str) -> str:
+    """长文本键的摘要"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class MemoryCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data: Dict[str, tuple] = {}
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item[1] < time.time():
+                del self._data[key]
+                return None
+            return item[0]
+
+    def set(self, key: str, value: str, ttl: int):
+        with self._lock:
+            self._store(key, value, ttl)
+
+    def add(self, key: str, value: str, ttl: int) -> bool:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[1] >= time.time():
+                return False
+            self._store(key, value, ttl)
+            return True
+
+    def _store(self, key: str, value: str, ttl: int):
+        """写入一条记录，超出数量上限时先清理（调用方持有锁）"""
+        if len(self._data) >= MEMORY_MAX_ENTRIES:
+            now = time.time()
+            for expired in [k for k, (_, expires_at) in self._data.items() if expires_at < now]:
+                del self._data[expired]
+            while len(self._data) >= MEMORY_MAX_ENTRIES:
+                del self._data[next(iter(self._data))]
+        self._data[key] = (value, time.time() + ttl)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class SQLiteCache:
+    """多个进程共用一个 SQLite 文件（WAL 模式，读写互不阻塞），每个线程一个连接"""
+
+    def __init__(self, path: str = SHARED_CACHE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, key: str) -> Optional[str]:
+        row = self._connection().execute(
+            "SELECT value FROM cache WHERE key = ? AND expires_at >= ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, ttl: int):
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)", (key, value, time.time() + ttl)
+        )
+        self._writes += 1
+        if self._writes % SQLITE_PURGE_EVERY == 0:
+            connection.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+
+    def add(self, key: str, value: str, ttl: int) -> bool:
+        now = time.time()
+        cursor = self._connection().execute(
+            "INSERT INTO cache (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at "
+            "WHERE cache.expires_at < ?", (key, value, now + ttl, now)
+        )
+        return cursor.rowcount > 0
+
+    def delete(self, key: str):
+        self._connection().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+
+class RedisCache:
+    def __init__(self, url: str = REDIS_URL):
+        import redis
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[str]:
+        value = self._client.get(key)
+        return value.decode('utf-8') if value is not None else None
+
+    def set(self, key: str, value: str, ttl: int):
+        self._client.set(key, value, ex=ttl)
+
+    def add(self, key: str, value: str, ttl: int) -> bool:
+        return bool(self._client.set(key, value, ex=ttl, nx=True))
+
+    def delete(self, key: str):
+        self._client.delete(key)
+
+
+def _create_backend():
+    if SHARED_CACHE_BACKEND == 'redis':
+        try:
+            return RedisCache()
+        except ImportError:
+            print("共享缓存使用 Redis 需要安装 redis 包，改用 SQLite")
+            return SQLiteCache()
+    if SHARED_CACHE_BACKEND == 'sqlite':
+        return SQLiteCache()
+    return MemoryCache()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+_stats: Dict[str, Dict[str, int]] = {}
+
+
+def get_backend():
+    """共享缓存后端（首次使用时创建）"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = _create_backend()
+    return _backend
+
+
+def _count(namespace: str, field: str):
+    counter = _stats.setdefault(namespace, {'hits': 0, 'misses': 0, 'errors': 0})
+    counter[field] += 1
+
+
+def get(namespace: str, key: str) -> Optional[Any]:
+    """读取缓存，不存在、已过期或读取失败时返回 None"""
+    try:
+        value = get_backend().get(f"{KEY_PREFIX}{namespace}:{key}")
+    except Exception as e:
+        print(f"读取共享缓存失败（{namespace}）: {e}")
+        _count(namespace, 'errors')
+        return None
+    _count(namespace, 'misses' if value is None else 'hits')
+    return json.loads(value) if value is not None else None
+
+
+def put(namespace: str, key: str, value: Any, ttl: Optional[int] = None):
+    """写入缓存（值需可 JSON 序列化）"""
+    try:
+        get_backend().set(f"{KEY_PREFIX}{namespace}:{key}", json.dumps(value, ensure_ascii=False),
+                          ttl or CACHE_TTL.get(namespace, DEFAULT_TTL))
+    except Exception as e:
+        print(f"写入共享缓存失败（{namespace}）: {e}")
+        _count(namespace, 'errors')
+
+
+def add(namespace: str, key: str, value: Any, ttl: Optional[int] = None) -> bool:
+    """
+    键不存在时写入缓存
+    :return: 是否写入；写入失败时返回 True（按首次请求处理，与缓存不可用时一致）
+    """
+    try:
+        return get_backend().add(f"{KEY_PREFIX}{namespace}:{key}", json.dumps(value, ensure_ascii=False),
+                                 ttl or CACHE_TTL.get(namespace, DEFAULT_TTL))
+    except Exception as e:
+        print(f"写入共享缓存失败（{namespace}）: {e}")
+        _count(namespace, 'errors')
+        return True
+
+
+def delete(namespace: str, key: str):
+    """删除缓存记录"""
+    try:
+        get_backend().delete(f"{KEY_PREFIX}{namespace}:{key}")
+    except Exception as e:
+        print(f"删除共享缓存失败（{namespace}）: {e}")
+        _count(namespace, 'errors')
+
+
+def get_stats() -> Dict[str, Any]:
+    """当前进程的缓存命中统计"""
+    return {
+        "backend": type(get_backend()).__name__,
+        "pid": os.getpid(),
+        "namespaces": {namespace: dict(counter) for namespace, counter in _stats.items()},
+    }
@@ -0,0 +1,59 @@
+"""SSE 响应压缩
+
+按请求的 Accept-Encoding 选择 brotli（需要安装 brotli 包）或 gzip。流式响应不能等到结束再压缩，
+每个事件压缩后立即刷新（gzip 使用 Z_SYNC_FLUSH），客户端收到的每一段都能直接解压出完整事件。
+"""
+import zlib
+from typing import Iterable, Iterator, Optional
+
+SSE_COMPRESSION_ENABLED = True
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def available_encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """根据 Accept-Encoding 选择压缩方式，不支持压缩时返回 None"""
+    if not SSE_COMPRESSION_ENABLED or not accept_encoding:
+        return None
+    accepted = set()
+    for item in accept_encoding.split(','):
+        name, *params = item.split(';')
+        quality = 1.0
+        for param in params:
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(name.strip().lower())
+    for encoding in available_encodings():
+        if encoding in accepted or '*' in accepted:
+            return encoding
+    return None
+
+
+def compress(events: Iterable[str], encoding: str) -> Iterator[bytes]:
+    """逐个事件压缩并刷新"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for event in events:
+            yield compressor.process(event.encode('utf-8')) + compressor.flush()
+        yield compressor.finish()
+        return
+
+    # wbits=31: gzip 格式
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    for event in events:
+        yield compressor.compress(event.encode('utf-8')) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
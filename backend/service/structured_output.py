@@ -0,0 +1,276 @@
+"""结构化输出：JSON 模式调用 + 本地修复解析
+
+模型以 JSON 模式调用（DeepSeek response_format=json_object），保证输出是一个 JSON 对象；
+字段和类型再按下面的 schema 在本地校验、规整。
+模型输出仍不合法时（代码块包裹、前后夹带解释文字、尾随逗号、输出被截断等），
+由流式修复解析器补全后再解析，避免为一次格式错误重新调用模型。
+"""
+import json
+from typing import Dict, Any, Optional, List
+
+# 结构化输出模式：'json' 使用上游 JSON 模式；'off' 仅依赖提示词约束（兼容不支持 JSON 模式的模型）
+STRUCTURED_OUTPUT_MODE = 'json'
+
+# 各阶段输出的 schema（JSON Schema 子集：object / string / integer / boolean / array）
+TALK_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "process": {"type": "string"},
+        "question": {"type": "string"},
+        "aim": {"type": "string"},
+        "is_finished": {"type": "integer", "enum": [0, 1]},
+    },
+    "required": ["process", "question", "aim", "is_finished"],
+}
+
+CHECK_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "dubious": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["dubious"],
+}
+
+# 对话与史实校验合并调用时的输出
+TALK_CHECK_SCHEMA = {
+    "type": "object",
+    "properties": {**TALK_SCHEMA["properties"], **CHECK_SCHEMA["properties"]},
+    "required": TALK_SCHEMA["required"] + CHECK_SCHEMA["required"],
+}
+
+_TRUE_WORDS = ('1', 'true', 'yes', '是', '结束')
+_FALSE_WORDS = ('0', 'false', 'no', '否', '继续', '')
+
+
+def bind_json_mode(model):
+    """为模型开启 JSON 模式（对 invoke 和 stream 均生效）"""
+    if STRUCTURED_OUTPUT_MODE != 'json':
+        return model
+    return model.bind(response_format={"type": "json_object"})
+
+
+class StreamingJsonRepairer:
+    """
+    增量扫描模型输出，记录字符串、转义和括号嵌套状态，随时可以补全为合法 JSON
+
+    用法：
+        repairer = StreamingJsonRepairer()
+        for chunk in chunks:
+            repairer.feed(chunk)
+        text = repairer.close()
+    """
+
+    def __init__(self):
+        self._parts: List[str] = []
+        self._stack: List[str] = []     # 未闭合的 '{' / '['
+        self._started = False           # 是否已遇到第一个 '{'
+        self._done = False              # 顶层对象是否已闭合
+        self._in_string = False
+        self._escape = False
+        self._quote = '"'
+        self._pending_word = ''         # 字符串外的裸词，例如 true / None
+        self._string_start = -1         # 最近一个字符串在 _parts 中的起止位置
+        self._string_end = -1
+
+    def feed(self, text: str):
+        """追加一段模型输出"""
+        for ch in text:
+            if self._done:
+                return
+            if not self._started:
+                if ch == '{':
+                    self._started = True
+                    self._stack.append('{')
+                    self._parts.append(ch)
+                continue
+            self._consume(ch)
+
+    def _consume(self, ch: str):
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+                self._parts.append(ch)
+            elif ch == '\\':
+                self._escape = True
+                self._parts.append(ch)
+            elif ch == self._quote:
+                self._in_string = False
+                self._parts.append('"')
+                self._string_end = len(self._parts)
+            elif ch == '"':
+                self._parts.append('\\"')   # 单引号字符串内的双引号
+            elif ch == '\n':
+                self._parts.append('\\n')
+            elif ch in '\r\t':
+                self._parts.append('\\r' if ch == '\r' else '\\t')
+            else:
+                self._parts.append(ch)
+            return
+
+        if ch.isalnum() or ch in '_.-+':
+            self._pending_word += ch
+            return
+        self._flush_word()
+
+        if ch in '"\'':
+            self._in_string = True
+            self._quote = ch
+            self._string_start = len(self._parts)
+            self._parts.append('"')
+        elif ch in '{[':
+            self._stack.append(ch)
+            self._parts.append(ch)
+        elif ch in '}]':
+            self._drop_trailing_comma()
+            if self._stack:
+                self._stack.pop()
+            self._parts.append('}' if ch == '}' else ']')
+            if not self._stack:
+                self._done = True
+        elif ch in ',:':
+            self._parts.append(ch)
+        elif ch in '，：':
+            self._parts.append(',' if ch == '，' else ':')
+        # 其余字符（空白、代码块标记等）在字符串外直接丢弃
+
+    def _flush_word(self):
+        word = self._pending_word
+        if not word:
+            return
+        self._pending_word = ''
+        formatted = _format_word(word)
+        if formatted.startswith('"'):
+            self._string_start = len(self._parts)
+            self._parts.append(formatted)
+            self._string_end = len(self._parts)
+        else:
+            self._parts.append(formatted)
+
+    def _drop_trailing_comma(self):
+        if self._parts and self._parts[-1] == ',':
+            self._parts.pop()
+
+    def close(self) -> Optional[str]:
+        """结束输入，补全未闭合的字符串和括号，返回修复后的 JSON 文本；未遇到对象时返回 None"""
+        if not self._started:
+            return None
+        parts = list(self._parts)
+        if not self._done:
+            if self._in_string:
+                if self._escape:
+                    parts.pop()
+                parts.append('"')
+            elif self._pending_word and not (self._stack[-1] == '{' and parts[-1] in ('{', ',')):
+                parts.append(_format_word(self._pending_word))
+            # 截断在键或冒号之后时，去掉不完整的键值对
+            ends_with_string = self._in_string or self._string_end == len(self._parts)
+            if (self._stack[-1] == '{' and ends_with_string and not self._pending_word
+                    and parts[self._string_start - 1] in ('{', ',')):
+                del parts[self._string_start:]
+            elif parts and parts[-1] == ':':
+                del parts[self._string_start:]
+            while parts and parts[-1] == ',':
+                parts.pop()
+            for opener in reversed(self._stack):
+                parts.append('}' if opener == '{' else ']')
+        return ''.join(parts)
+
+
+def _format_word(word: str) -> str:
+    """字符串外的裸词：字面量和数字原样输出，其余视为未加引号的键或值"""
+    literals = {'True': 'true', 'False': 'false', 'None': 'null', 'NULL': 'null'}
+    word = literals.get(word, word)
+    if word in ('true', 'false', 'null'):
+        return word
+    try:
+        float(word)
+        return word
+    except ValueError:
+        return json.dumps(word, ensure_ascii=False)
+
+
+def repair_json(text: str) -> Optional[Dict[str, Any]]:
+    """修复并解析模型输出中的 JSON 对象，无法修复时返回 None"""
+    repairer = StreamingJsonRepairer()
+    repairer.feed(text)
+    repaired = repairer.close()
+    if repaired is None:
+        return None
+    try:
+        parsed = json.loads(repaired)
+    except json.JSONDecodeError:
+        return None
+    return parsed if isinstance(parsed, dict) else None
+
+
+def _coerce(value: Any, schema: Dict[str, Any]) -> Any:
+    """按 schema 规整字段类型，无法规整时抛出 ValueError"""
+    expected = schema.get('type')
+    if expected == 'string':
+        if value is None:
+            return ''
+        return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+    if expected == 'integer':
+        if isinstance(value, bool):
+            value = int(value)
+        elif isinstance(value, str):
+            word = value.strip().lower()
+            if word in _TRUE_WORDS:
+                value = 1
+            elif word in _FALSE_WORDS:
+                value = 0
+            else:
+                value = int(word)
+        elif isinstance(value, float):
+            value = int(value)
+        if not isinstance(value, int):
+            raise ValueError(f"字段类型应为整数: {value!r}")
+        if 'enum' in schema and value not in schema['enum']:
+            raise ValueError(f"字段取值不在范围内: {value!r}")
+        return value
+    if expected == 'boolean':
+        if isinstance(value, str):
+            return value.strip().lower() in _TRUE_WORDS
+        return bool(value)
+    if expected == 'array':
+        if value is None:
+            return []
+        if not isinstance(value, list):
+            value = [value]
+        item_schema = schema.get('items', {})
+        return [_coerce(item, item_schema) for item in value if item is not None]
+    return value
+
+
+def validate(parsed: Dict[str, Any], schema: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """校验必需字段并规整类型，不符合 schema 时返回 None"""
+    for field in schema.get('required', []):
+        if field not in parsed:
+            return None
+    try:
+        for field, field_schema in schema.get('properties', {}).items():
+            if field in parsed:
+                parsed[field] = _coerce(parsed[field], field_schema)
+    except (ValueError, TypeError):
+        return None
+    return parsed
+
+
+def parse(response_content: Optional[str], schema: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    解析模型输出：先直接解析，失败时本地修复，最后按 schema 校验
+    :return: 解析并规整后的字典，无法解析或缺少字段时返回 None
+    """
+    if not response_content:
+        return None
+    try:
+        parsed = json.loads(response_content.strip())
+        if not isinstance(parsed, dict):
+            parsed = None
+    except json.JSONDecodeError:
+        parsed = None
+    if parsed is None:
+        parsed = repair_json(response_content)
+        if parsed is None:
+            return None
+    return validate(parsed, schema)
@@ -1,5 +1,7 @@
-from .system_prompt import summary_system_prompt
-from langchain.chat_models import init_chat_model
+from . import prompt_registry
+from . import resilience
+from . import token_usage
+from . import model_router
 import dotenv
 import getpass
 import os
@@ -22,19 +24,15 @@ def summary(context: str, debug: bool = False) -> str:
     if not context or not context.strip():
         raise ValueError("Context is empty")
         
-    # 初始化模型
-    model = init_chat_model(
-        model="deepseek-chat",
-        model_provider="deepseek",
-        temperature=0,
-        openai_api_key=os.environ.get('DEEPSEEK_API_KEY'),
-        base_url="https://api.deepseek.com/v1"
-    )
-    
     # 构造完整提示词
-    full_prompt = summary_system_prompt + "\n\n" + context
+    full_prompt = prompt_registry.render('summary', context)
+    
+    # 按阶段和输入长度选择模型（超长采访记录使用长上下文模型）
+    selected = model_router.route('summary', full_prompt)
+    model = model_router.get_model(selected)
     
     # 调用模型
-    response = model.invoke(full_prompt)
+    response = resilience.call(lambda: model.invoke(full_prompt), stage='summary', provider=selected.limiter)
+    token_usage.record('summary', selected.model_name, response)
     
     return response.content if response and hasattr(response, 'content') else ""
\ No newline at end of file
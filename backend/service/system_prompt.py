@@ -211,6 +211,37 @@ emotion: 中性
 
 """
 
+# ===对话+史实校验合并调用系统提示词===
+# 在对话提示词的上下文输入之前追加史实校验任务，一次调用同时输出五个字段
+
+talk_check_task_prompt = """
+# 附加任务：史实校验
+
+除上述四个字段外，你还必须输出第五个字段 `"dubious"`：
+从**最新一轮的回答（answer）**中识别提到的重大历史事件或社会事件，输出标准化、通用化的事件名称数组。
+
+- 应识别：国内外重大政治事件、经济与金融事件、科技与社会变革、战争与冲突、重大自然灾害或社会运动、具有时代标志意义的政策或计划（如“改革开放”“亚洲金融危机”“加入世贸”“汶川地震”）
+- 不应识别：个人或企业事件、职业经历、家庭或情感经历、内部事务（如“公司倒闭”“担任厂长”“父亲去世”“融资完成”）
+- 只看最新一轮回答，不要重复提取历史对话中的事件
+- 若未提及任何重大历史或社会事件，输出 `"dubious": []`
+
+输出示例：
+{
+  "process": "时代篇 30%（经历了亚洲金融危机，但缺少应对细节）",
+  "question": "金融危机那段时间，您是怎么带着公司挺过来的？",
+  "aim": "深入关键经历的细节",
+  "is_finished": 0,
+  "dubious": ["亚洲金融危机"]
+}
+
+---
+"""
+
+_talk_context_marker = "# 7. 上下文输入"
+talk_check_system_prompt = talk_system_prompt.replace(
+    _talk_context_marker, talk_check_task_prompt + _talk_context_marker, 1
+)
+
 # ===史实校验模块系统提示词===
 
 check_system_prompt = """
@@ -5,8 +5,12 @@ import json
 import time
 import sys
 from typing import Dict, Optional, Any, Generator
-from langchain.chat_models import init_chat_model
-from .system_prompt import talk_system_prompt
+from . import prompt_registry
+from .rate_limiter import is_rate_limited
+from . import resilience
+from . import structured_output
+from . import token_usage
+from . import model_router
 
 def validate_environment() -> bool:
     """验证环境配置是否正确"""
@@ -29,48 +33,19 @@ def validate_environment() -> bool:
     except Exception as e:
         return False
 
-def parse_response(response_content: str) -> Optional[Dict[str, Any]]:
-    """解析AI响应的JSON内容"""
-    try:
-        # 尝试直接解析JSON
-        parsed = json.loads(response_content.strip())
-        
-        # 验证必需字段（新增 is_finished 字段）
-        required_fields = ['process', 'question', 'aim', 'is_finished']
-        for field in required_fields:
-            if field not in parsed:
-                return None
-                
-        return parsed
-        
-    except json.JSONDecodeError as e:
-        # 尝试提取JSON部分（如果响应包含其他文本）
-        try:
-            start = response_content.find('{')
-            end = response_content.rfind('}') + 1
-            if start >= 0 and end > start:
-                json_part = response_content[start:end]
-                parsed = json.loads(json_part)
-                # 验证必需字段
-                required_fields = ['process', 'question', 'aim', 'is_finished']
-                for field in required_fields:
-                    if field not in parsed:
-                        return None
-                return parsed
-        except Exception as extract_error:
-            pass
-            
-        return None
-    except Exception as e:
-        return None
+def parse_response(response_content: str, with_check: bool = False) -> Optional[Dict[str, Any]]:
+    """解析AI响应的JSON内容（格式不合法时在本地修复，并按 schema 校验字段）"""
+    schema = structured_output.TALK_CHECK_SCHEMA if with_check else structured_output.TALK_SCHEMA
+    return structured_output.parse(response_content, schema)
 
-def talk_stream(context: str, debug: bool = False) -> Generator[Dict[str, Any], None, None]:
+def talk_stream(context: str, debug: bool = False, with_check: bool = False) -> Generator[Dict[str, Any], None, None]:
     """
     流式智能对话函数
     
     Args:
         context (str): 对话上下文
         debug (bool): 是否开启调试模式
+        with_check (bool): 是否在同一次调用中完成史实校验（结果额外包含 dubious 字段）
         
     Yields:
         Dict[str, Any]: 包含状态和部分内容的响应
@@ -92,60 +67,39 @@ def talk_stream(context: str, debug: bool = False) -> Generator[Dict[str, Any],
             yield {'type': 'error', 'content': '❌ 上下文不能为空', 'data': None}
             return
                     
-        # 初始化模型
-        model = init_chat_model(
-            model="deepseek-chat",
-            model_provider="deepseek",
-            temperature=0,
-            openai_api_key=os.environ.get('DEEPSEEK_API_KEY'),
-            base_url="https://api.deepseek.com/v1"
-        )
-                
         # 构造完整提示词
-        full_prompt = talk_system_prompt + "\n\n" + context
+        stage = 'talk_check' if with_check else 'talk'
+        full_prompt = prompt_registry.render(stage, context)
+        
+        # 按阶段和输入长度选择模型（流式响应的最后一个 chunk 携带 token 用量）
+        selected = model_router.route(stage, full_prompt)
+        model = structured_output.bind_json_mode(model_router.get_model(selected, stream_usage=True))
         
-        # 调用模型获取流式响应
+        # 调用模型获取流式响应（重试、超时和对冲请求由 resilience 处理）
         try:
-            response = model.stream(full_prompt)
-            collected_content = ""
-                        
-            for chunk in response:
-                if hasattr(chunk, 'content') and chunk.content:
-                    collected_content += chunk.content
-                        
-            # 解析最终响应
-            parsed_data = parse_response(collected_content)
-            
-            if parsed_data is None:
-                yield {'type': 'error', 'content': '❌ 解析回答失败', 'data': None}
-                return
-            
-            # 返回最终结果
-            yield {'type': 'final', 'content': '✅ AI分析完成', 'data': parsed_data}
-            return
-                            
+            chunks = resilience.collect_stream(lambda: model.stream(full_prompt), stage=stage,
+                                               provider=selected.limiter)
         except Exception as stream_error:
-            # 如果流式调用失败，回退到普通调用
-            yield {'type': 'error', 'content': '⚠️ 流式模式失败，切换到普通模式...', 'data': None}
-            
-            response = model.invoke(full_prompt)
-            
-            if not response or not hasattr(response, 'content'):
-                yield {'type': 'error', 'content': '❌ AI模型响应无效', 'data': None}
-                return
-                
-            raw_content = response.content
-            
-            # 解析响应
-            parsed_data = parse_response(raw_content)
-            
-            if parsed_data is None:
-                yield {'type': 'error', 'content': '❌ 解析回答失败', 'data': None}
-                return
-            
-            # 返回最终结果
-            yield {'type': 'final', 'content': '✅ AI分析完成', 'data': parsed_data}
+            if is_rate_limited(stream_error):
+                yield {'type': 'error', 'content': '❌ AI服务繁忙（限流），请稍后重试', 'data': None}
+            else:
+                yield {'type': 'error', 'content': f'❌ AI模型调用失败: {stream_error}', 'data': None}
             return
+        token_usage.record(stage, selected.model_name, chunks)
+        
+        collected_content = "".join(
+            chunk.content for chunk in chunks if hasattr(chunk, 'content') and chunk.content
+        )
+                    
+        # 解析最终响应
+        parsed_data = parse_response(collected_content, with_check)
+        
+        if parsed_data is None:
+            yield {'type': 'error', 'content': '❌ 解析回答失败', 'data': None}
+            return
+        
+        # 返回最终结果
+        yield {'type': 'final', 'content': '✅ AI分析完成', 'data': parsed_data}
                         
     except Exception as e:
         yield {'type': 'error', 'content': f'❌ 发生错误: {str(e)}', 'data': None}
@@ -186,20 +140,16 @@ def talk(context: str, debug: bool = False) -> Dict[str, Any]:
             result['error'] = "Context cannot be empty"
             return result
             
-        # 初始化模型
-        model = init_chat_model(
-            model="deepseek-chat",
-            model_provider="deepseek",
-            temperature=0,
-            openai_api_key=os.environ.get('DEEPSEEK_API_KEY'),
-            base_url="https://api.deepseek.com/v1"
-        )
-        
         # 构造完整提示词
-        full_prompt = talk_system_prompt + "\n\n" + context
+        full_prompt = prompt_registry.render('talk', context)
+        
+        # 按阶段和输入长度选择模型
+        selected = model_router.route('talk', full_prompt)
+        model = structured_output.bind_json_mode(model_router.get_model(selected))
         
         # 调用模型
-        response = model.invoke(full_prompt)
+        response = resilience.call(lambda: model.invoke(full_prompt), stage='talk', provider=selected.limiter)
+        token_usage.record('talk', selected.model_name, response)
         
         if not response or not hasattr(response, 'content'):
             result['error'] = "Invalid response from AI model"
@@ -0,0 +1,168 @@
+"""Token 用量与费用统计，以及按会话的 token 预算
+
+每次模型调用后由各模块调用 record 记录输入/输出 token 和费用：
+- 在 track 作用域内（每轮对话一个）按阶段累计，随本轮提交写入 ChatQA 和 ChatSession
+- 同时按 模型/阶段 累计进程级总量，供 /metrics/tokens 查询
+
+会话累计用量超过预算的一定比例后，先压缩较早的对话历史，再改用经济模型，避免达到上限。
+"""
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Iterable, Optional
+
+# 模型单价（元 / 百万 tokens），按实际账单价格修改
+MODEL_PRICES = {
+    'deepseek-chat': dict(input=2.0, cached_input=0.5, output=8.0),
+    'deepseek-reasoner': dict(input=4.0, cached_input=1.0, output=16.0),
+    'qwen-turbo': dict(input=0.3, cached_input=0.12, output=0.6),
+    'qwen-long': dict(input=0.5, cached_input=0.2, output=2.0),
+}
+DEFAULT_PRICE = dict(input=2.0, cached_input=0.5, output=8.0)
+
+# 单个会话的 token 预算（输入 + 输出）
+#   tokens: 预算总量；compact_at: 超过该比例后压缩对话历史；economy_at: 超过该比例后改用经济模型
+SESSION_BUDGET = dict(tokens=600_000, compact_at=0.5, economy_at=0.8)
+
+# 预算紧张时各阶段改用的模型（需在 model_router.MODELS 中配置）；未配置的阶段按常规路由
+# talk_check 为开启 COMBINED_TALK_CHECK 时对话与史实校验合并的阶段，与 talk 使用相同的经济模型
+ECONOMY_MODELS: Dict[str, str] = {'check': 'qwen-turbo', 'talk': 'qwen-turbo', 'talk_check': 'qwen-turbo'}
+
+# 压缩历史时保留完整内容的最近轮数，以及更早轮次回答保留的字数
+COMPACT_KEEP_TURNS = 4
+COMPACT_ANSWER_CHARS = 120
+
+BUDGET_NORMAL = 'normal'
+BUDGET_COMPACT = 'compact'
+BUDGET_ECONOMY = 'economy'
+
+_turn_usage: ContextVar[Optional[Dict[str, Dict[str, Any]]]] = ContextVar('turn_token_usage', default=None)
+_budget_level: ContextVar[str] = ContextVar('token_budget_level', default=BUDGET_NORMAL)
+
+_totals_lock = threading.Lock()
+_totals: Dict[tuple, Dict[str, Any]] = {}
+
+
+def budget_level(session_tokens: int) -> str:
+    """根据会话已用 token 数判断预算等级"""
+    limit = SESSION_BUDGET['tokens']
+    if not limit:
+        return BUDGET_NORMAL
+    if session_tokens >= limit * SESSION_BUDGET['economy_at']:
+        return BUDGET_ECONOMY
+    if session_tokens >= limit * SESSION_BUDGET['compact_at']:
+        return BUDGET_COMPACT
+    return BUDGET_NORMAL
+
+
+def current_budget_level() -> str:
+    return _budget_level.get()
+
+
+def extract_usage(messages: Any) -> Dict[str, int]:
+    """从模型响应（单个消息或流式 chunk 列表）中提取 token 用量"""
+    if not isinstance(messages, (list, tuple)):
+        messages = [messages]
+    usage = {'prompt_tokens': 0, 'completion_tokens': 0, 'cached_tokens': 0}
+    for message in messages:
+        metadata = getattr(message, 'usage_metadata', None)
+        if metadata:
+            usage['prompt_tokens'] += metadata.get('input_tokens', 0) or 0
+            usage['completion_tokens'] += metadata.get('output_tokens', 0) or 0
+            usage['cached_tokens'] += (metadata.get('input_token_details') or {}).get('cache_read', 0) or 0
+            continue
+        token_usage = (getattr(message, 'response_metadata', None) or {}).get('token_usage')
+        if token_usage:
+            usage['prompt_tokens'] += token_usage.get('prompt_tokens', 0) or 0
+            usage['completion_tokens'] += token_usage.get('completion_tokens', 0) or 0
+            usage['cached_tokens'] += token_usage.get('prompt_cache_hit_tokens', 0) or 0
+    return usage
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+    """按单价估算费用（元）"""
+    price = MODEL_PRICES.get(model, DEFAULT_PRICE)
+    cached_tokens = min(cached_tokens, prompt_tokens)
+    return ((prompt_tokens - cached_tokens) * price['input'] + cached_tokens * price['cached_input']
+            + completion_tokens * price['output']) / 1_000_000
+
+
+def record(stage: str, model: str, messages: Any) -> Dict[str, Any]:
+    """记录一次模型调用的用量，返回本次用量"""
+    usage = extract_usage(messages)
+    usage['cost'] = estimate_cost(model, usage['prompt_tokens'], usage['completion_tokens'], usage['cached_tokens'])
+    usage['model'] = model
+
+    turn = _turn_usage.get()
+    if turn is not None:
+        entry = turn.setdefault(stage, {'model': model, 'calls': 0, 'prompt_tokens': 0,
+                                        'completion_tokens': 0, 'cached_tokens': 0, 'cost': 0.0})
+        entry['model'] = model
+        entry['calls'] += 1
+        for field in ('prompt_tokens', 'completion_tokens', 'cached_tokens', 'cost'):
+            entry[field] += usage[field]
+
+    with _totals_lock:
+        total = _totals.setdefault((model, stage), {'calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0,
+                                                    'cached_tokens': 0, 'cost': 0.0})
+        total['calls'] += 1
+        for field in ('prompt_tokens', 'completion_tokens', 'cached_tokens', 'cost'):
+            total[field] += usage[field]
+    return usage
+
+
+def merge(target: Dict[str, Dict[str, Any]], source: Dict[str, Dict[str, Any]]):
+    """将一组按阶段统计的用量累加到另一组"""
+    for stage, entry in source.items():
+        merged = target.setdefault(stage, {'model': entry['model'], 'calls': 0, 'prompt_tokens': 0,
+                                           'completion_tokens': 0, 'cached_tokens': 0, 'cost': 0.0})
+        for field in ('calls', 'prompt_tokens', 'completion_tokens', 'cached_tokens', 'cost'):
+            merged[field] += entry[field]
+
+
+def add_to_turn(usage: Dict[str, Dict[str, Any]]):
+    """将在本轮之外产生的用量（例如输入过程中的预取）计入当前轮次"""
+    turn = _turn_usage.get()
+    if turn is not None:
+        merge(turn, usage)
+
+
+@contextmanager
+def track(level: str = BUDGET_NORMAL):
+    """记录该作用域内（一轮对话）各阶段的用量，并设置本轮的预算等级，产出 {阶段: 用量} 字典"""
+    usage: Dict[str, Dict[str, Any]] = {}
+    usage_token = _turn_usage.set(usage)
+    level_token = _budget_level.set(level)
+    try:
+        yield usage
+    finally:
+        _budget_level.reset(level_token)
+        _turn_usage.reset(usage_token)
+
+
+def summarize(turn: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """汇总一轮的用量，用于写入 ChatQA"""
+    return {
+        'prompt_tokens': sum(entry['prompt_tokens'] for entry in turn.values()),
+        'completion_tokens': sum(entry['completion_tokens'] for entry in turn.values()),
+        'cost': round(sum(entry['cost'] for entry in turn.values()), 6),
+        'detail': {
+            stage: {**entry, 'cost': round(entry['cost'], 6)} for stage, entry in turn.items()
+        },
+    }
+
+
+def get_totals() -> Dict[str, Any]:
+    """进程启动以来按 模型/阶段 统计的用量"""
+    with _totals_lock:
+        items = [
+            {'model': model, 'stage': stage, **{**total, 'cost': round(total['cost'], 6)}}
+            for (model, stage), total in sorted(_totals.items())
+        ]
+    return {
+        'items': items,
+        'prompt_tokens': sum(item['prompt_tokens'] for item in items),
+        'completion_tokens': sum(item['completion_tokens'] for item in items),
+        'cost': round(sum(item['cost'] for item in items), 6),
+        'budget': SESSION_BUDGET,
+    }
@@ -0,0 +1,102 @@
+"""会话内的轮次串行化
+
+同一会话的两次提交如果并发执行，会读取到相同的历史、更新同一个问答并各自创建下一个问答。
+这里按会话加锁：同一会话的轮次依次执行，不同会话之间完全并行。
+
+锁的实现由 TURN_LOCK_BACKEND 选择：
+- local: 进程内的按会话锁，单进程部署时使用
+- mysql: 在进程内锁的基础上再获取 MySQL 的命名锁（GET_LOCK），多进程或多机部署时使用；
+         命名锁使用不经过连接池的独立连接（每轮新建一个），不占用读写历史和提交所用的连接池
+"""
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict
+
+TURN_LOCK_BACKEND = os.environ.get('TURN_LOCK_BACKEND', 'local')
+# 等待同一会话上一轮结束的最长时间（秒）
+TURN_LOCK_TIMEOUT = 180
+# MySQL 命名锁的名称前缀（名称最长 64 个字符）
+MYSQL_LOCK_PREFIX = 'reporter_turn:'
+
+
+class TurnLockTimeout(Exception):
+    """等待同一会话的上一轮超时"""
+
+
+class _LocalEntry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.users = 0
+
+
+class LocalTurnLock:
+    """进程内按会话的锁，没有轮次等待的会话不保留锁对象"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[int, _LocalEntry] = {}
+
+    @contextmanager
+    def hold(self, session_id: int, timeout: float = TURN_LOCK_TIMEOUT):
+        with self._lock:
+            entry = self._entries.setdefault(session_id, _LocalEntry())
+            entry.users += 1
+        try:
+            if not entry.lock.acquire(timeout=timeout):
+                raise TurnLockTimeout(f"会话 {session_id} 的上一轮在 {timeout}s 内未结束")
+            try:
+                yield
+            finally:
+                entry.lock.release()
+        finally:
+            with self._lock:
+                entry.users -= 1
+                if entry.users == 0:
+                    del self._entries[session_id]
+
+
+class MySQLTurnLock:
+    """进程内锁 + MySQL 命名锁，同一进程内的等待不占用数据库连接，持有锁的连接不来自连接池"""
+
+    def __init__(self):
+        self._local = LocalTurnLock()
+
+    @contextmanager
+    def hold(self, session_id: int, timeout: float = TURN_LOCK_TIMEOUT):
+        from sqlalchemy import text
+        from repository.database import db_manager
+
+        with self._local.hold(session_id, timeout):
+            name = f"{MYSQL_LOCK_PREFIX}{session_id}"
+            with db_manager.lock_engine.connect() as connection:
+                acquired = connection.execute(
+                    text("SELECT GET_LOCK(:name, :timeout)"), {"name": name, "timeout": int(timeout)}
+                ).scalar()
+                if acquired != 1:
+                    raise TurnLockTimeout(f"会话 {session_id} 的上一轮在 {timeout}s 内未结束（其他进程）")
+                try:
+                    yield
+                finally:
+                    try:
+                        connection.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": name})
+                    except Exception as e:
+                        # 连接断开时 MySQL 会自动释放命名锁
+                        print(f"释放会话锁失败（会话 {session_id}）: {e}")
+
+
+_BACKENDS = {
+    'local': LocalTurnLock,
+    'mysql': MySQLTurnLock,
+}
+
+if TURN_LOCK_BACKEND not in _BACKENDS:
+    print(f"未知的会话锁类型 {TURN_LOCK_BACKEND}，使用 local")
+    TURN_LOCK_BACKEND = 'local'
+
+turn_lock = _BACKENDS[TURN_LOCK_BACKEND]()
+
+
+def session_turn(session_id: int):
+    """同一会话的轮次串行执行；等待超时抛出 TurnLockTimeout"""
+    return turn_lock.hold(session_id)
@@ -0,0 +1,299 @@
+"""可续传的流式响应
+
+每轮对话（/start、/continue）在后台线程中执行，产出的事件写入该轮的重放缓冲区，
+HTTP 响应只是缓冲区的一个读者。客户端断开不影响本轮执行和提交。
+
+每个事件的 SSE id 为 "<turn_id>:<序号>"，序号从 1 开始递增。连接中断后客户端用最后收到的 id
+请求 GET /stream/<turn_id>（Last-Event-ID 请求头或 last_event_id 参数），从下一个事件继续接收。
+
+事件 data 是本轮截至当前的完整结果，后面的事件会重复前面的内容。客户端可以选择增量编码（encoding=delta）：
+data 只包含与上一个事件相比变化的字段（删除的字段列在 removed 中），客户端依次合并即可还原完整结果。
+
+缓冲区有大小上限：超出后较早的事件写入磁盘文件（配置了 REPLAY_SPILL_DIR 时），否则丢弃。
+本轮结束 REPLAY_TTL 秒后缓冲区被清理，之后只能通过 /dialogues 获取结果。
+
+每个进程同时执行的轮次不超过 MAX_CONCURRENT_TURNS，已满时拒绝新的轮次（TooManyTurns），
+避免客户端或代理反复重试时无限制地创建轮次和模型调用。
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+
+# 每轮在内存中保留的事件数和字节数上限
+REPLAY_MAX_EVENTS = 256
+REPLAY_MAX_BYTES = 512 * 1024
+# 超出内存上限的事件写入该目录；为空时直接丢弃
+REPLAY_SPILL_DIR = os.environ.get('REPLAY_SPILL_DIR') or None
+# 本轮结束后缓冲区保留的时间（秒）和最多保留的轮数
+REPLAY_TTL = 300
+REPLAY_MAX_TURNS = 1000
+# 每个进程同时执行的轮次上限
+MAX_CONCURRENT_TURNS = int(os.environ.get('MAX_CONCURRENT_TURNS', 16))
+# 等待新事件时发送心跳注释的间隔（秒），避免代理断开空闲连接
+HEARTBEAT_INTERVAL = 15
+
+HEARTBEAT = ": keep-alive\n\n"
+
+
+class TooManyTurns(Exception):
+    """同时执行的轮次已达上限"""
+
+
+def _encode(value: Any) -> str:
+    """事件内容直接输出 UTF-8 中文，不转义为 \\uXXXX"""
+    return json.dumps(value, ensure_ascii=False)
+
+
+def parse_event_id(value: Optional[str]) -> Tuple[Optional[str], int]:
+    """解析 "<turn_id>:<序号>" 或单独的序号，返回 (turn_id, 序号)；无法解析时序号为 0"""
+    if not value:
+        return None, 0
+    turn_id, _, seq = value.strip().rpartition(':')
+    try:
+        return turn_id or None, max(int(seq), 0)
+    except ValueError:
+        return None, 0
+
+
+class TurnStream:
+    """单轮对话的事件缓冲区"""
+
+    def __init__(self, turn_id: str, meta: Optional[Dict[str, Any]] = None):
+        self.turn_id = turn_id
+        self.meta = meta or {}
+        self.cond = threading.Condition()
+        self.finished = False
+        self.finished_at = None
+        self.created_at = time.time()
+        self._events: deque = deque()
+        self._memory_bytes = 0
+        self._next_seq = 1
+        # 写入磁盘的事件：序号 -> (偏移, 完整内容长度, 增量内容长度)；丢弃的事件序号上限
+        self._spill_path = None
+        self._spilled: Dict[int, Tuple[int, int, int]] = {}
+        self._dropped_through = 0
+        # 上一个事件 data 中各字段的编码结果，用于计算增量
+        self._last_data: Dict[str, str] = {}
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.turn_id}:{seq}"
+
+    def append(self, chunk: Dict[str, Any]):
+        full = _encode(chunk)
+        with self.cond:
+            delta = self._delta(chunk, full)
+            self._events.append((self._next_seq, full, delta))
+            self._memory_bytes += len(full) + (len(delta) if delta is not full else 0)
+            self._next_seq += 1
+            self._trim()
+            self.cond.notify_all()
+
+    def _delta(self, chunk: Dict[str, Any], full: str) -> str:
+        """增量编码：data 只保留与上一个事件相比变化的字段，删除的字段列在 removed 中（调用方持有锁）"""
+        data = chunk.get('data')
+        if not isinstance(data, dict):
+            return full
+        encoded = {key: _encode(value) for key, value in data.items()}
+        delta_chunk = {**chunk, 'data': {key: data[key] for key, value in encoded.items()
+                                         if self._last_data.get(key) != value}}
+        removed = [key for key in self._last_data if key not in encoded]
+        if removed:
+            delta_chunk['removed'] = removed
+        self._last_data = encoded
+        return _encode(delta_chunk)
+
+    def finish(self):
+        with self.cond:
+            self.finished = True
+            self.finished_at = time.time()
+            self.cond.notify_all()
+
+    def _trim(self):
+        """超出内存上限时移出最早的事件（至少保留最新一个，调用方持有锁）"""
+        while len(self._events) > 1 and (len(self._events) > REPLAY_MAX_EVENTS
+                                         or self._memory_bytes > REPLAY_MAX_BYTES):
+            seq, full, delta = self._events.popleft()
+            self._memory_bytes -= len(full) + (len(delta) if delta is not full else 0)
+            if not self._spill(seq, full, delta):
+                self._dropped_through = seq
+
+    def _spill(self, seq: int, full: str, delta: str) -> bool:
+        if not REPLAY_SPILL_DIR:
+            return False
+        try:
+            if self._spill_path is None:
+                os.makedirs(REPLAY_SPILL_DIR, exist_ok=True)
+                fd, self._spill_path = tempfile.mkstemp(prefix=f'turn-{self.turn_id}-', suffix='.jsonl',
+                                                        dir=REPLAY_SPILL_DIR)
+                os.close(fd)
+            full_data, delta_data = full.encode('utf-8'), delta.encode('utf-8')
+            with open(self._spill_path, 'ab') as f:
+                offset = f.tell()
+                f.write(full_data + delta_data)
+            self._spilled[seq] = (offset, len(full_data), len(delta_data))
+            return True
+        except OSError as e:
+            print(f"重放事件写入磁盘失败（{self.turn_id}）: {e}")
+            return False
+
+    def _read_spilled(self, seqs: List[int], delta: bool) -> List[Tuple[int, str]]:
+        events = []
+        with open(self._spill_path, 'rb') as f:
+            for seq in seqs:
+                offset, full_length, delta_length = self._spilled[seq]
+                if delta:
+                    f.seek(offset + full_length)
+                    events.append((seq, f.read(delta_length).decode('utf-8')))
+                else:
+                    f.seek(offset)
+                    events.append((seq, f.read(full_length).decode('utf-8')))
+        return events
+
+    def read_after(self, after_seq: int, delta: bool = False) -> Tuple[List[Tuple[int, str]], bool]:
+        """
+        读取序号大于 after_seq 的已有事件
+        :param delta: 返回增量编码的事件
+        :return: (事件列表, 是否有事件已被丢弃而无法重放)
+        """
+        with self.cond:
+            gap = after_seq < self._dropped_through
+            spilled = sorted(seq for seq in self._spilled if seq > after_seq)
+            memory = [(seq, delta_payload if delta else full) for seq, full, delta_payload in self._events
+                      if seq > after_seq]
+        events = []
+        if spilled:
+            try:
+                events = self._read_spilled(spilled, delta)
+            except OSError:
+                gap = True
+        return events + memory, gap
+
+    def follow(self, after_seq: int = 0, delta: bool = False) -> Iterator[str]:
+        """
+        从 after_seq 之后开始产出 SSE 文本，直到本轮结束
+        :param delta: 增量编码，客户端需要将每个事件的 data 合并到之前收到的结果上
+        """
+        _, gap = self.read_after(after_seq)
+        if gap:
+            # 部分事件已无法重放，提示客户端以 /dialogues 的结果为准
+            yield self._format(0, _encode({
+                'type': 'replay_gap',
+                'content': '部分事件已过期，请通过 /dialogues 获取完整结果',
+                'data': {'after': after_seq},
+            }))
+        # 增量编码时，中间有事件丢失后的第一个事件发送完整内容
+        send_full = gap
+        while True:
+            events, _ = self.read_after(after_seq, delta and not send_full)
+            if send_full and events:
+                events, send_full = events[:1], False
+            for seq, payload in events:
+                yield self._format(seq, payload)
+                after_seq = seq
+            if events:
+                continue
+            with self.cond:
+                if self._next_seq - 1 > after_seq:
+                    continue
+                if self.finished:
+                    return
+                self.cond.wait(HEARTBEAT_INTERVAL)
+                if self._next_seq - 1 > after_seq or self.finished:
+                    continue
+            yield HEARTBEAT
+
+    def _format(self, seq: int, payload: str) -> str:
+        if seq:
+            return f"id: {self.event_id(seq)}\ndata: {payload}\n\n"
+        return f"data: {payload}\n\n"
+
+    def close(self):
+        """删除磁盘上的重放文件"""
+        if self._spill_path:
+            try:
+                os.remove(self._spill_path)
+            except OSError:
+                pass
+            self._spill_path = None
+
+
+class ExpiredTurn:
+    """重放缓冲区已被清理的轮次：只产出一个 replay_gap 事件，提示客户端以 /dialogues 的结果为准"""
+
+    def __init__(self, turn_id: str):
+        self.turn_id = turn_id
+
+    def follow(self, after_seq: int = 0, delta: bool = False) -> Iterator[str]:
+        payload = _encode({
+            'type': 'replay_gap',
+            'content': '本轮已结束且事件已过期，请通过 /dialogues 获取结果',
+            'data': {'after': after_seq},
+        })
+        yield f"data: {payload}\n\n"
+
+
+def new_turn_id() -> str:
+    return uuid.uuid4().hex
+
+
+class TurnStreamRegistry:
+    """按 turn_id 管理进行中和最近结束的轮次"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._streams: Dict[str, TurnStream] = {}
+        self._slots = threading.BoundedSemaphore(MAX_CONCURRENT_TURNS)
+        self._executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_TURNS, thread_name_prefix='turn')
+
+    def start(self, chunks: Iterable[Dict[str, Any]], meta: Optional[Dict[str, Any]] = None,
+              turn_id: Optional[str] = None) -> TurnStream:
+        """
+        在后台线程池中执行一轮对话，返回其事件缓冲区
+        :param turn_id: 预先分配的轮次ID（幂等记录需要在启动前写入），默认新生成
+        :raises TooManyTurns: 同时执行的轮次已达 MAX_CONCURRENT_TURNS
+        """
+        if not self._slots.acquire(blocking=False):
+            raise TooManyTurns(f"Too many turns in progress ({MAX_CONCURRENT_TURNS}), retry later")
+        stream = TurnStream(turn_id or new_turn_id(), meta)
+        with self._lock:
+            self._evict()
+            self._streams[stream.turn_id] = stream
+        self._executor.submit(self._run, stream, chunks)
+        return stream
+
+    def _run(self, stream: TurnStream, chunks: Iterable[Dict[str, Any]]):
+        try:
+            for chunk in chunks:
+                stream.append(chunk)
+        except Exception as e:
+            print(f"对话轮次执行失败（{stream.turn_id}）: {e}")
+            stream.append({'type': 'error', 'content': f'处理请求时发生错误: {e}', 'data': {}})
+        finally:
+            stream.finish()
+            self._slots.release()
+
+    def get(self, turn_id: str) -> Optional[TurnStream]:
+        with self._lock:
+            self._evict()
+            return self._streams.get(turn_id)
+
+    def _evict(self):
+        """清理过期的已结束轮次，超出数量上限时移除最早结束的（调用方持有锁）"""
+        now = time.time()
+        expired = [turn_id for turn_id, s in self._streams.items()
+                   if s.finished and now - s.finished_at > REPLAY_TTL]
+        finished = sorted((s.finished_at, turn_id) for turn_id, s in self._streams.items()
+                          if s.finished and turn_id not in expired)
+        overflow = len(self._streams) - len(expired) - REPLAY_MAX_TURNS + 1
+        expired += [turn_id for _, turn_id in finished[:max(overflow, 0)]]
+        for turn_id in expired:
+            self._streams.pop(turn_id).close()
+
+
+registry = TurnStreamRegistry()